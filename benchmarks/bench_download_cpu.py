@@ -0,0 +1,53 @@
+# bench_download_cpu.py
+#
+# Compares per-image CPU time of download_image against the original
+# 1 KiB-chunk implementation. Run from the repo root:
+#   python benchmarks/bench_download_cpu.py
+
+import os
+import sys
+import time
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import wallpaper_utils
+from stub_server import StubImageServer
+
+ROUNDS = 10
+IMAGE_BYTES = 8 * 1024 * 1024  # Roughly a 4K JPEG
+
+
+def legacy_download(url, out_path):
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    with open(out_path, "wb") as f:
+        for chunk in response.iter_content(1024):
+            f.write(chunk)
+
+
+def measure(label, download):
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for i in range(ROUNDS):
+        download(i)
+    cpu = (time.process_time() - cpu_start) / ROUNDS * 1000
+    wall = (time.perf_counter() - wall_start) / ROUNDS * 1000
+    print(f"{label:<10} {cpu:8.1f} ms CPU/image {wall:8.1f} ms wall/image")
+
+
+def main():
+    out_dir = tempfile.mkdtemp()
+    with StubImageServer(image_bytes=IMAGE_BYTES) as server:
+        measure("legacy", lambda i: legacy_download(
+            server.url("cpu", seed=i), os.path.join(out_dir, "legacy.jpg")))
+        # Distinct seeds so every round misses the image cache
+        measure("streaming", lambda i: wallpaper_utils.download_image(
+            server.url("cpu", seed=ROUNDS + i), os.path.join(out_dir, "streaming.jpg")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# bench_downloads.py
+#
+# Measures download throughput and connection reuse against the local stub
+# server. Run from the repo root:  python benchmarks/bench_downloads.py
+
+import os
+import sys
+import time
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from stub_server import StubImageServer
+
+BATCH = 8
+LATENCY = 0.5
+IMAGE_BYTES = 2 * 1024 * 1024
+
+
+def main():
+    with StubImageServer(latency=LATENCY, image_bytes=IMAGE_BYTES) as server:
+        urls = [server.url("benchmark", seed=i) for i in range(BATCH * 2)]
+
+        start = time.perf_counter()
+        for i, url in enumerate(urls[:BATCH]):
+            wallpaper_utils.download_image(url, f"seq_{i}.jpg")
+        sequential = time.perf_counter() - start
+        seq_connections = server.connections
+
+        start = time.perf_counter()
+        results = wallpaper_utils.download_images(urls[BATCH:], [f"batch_{i}.jpg" for i in range(BATCH)])
+        batch = time.perf_counter() - start
+        errors = [r for r in results if isinstance(r, Exception)]
+
+        total_mb = BATCH * IMAGE_BYTES / (1024 * 1024)
+        print(f"sequential: {BATCH} images in {sequential:.2f} s "
+              f"({total_mb / sequential:.1f} MB/s), {seq_connections} connection(s)")
+        print(f"batch:      {BATCH} images in {batch:.2f} s "
+              f"({total_mb / batch:.1f} MB/s), {server.connections - seq_connections} new connection(s), "
+              f"{len(errors)} error(s)")
+
+
+if __name__ == "__main__":
+    main()
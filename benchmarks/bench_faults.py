@@ -0,0 +1,60 @@
+# bench_faults.py
+#
+# Failure-path behaviour of the download retry policy against the stub
+# server with injected faults: success rate, latency, retries, requests sent
+# and circuit-breaker activity per scenario. Backoff and timeouts are scaled
+# down so the run takes about a minute.
+# Run from the repo root:  python benchmarks/bench_faults.py
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from wallpaper_retry import CircuitBreaker, RetryPolicy
+from stub_server import StubImageServer
+
+DOWNLOADS = 20
+SCENARIOS = {
+    "healthy": {},
+    "20% 503": {"error_rate": 0.2},
+    "20% dropped": {"drop_rate": 0.2},
+    "10% hang": {"hang_rate": 0.1},
+    "service down": {"down": True},
+}
+
+
+def main():
+    wallpaper_utils.get_http_session()
+    print(f"{'scenario':<14} {'ok':>4} {'p50 s':>7} {'p95 s':>7} {'retries':>8} {'requests':>9} "
+          f"{'opened':>7} {'rejected':>9}")
+    for label, faults in SCENARIOS.items():
+        down = faults.pop("down", False)
+        with StubImageServer(latency=0.2, image_bytes=512 * 1024, hang_seconds=3, seed=1, **faults) as server:
+            server.down = down
+            policy = RetryPolicy(attempts=3, base_delay=0.2, max_delay=1.0, connect_timeout=1.0,
+                                 read_timeout=1.0, breaker=CircuitBreaker(failure_threshold=5, reset_seconds=60))
+            wallpaper_utils._retry_policy = policy
+            latencies, ok = [], 0
+            for i in range(DOWNLOADS):
+                start = time.perf_counter()
+                try:
+                    wallpaper_utils.download_image(server.url(label, seed=i + 1), "fault.jpg")
+                    ok += 1
+                except Exception:
+                    pass
+                latencies.append(time.perf_counter() - start)
+            stats = policy.stats()
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f"{label:<14} {ok:>4} {statistics.median(latencies):>7.2f} {p95:>7.2f} {stats['retries']:>8} "
+                  f"{server.requests:>9} {stats['breaker_opened']:>7} {stats['breaker_rejected']:>9}")
+
+
+if __name__ == "__main__":
+    main()
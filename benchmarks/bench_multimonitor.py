@@ -0,0 +1,53 @@
+# bench_multimonitor.py
+#
+# Wall-clock time to generate and apply a wallpaper for 1..N monitors through
+# the file-sink backend and the stub server. With per-display generations run
+# concurrently, N monitors should take about as long as one.
+# Run from the repo root:  python benchmarks/bench_multimonitor.py
+
+import os
+import sys
+import time
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from stub_server import StubImageServer
+
+LAYOUTS = {
+    "1 x 1080p": ["1920x1080+0+0"],
+    "2 x 1080p": ["1920x1080+0+0", "1920x1080+1920+0"],
+    "1440p + portrait": ["2560x1440+0+0", "1080x1920+2560+-240"],
+    "3 x 1080p": ["1920x1080+0+0", "1920x1080+1920+0", "1920x1080+-1920+0"],
+}
+MODES = ["per_monitor", "span"]
+ROUNDS = 3
+
+
+def main():
+    with StubImageServer(latency=1.0, latency_per_mpx=0.5, noise=True) as server:
+        # Send generations to the stub server instead of the live service
+        wallpaper_utils.url_builder = lambda prompt, width, height, seed: server.url(prompt, width, height, seed)
+        catalog = wallpaper_utils.load_prompts()
+        print(f"{'layout':<18} {'mode':<12} {'seconds':>8} {'requests':>9}")
+        for label, specs in LAYOUTS.items():
+            for mode in MODES:
+                backend = FileSinkBackend(tempfile.mkdtemp(), specs)
+                wallpaper_utils._backend = backend
+                settings = {"multi_monitor": mode, "generation_scale": 1.0}
+                image_path = wallpaper_utils.get_resource_path(wallpaper_utils.wallpaper_filename(settings), user_data=True)
+                requests_before = server.requests
+                start = time.perf_counter()
+                for _ in range(ROUNDS):
+                    wallpaper_utils.generate_wallpaper(settings, catalog)
+                    wallpaper_utils.apply_wallpaper(image_path, settings)
+                seconds = (time.perf_counter() - start) / ROUNDS
+                print(f"{label:<18} {mode:<12} {seconds:>8.2f} {(server.requests - requests_before) // ROUNDS:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# bench_pipeline.py
+#
+# End-to-end benchmark of one wallpaper refresh, stage by stage:
+# build_prompt -> url_builder -> download_image -> postprocess_image ->
+# apply_wallpaper, against the stub server started as a subprocess (so its
+# CPU and memory aren't counted) and the headless file-sink backend.
+#
+# Reports per stage p50/p95/mean wall time, CPU time, peak RSS and, for the
+# download, bytes/s. Results are written as JSON so runs can be compared
+# over time. Post-processing runs in-process by default so its CPU and
+# memory show up here; --postprocess-workers 1 measures the app's setup.
+# Run from the repo root:
+#   python benchmarks/bench_pipeline.py --rounds 20 --latency 2 --output pipeline.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from wallpaper_postprocess import PostProcessor
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: peak RSS is not reported
+
+STAGES = ["prompt", "url", "download", "postprocess", "apply"]
+
+
+def reset_peak_rss():
+    """Restarts the peak-RSS high-water mark, where the OS allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start_stub_server(args):
+    command = [sys.executable, os.path.join(REPO_DIR, "benchmarks", "stub_server.py"),
+               "--latency", str(args.latency), "--latency-per-mpx", str(args.latency_per_mpx),
+               "--image-bytes", str(args.image_bytes), "--bytes-per-second", str(args.bytes_per_second),
+               "--error-rate", str(args.error_rate), "--drop-rate", str(args.drop_rate)]
+    if args.noise:
+        command.append("--noise")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def summarize(samples):
+    wall = [s["wall"] for s in samples]
+    summary = {
+        "p50_ms": round(percentile(wall, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(wall, 0.95) * 1000, 2),
+        "mean_ms": round(statistics.fmean(wall) * 1000, 2),
+        "cpu_ms": round(statistics.fmean(s["cpu"] for s in samples) * 1000, 2),
+    }
+    peaks = [s["peak_rss"] for s in samples if s["peak_rss"] is not None]
+    summary["peak_rss_mb"] = round(max(peaks) / 2 ** 20, 1) if peaks else None
+    if all("bytes" in s for s in samples):
+        summary["bytes"] = round(statistics.fmean(s["bytes"] for s in samples))
+        summary["bytes_per_second"] = round(sum(s["bytes"] for s in samples) / max(sum(wall), 1e-9))
+    return summary
+
+
+def run_round(settings, catalog, width, height, image_path, samples):
+    """One refresh, split into the same steps as generate_wallpaper."""
+    def stage(name, func):
+        reset_peak_rss()
+        cpu, start = time.process_time(), time.perf_counter()
+        result = func()
+        sample = {"wall": time.perf_counter() - start, "cpu": time.process_time() - cpu,
+                  "peak_rss": peak_rss_bytes()}
+        if name == "download":
+            sample["bytes"] = os.path.getsize(result)
+        samples[name].append(sample)
+        return result
+
+    prompt = stage("prompt", lambda: wallpaper_utils.build_prompt(settings, catalog))
+    url = stage("url", lambda: wallpaper_utils.url_builder(prompt, width, height,
+                                                           wallpaper_utils.seed_for(settings, prompt)))
+    raw_path = stage("download", lambda: wallpaper_utils.download_image(url, "pipeline.download.jpg"))
+    stage("postprocess", lambda: wallpaper_utils.postprocess_image(raw_path, image_path, settings, width, height))
+    stage("apply", lambda: wallpaper_utils.apply_wallpaper(image_path, settings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage benchmark of one wallpaper refresh")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2, help="rounds run before measuring")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--format", default="bmp", help="postprocess_format setting")
+    parser.add_argument("--postprocess-workers", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub generation time, seconds")
+    parser.add_argument("--latency-per-mpx", type=float, default=0.0)
+    parser.add_argument("--image-bytes", type=int, default=0, help="pad responses to this size")
+    parser.add_argument("--bytes-per-second", type=float, default=0, help="stub transfer rate cap")
+    parser.add_argument("--noise", action="store_true", help="realistically sized (noisy) JPEGs")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    process, base_url = start_stub_server(args)
+    try:
+        os.environ["AI_WALLPAPER_IMAGE_SERVICE"] = base_url
+        wallpaper_utils._backend = FileSinkBackend(tempfile.mkdtemp(), [f"{args.width}x{args.height}+0+0"])
+        wallpaper_utils._post_processor = PostProcessor(max_workers=args.postprocess_workers)
+        settings = {"multi_monitor": "off", "generation_scale": 1.0, "postprocess_format": args.format}
+        image_path = wallpaper_utils.get_resource_path(wallpaper_utils.wallpaper_filename(settings), user_data=True)
+        catalog = wallpaper_utils.load_prompts()
+
+        samples = {name: [] for name in STAGES}
+        totals, errors = [], 0
+        for i in range(args.warmup + args.rounds):
+            if i == args.warmup:
+                samples = {name: [] for name in STAGES}
+            start = time.perf_counter()
+            try:
+                run_round(settings, catalog, args.width, args.height, image_path, samples)
+            except Exception as e:
+                errors += i >= args.warmup
+                print(f"round {i}: {e}", file=sys.stderr)
+                continue
+            if i >= args.warmup:
+                totals.append(time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                 capture_output=True, text=True).stdout.strip() or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "rounds_ok": len(totals),
+        "errors": errors,
+        "stages": {name: summarize(samples[name]) for name in STAGES if samples[name]},
+    }
+    if totals:
+        report["total"] = {"p50_ms": round(percentile(totals, 0.5) * 1000, 2),
+                           "p95_ms": round(percentile(totals, 0.95) * 1000, 2)}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    # A compact table for people, on stderr so stdout stays valid JSON
+    print(f"{'stage':<12} {'p50 ms':>9} {'p95 ms':>9} {'cpu ms':>8} {'peak MB':>8}", file=sys.stderr)
+    for name, stats in report["stages"].items():
+        print(f"{name:<12} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['cpu_ms']:>8.1f} "
+              f"{stats['peak_rss_mb'] or 0:>8.1f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
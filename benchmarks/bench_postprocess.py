@@ -0,0 +1,53 @@
+# bench_postprocess.py
+#
+# Decode/resize/encode timings of fit_to_screen per target resolution.
+# The source is a detailed JPEG at a size the generator typically returns,
+# with an aspect ratio that differs from the screen so cropping is exercised.
+# Run from the repo root:  python benchmarks/bench_postprocess.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from wallpaper_postprocess import fit_to_screen
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4K": (3840, 2160),
+    "ultrawide": (3440, 1440),
+}
+FORMATS = ["bmp", "png", "jpeg"]
+ROUNDS = 3
+
+
+def make_source(path, width, height):
+    # Noise keeps the JPEG realistically hard to decode
+    Image.effect_noise((width, height), 64).convert("RGB").save(path, "JPEG", quality=90)
+
+
+def main():
+    work_dir = tempfile.mkdtemp()
+    stages = ["decode_ms", "color_ms", "resize_ms", "sharpen_ms", "encode_ms"]
+    print(f"{'target':<10} {'format':<6} " + " ".join(f"{s[:-3]:>9}" for s in stages) + f" {'total':>9}")
+    for label, (width, height) in RESOLUTIONS.items():
+        src = os.path.join(work_dir, f"src_{label}.jpg")
+        # Generators tend to return a slightly different size than requested
+        make_source(src, int(width * 1.05), int(height * 1.1))
+        for output_format in FORMATS:
+            dest = os.path.join(work_dir, f"out_{label}.{output_format}")
+            totals = dict.fromkeys(stages, 0.0)
+            for _ in range(ROUNDS):
+                timings = fit_to_screen(src, dest, width, height, sharpen=True, output_format=output_format)
+                for stage in stages:
+                    totals[stage] += timings[stage] / ROUNDS
+            print(f"{label:<10} {output_format:<6} " + " ".join(f"{totals[s]:9.1f}" for s in stages)
+                  + f" {sum(totals.values()):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_preview.py
+#
+# Perceived latency of a manual refresh with and without the progressive
+# preview: time until the desktop first changes and until the full image is
+# applied. The stub server's generation time grows with the pixel count, as
+# the real service's does, so the small preview arrives well before the
+# full-size image.
+# Run from the repo root:  python benchmarks/bench_preview.py
+
+import os
+import sys
+import time
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from wallpaper_metrics import describe_refresh
+from stub_server import StubImageServer
+
+ROUNDS = 3
+
+
+class TimedSink(FileSinkBackend):
+    """File sink that remembers when each wallpaper was applied."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.applied_at = []
+
+    def set_wallpaper(self, image_path):
+        super().set_wallpaper(image_path)
+        self.applied_at.append(time.perf_counter())
+
+
+def main():
+    with StubImageServer(latency=1.0, latency_per_mpx=4.0, noise=True) as server:
+        os.environ["AI_WALLPAPER_IMAGE_SERVICE"] = server.base_url
+        backend = wallpaper_utils._backend = TimedSink(tempfile.mkdtemp(), ["1920x1080+0+0"])
+        engine = wallpaper_utils.WallpaperEngine()
+        print(f"{'mode':<10} {'first change s':>15} {'full image s':>13} {'requests':>9}")
+        for preview in (False, True):
+            first, full = [], []
+            requests_before = server.requests
+            for _ in range(ROUNDS):
+                backend.applied_at = []
+                start = time.perf_counter()
+                engine.refresh({"multi_monitor": "off"}, preview=preview)
+                first.append(backend.applied_at[0] - start)
+                full.append(backend.applied_at[-1] - start)
+            label = "preview" if preview else "plain"
+            print(f"{label:<10} {sum(first) / ROUNDS:>15.2f} {sum(full) / ROUNDS:>13.2f} "
+                  f"{(server.requests - requests_before) // ROUNDS:>9}")
+        print(describe_refresh(wallpaper_utils.get_metrics().last("refresh")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench_prompts.py
+#
+# Load time, memory and draw cost of the prompt catalog and the no-repeat
+# sampler against parsing prompts.json into a dict of lists, for the bundled file and for a synthetic
+# imported catalog of 100k+ prompts.
+# Run from the repo root:  python benchmarks/bench_prompts.py
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wallpaper_prompts import PromptCatalog, PromptSampler
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DRAWS = 100_000
+
+
+def synthetic_catalog(path, categories=40, per_category=3000):
+    rng = random.Random(1)
+    words = "misty neon aurora canyon forest temple ocean dune glacier city ruins nebula garden".split()
+    data = {f"Category {c}": [" ".join(rng.choices(words, k=12)) + f" #{i}" for i in range(per_category)]
+            for c in range(categories)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds * 1000, peak / 1024
+
+
+def bench(label, json_path):
+    cache_path = os.path.join(tempfile.mkdtemp(), "prompts.cache")
+
+    def parse_dict():
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    data, dict_ms, dict_kb = measure(parse_dict)
+    _, cold_ms, cold_kb = measure(lambda: PromptCatalog.load(json_path, cache_path))
+    catalog, warm_ms, warm_kb = measure(lambda: PromptCatalog.load(json_path, cache_path))
+
+    start = time.perf_counter()
+    for _ in range(DRAWS):
+        # What build_prompt did before: rebuild the key list on every draw
+        random.choice(data[random.choice(list(data.keys()))])
+    dict_draw_us = (time.perf_counter() - start) / DRAWS * 1e6
+    start = time.perf_counter()
+    for _ in range(DRAWS):
+        catalog.random_prompt()
+    catalog_draw_us = (time.perf_counter() - start) / DRAWS * 1e6
+    sampler = PromptSampler(os.path.join(os.path.dirname(cache_path), "rotation.json"))
+    start = time.perf_counter()
+    for _ in range(DRAWS):
+        sampler.draw(catalog)
+    sampler_draw_us = (time.perf_counter() - start) / DRAWS * 1e6
+    # The rotation state is written by a timer every few seconds, not per draw: time one write
+    start = time.perf_counter()
+    sampler._save()
+    sampler_save_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{label}: {len(catalog)} prompts in {len(catalog.categories)} categories, "
+          f"{os.path.getsize(json_path) / 1024:.0f} KB json, {os.path.getsize(cache_path) / 1024:.0f} KB cache")
+    print(f"  json.load dict   {dict_ms:8.1f} ms  {dict_kb:8.0f} KB peak  {dict_draw_us:5.2f} us/draw")
+    print(f"  catalog (build)  {cold_ms:8.1f} ms  {cold_kb:8.0f} KB peak")
+    print(f"  catalog (cache)  {warm_ms:8.1f} ms  {warm_kb:8.0f} KB peak  {catalog_draw_us:5.2f} us/draw")
+    print(f"  no-repeat sampler {sampler_draw_us:8.1f} us/draw, {sampler_save_ms:.1f} ms per state write")
+
+
+def main():
+    bench("bundled prompts.json", os.path.join(REPO, "prompts.json"))
+    path = os.path.join(tempfile.mkdtemp(), "prompts.json")
+    synthetic_catalog(path)
+    bench("synthetic import", path)
+
+
+if __name__ == "__main__":
+    main()
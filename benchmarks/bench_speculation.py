@@ -0,0 +1,66 @@
+# bench_speculation.py
+#
+# Click-to-wallpaper latency with and without speculative generation, for
+# simulated GUI sessions: the user changes the category a few times, pausing
+# between changes, then clicks Generate some time after the last change.
+# Also prints the speculation counters: hit rate and wasted bytes.
+# Run from the repo root:  python benchmarks/bench_speculation.py
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from stub_server import StubImageServer
+
+SESSIONS = 6
+GENERATION_SECONDS = 3.0
+# Seconds between two edits, and from the last edit to the click
+EDIT_PAUSES = (0.3, 0.5, 2.0)
+CLICK_DELAYS = (0.5, 2.0, 5.0)
+
+
+def run_session(engine, rng, speculate):
+    categories = [c for c in engine.categories() if engine.catalog.category_range(c)]
+    choice = None
+    for _ in range(rng.randint(1, 3)):
+        choice = {"selected_category": rng.choice(categories), "last_prompt": ""}
+        if speculate:
+            engine.speculate(choice)
+        time.sleep(rng.choice(EDIT_PAUSES))
+    time.sleep(rng.choice(CLICK_DELAYS))
+    # The GUI saves the choices, then asks for a refresh
+    engine.store.update(choice)
+    start = time.perf_counter()
+    engine.generate_now("")
+    return time.perf_counter() - start
+
+
+def main():
+    with StubImageServer(latency=GENERATION_SECONDS, noise=True) as server:
+        os.environ["AI_WALLPAPER_IMAGE_SERVICE"] = server.base_url
+        wallpaper_utils._backend = FileSinkBackend(tempfile.mkdtemp(), ["1920x1080+0+0"])
+        engine = wallpaper_utils.WallpaperEngine()
+        engine.store.update({"progressive_preview": False, "multi_monitor": "off"})
+        print(f"{'mode':<12} {'mean click->applied s':>22} {'requests':>9}")
+        for speculate in (False, True):
+            rng = random.Random(7)
+            requests_before = server.requests
+            latencies = [run_session(engine, rng, speculate) for _ in range(SESSIONS)]
+            label = "speculative" if speculate else "on click"
+            print(f"{label:<12} {sum(latencies) / SESSIONS:>22.2f} {server.requests - requests_before:>9}")
+        stats = engine.metrics()["speculation"]
+        print(f"speculation: {stats['started']} started, {stats['hits']} hits, {stats['wasted']} wasted, "
+              f"hit rate {stats['hit_rate']}, {stats['used_bytes'] / 2 ** 20:.1f} MiB used, "
+              f"{stats['wasted_bytes'] / 2 ** 20:.1f} MiB wasted")
+
+
+if __name__ == "__main__":
+    main()
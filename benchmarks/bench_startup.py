@@ -0,0 +1,99 @@
+# bench_startup.py
+#
+# Cold-start report for the tray entry point: a `python -X importtime`
+# breakdown of importing wallpaper_utils, and the wall-clock time from
+# interpreter start until the tray icon is up. Exits non-zero if either
+# exceeds its budget or if the network/image stack got imported eagerly.
+# Run from the repo root:  python benchmarks/bench_startup.py
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = 150
+ICON_READY_BUDGET_MS = 600
+TOP_N = 15
+
+# Must not be loaded before the first generation
+LAZY_MODULES = ["requests", "urllib3", "PIL.Image", "concurrent.futures.thread"]
+
+ICON_READY_DRIVER = """
+import sys, time, json
+start = time.perf_counter()
+import wallpaper_utils
+imported = time.perf_counter()
+icon_error = None
+try:
+    wallpaper_utils.start_tray_icon(lambda: None, lambda: None)
+except Exception as e:
+    # No tray backend (e.g. a headless CI machine)
+    icon_error = str(e)
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "icon_ready_ms": (ready - start) * 1000,
+    "icon_error": icon_error,
+    "eager_modules": [m for m in %r if m in sys.modules and m not in %r],
+}))
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable] + args, cwd=REPO_DIR, env=env,
+                          capture_output=True, text=True)
+
+
+def import_time_report(env):
+    """Returns (cumulative_us, self_us, module) rows from -X importtime."""
+    result = run_python(["-X", "importtime", "-c", "import wallpaper_utils"], env)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return rows
+
+
+def main():
+    env = dict(os.environ)
+    # Keep the benchmark out of the real appdata dir
+    env["APPDATA"] = env["HOME"] = tempfile.mkdtemp()
+
+    rows = import_time_report(env)
+    total_ms = max((cumulative for cumulative, _, name in rows if name == "wallpaper_utils"), default=0) / 1000
+    print(f"import wallpaper_utils: {total_ms:.1f} ms (budget {IMPORT_BUDGET_MS} ms)")
+    print(f"top {TOP_N} imports by cumulative time:")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:TOP_N]:
+        print(f"  {cumulative / 1000:8.1f} ms  {self_us / 1000:8.1f} ms self  {name}")
+
+    # Modules pystray itself needs for the icon don't count as eager
+    icon_deps = ["PIL.Image"]
+    driver = ICON_READY_DRIVER % (LAZY_MODULES, icon_deps)
+    result = run_python(["-c", driver], env)
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(1)
+    icon = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"icon ready: {icon['icon_ready_ms']:.1f} ms (budget {ICON_READY_BUDGET_MS} ms)")
+    if icon["icon_error"]:
+        print(f"  no tray backend, measured up to the failed icon start: {icon['icon_error']}")
+
+    failures = []
+    if total_ms > IMPORT_BUDGET_MS:
+        failures.append("import budget exceeded")
+    if icon["icon_ready_ms"] > ICON_READY_BUDGET_MS:
+        failures.append("icon-ready budget exceeded")
+    if icon["eager_modules"]:
+        failures.append(f"imported eagerly: {', '.join(icon['eager_modules'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench_upscale.py
+#
+# Latency/quality tradeoff of generation_scale: bytes downloaded, time to
+# fetch the image and CPU time of the local upscale, per scale and sharpening
+# mode, for a 4K screen. Uses the stub server (generation time proportional to
+# pixel count) unless --live is given, which asks image.pollinations.ai.
+# Run from the repo root:  python benchmarks/bench_upscale.py [--live]
+
+import os
+import sys
+import time
+import tempfile
+
+# Keep benchmark downloads out of the real appdata dir
+os.environ["APPDATA"] = os.environ["HOME"] = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wallpaper_utils
+from wallpaper_postprocess import fit_to_screen
+from stub_server import StubImageServer
+
+SCREEN = (3840, 2160)
+SCALES = [1.0, 0.75, 0.5, 0.375]
+SHARPEN_MODES = [False, True, "edge"]
+PROMPT = "Serene alpine lake reflecting starry skies"
+
+
+def fetch(url, filename):
+    start = time.perf_counter()
+    path = wallpaper_utils.download_image(url, filename)
+    return path, time.perf_counter() - start, os.path.getsize(path)
+
+
+def main():
+    live = "--live" in sys.argv
+    server = None if live else StubImageServer(latency=0.5, latency_per_mpx=1.5, noise=True).start()
+    work_dir = tempfile.mkdtemp()
+    print(f"screen {SCREEN[0]}x{SCREEN[1]}, {'live service' if live else 'stub server'}")
+    print(f"{'scale':>6} {'request':>11} {'bytes':>10} {'fetch s':>8}   " +
+          "  ".join(f"{'cpu ms (' + str(mode) + ')':>16}" for mode in SHARPEN_MODES))
+    for scale in SCALES:
+        width, height = wallpaper_utils.generation_size({"generation_scale": scale}, *SCREEN)
+        if live:
+            url = wallpaper_utils.url_builder(PROMPT, width, height)
+        else:
+            url = server.url(PROMPT, width, height, seed=int(scale * 1000))
+        raw_path, fetch_seconds, size = fetch(url, f"upscale_{scale}.jpg")
+        cpu = []
+        for mode in SHARPEN_MODES:
+            start = time.process_time()
+            fit_to_screen(raw_path, os.path.join(work_dir, "out.bmp"), *SCREEN, sharpen=mode)
+            cpu.append((time.process_time() - start) * 1000)
+        print(f"{scale:>6} {width:>5}x{height:<5} {size:>10} {fetch_seconds:>8.2f}   " +
+              "  ".join(f"{c:>16.1f}" for c in cpu))
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
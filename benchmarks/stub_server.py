@@ -0,0 +1,207 @@
+# stub_server.py
+#
+# Local stand-in for image.pollinations.ai, used by the benchmarks so the
+# download path can be measured offline. Also runs standalone, e.g. to point
+# the app at it with AI_WALLPAPER_IMAGE_SERVICE:
+#   python benchmarks/stub_server.py --port 8765 --latency 5 --bytes-per-second 4000000
+
+import io
+import time
+import argparse
+import random
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+
+class StubImageServer:
+    """
+    Serves /prompt/<text>?width=..&height=.. with a JPEG of the requested size.
+
+    :param latency: Seconds to wait before the first byte (generation time).
+    :param latency_per_mpx: Extra generation time per requested megapixel.
+    :param image_bytes: Pad every response body to at least this many bytes.
+    :param bytes_per_second: Cap the transfer rate of each response body (0 for no cap).
+    :param noise: Serve noisy images, whose JPEG size grows with the pixel
+                  count like real generations, instead of flat colour.
+
+    Fault injection, each drawn per request from a seeded RNG:
+    :param error_rate: Fraction of requests answered with 503.
+    :param drop_rate: Fraction of responses cut off halfway through the body.
+    :param hang_rate: Fraction of requests that stall for hang_seconds first.
+    Setting down to True answers every request with 503.
+    """
+
+    def __init__(self, latency=0.0, image_bytes=0, latency_per_mpx=0.0, noise=False,
+                 error_rate=0.0, drop_rate=0.0, hang_rate=0.0, hang_seconds=30.0, seed=0,
+                 bytes_per_second=0, port=0):
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.latency_per_mpx = latency_per_mpx
+        self.image_bytes = image_bytes
+        self.noise = noise
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.down = False
+        self.requests = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.faults = 0
+        self._random = random.Random(seed)
+        self._images = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, prompt, width=640, height=360, seed=1):
+        return (f"{self.base_url}/prompt/{urllib.parse.quote(prompt)}"
+                f"?width={width}&height={height}&seed={seed}&model=flux")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def image(self, width, height):
+        key = (width, height)
+        with self._lock:
+            if key not in self._images:
+                buf = io.BytesIO()
+                if self.noise:
+                    img = Image.merge("RGB", [Image.effect_noise(key, sigma) for sigma in (40, 60, 80)])
+                else:
+                    img = Image.new("RGB", key, (30, 60, 90))
+                img.save(buf, "JPEG", quality=90)
+                data = buf.getvalue()
+                if len(data) < self.image_bytes:
+                    # Trailing bytes after the JPEG end marker are ignored by decoders
+                    data += b"\0" * (self.image_bytes - len(data))
+                self._images[key] = data
+            return self._images[key]
+
+    def _draw_fault(self):
+        if self.down:
+            self.faults += 1
+            return "error"
+        roll = self._random.random()
+        for fault, rate in (("error", self.error_rate), ("drop", self.drop_rate), ("hang", self.hang_rate)):
+            if roll < rate:
+                self.faults += 1
+                return fault
+            roll -= rate
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client timed out and hung up
+
+            def do_GET(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                if not parsed.path.startswith("/prompt/"):
+                    self.send_error(404)
+                    return
+                query = urllib.parse.parse_qs(parsed.query)
+                width = int(query.get("width", ["640"])[0])
+                height = int(query.get("height", ["360"])[0])
+                with server._lock:
+                    server.requests += 1
+                    fault = server._draw_fault()
+                if fault == "error":
+                    self.send_error(503)
+                    return
+                if fault == "hang":
+                    time.sleep(server.hang_seconds)
+                delay = server.latency + server.latency_per_mpx * width * height / 1e6
+                if delay:
+                    time.sleep(delay)
+                body = server.image(width, height)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if fault == "drop":
+                    self._send_body(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self._send_body(body)
+
+            def _send_body(self, body):
+                if not server.bytes_per_second:
+                    self.wfile.write(body)
+                else:
+                    # Paced in 64 KiB chunks, like a slow or shared link
+                    chunk = 64 * 1024
+                    for start in range(0, len(body), chunk):
+                        self.wfile.write(body[start:start + chunk])
+                        time.sleep(min(chunk, len(body) - start) / server.bytes_per_second)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub images in place of image.pollinations.ai")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-per-mpx", type=float, default=0.0)
+    parser.add_argument("--image-bytes", type=int, default=0)
+    parser.add_argument("--bytes-per-second", type=float, default=0)
+    parser.add_argument("--noise", action="store_true")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = StubImageServer(latency=args.latency, latency_per_mpx=args.latency_per_mpx,
+                             image_bytes=args.image_bytes, bytes_per_second=args.bytes_per_second,
+                             noise=args.noise, error_rate=args.error_rate, drop_rate=args.drop_rate,
+                             hang_rate=args.hang_rate, seed=args.seed, port=args.port)
+    # The first line of output is the base URL, for scripts that start this as a subprocess
+    print(server.base_url, flush=True)
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
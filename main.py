@@ -5,6 +5,9 @@ import tkinter as tk
 from wallpaper_gui import WallpaperApp
 
 if __name__ == "__main__":
+    import multiprocessing
+    # Post-processing workers re-launch this executable when frozen
+    multiprocessing.freeze_support()
     app = tk.Tk()
     app.geometry("420x520")
     WallpaperApp(app)
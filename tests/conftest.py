@@ -0,0 +1,53 @@
+# conftest.py
+#
+# Shared fixtures. Tests never touch the real appdata dir or the network:
+# downloads go to the local stub server, wallpapers to the file-sink backend.
+# Run from the repo root:  python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from wallpaper_postprocess import PostProcessor
+from stub_server import StubImageServer
+
+# Process-wide objects wallpaper_utils creates on first use
+_GLOBALS = ("_backend", "_state_provider", "_metrics", "_image_cache", "_http_session", "_download_slots",
+            "_retry_policy", "_history", "_settings_store", "_catalog", "_catalog_source", "_sampler",
+            "_post_processor")
+
+
+@pytest.fixture
+def appdata(tmp_path, monkeypatch):
+    """An empty app data dir, with the process-wide objects of wallpaper_utils reset."""
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.delenv("AI_WALLPAPER_IMAGE_SERVICE", raising=False)
+    for name in _GLOBALS:
+        monkeypatch.setattr(wallpaper_utils, name, None)
+    # No retry waits, and post-processing in this process
+    wallpaper_utils.save_settings({"download_backoff_seconds": 0, "download_attempts": 2})
+    wallpaper_utils._post_processor = PostProcessor(max_workers=0)
+    return wallpaper_utils.get_appdata_dir()
+
+
+@pytest.fixture
+def sink(appdata, tmp_path):
+    """Headless backend with one small monitor."""
+    backend = FileSinkBackend(str(tmp_path / "sink"), ["320x180+0+0"])
+    wallpaper_utils._backend = backend
+    return backend
+
+
+@pytest.fixture
+def stub_server(appdata, monkeypatch):
+    with StubImageServer() as server:
+        monkeypatch.setenv("AI_WALLPAPER_IMAGE_SERVICE", server.base_url)
+        yield server
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from wallpaper_cache import ImageCache, cache_key, choose_seed, generation_params
+
+
+def _image(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_get_counts_hits_and_misses(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"))
+    cache.put("a", _image(tmp_path, "a.jpg", 10), prompt="a prompt")
+    dest = str(tmp_path / "out.jpg")
+    assert cache.get("a", dest)
+    assert open(dest, "rb").read() == b"x" * 10
+    assert not cache.get("b", dest)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (1, 1, 1, 10)
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = ImageCache(str(tmp_path / "cache"), max_bytes=25)
+    cache.put("a", _image(tmp_path, "a.jpg", 10))
+    cache.put("b", _image(tmp_path, "b.jpg", 10))
+    # Using "a" makes "b" the least recently used
+    cache.get("a", str(tmp_path / "out.jpg"))
+    cache.put("c", _image(tmp_path, "c.jpg", 10))
+    assert [key for key, _ in cache.recent()] == ["c", "a"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    directory = str(tmp_path / "cache")
+    ImageCache(directory).put("a", _image(tmp_path, "a.jpg", 10), prompt="kept")
+    cache = ImageCache(directory)
+    assert cache.recent()[0][1]["prompt"] == "kept"
+    assert cache.get("a", str(tmp_path / "out.jpg"))
+
+
+def test_cache_key_ignores_unrelated_query_params():
+    url = "https://image.pollinations.ai/prompt/misty%20forest?width=640&height=360&seed=7&model=flux"
+    assert generation_params(url) == {"prompt": "misty forest", "width": "640", "height": "360",
+                                      "seed": "7", "model": "flux"}
+    assert cache_key(url) == cache_key(url + "&nologo=true")
+    assert cache_key(url) != cache_key(url.replace("seed=7", "seed=8"))
+
+
+def test_seed_policies():
+    assert choose_seed("fixed", "p", fixed_seed=2 ** 32 + 5) == 5
+    assert choose_seed("prompt_hash", "p") == choose_seed("prompt_hash", "p")
+    assert choose_seed("prompt_hash", "p") != choose_seed("prompt_hash", "q")
+    morning = datetime(2024, 5, 1, 9, 0)
+    assert choose_seed("time_slot", "p", slot_minutes=30, when=morning) == \
+        choose_seed("time_slot", "q", slot_minutes=30, when=morning.replace(minute=29))
+    assert choose_seed("time_slot", "p", slot_minutes=30, when=morning) != \
+        choose_seed("time_slot", "p", slot_minutes=30, when=morning.replace(minute=30))
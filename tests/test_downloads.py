@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import wallpaper_utils
+from wallpaper_backends import FileSinkBackend
+from wallpaper_cache import generation_params
+
+
+def test_download_reuses_one_connection(stub_server):
+    for seed in range(3):
+        path = wallpaper_utils.download_image(stub_server.url("forest", seed=seed), f"image{seed}.jpg")
+        assert os.path.getsize(path) > 0
+    assert stub_server.requests == 3
+    assert stub_server.connections == 1
+
+
+def test_repeated_generation_is_served_from_cache(stub_server):
+    url = stub_server.url("forest", seed=1)
+    wallpaper_utils.download_image(url, "first.jpg")
+    wallpaper_utils.download_image(url, "second.jpg")
+    assert stub_server.requests == 1
+    assert wallpaper_utils.get_image_cache().stats()["hits"] == 1
+
+
+def test_batch_downloads_keep_order_and_report_errors(stub_server):
+    urls = [stub_server.url("batch", seed=seed) for seed in range(4)] + [stub_server.base_url + "/missing"]
+    results = wallpaper_utils.download_images(urls, [f"batch{i}.jpg" for i in range(5)])
+    assert [os.path.basename(r) for r in results[:4]] == [f"batch{i}.jpg" for i in range(4)]
+    assert isinstance(results[4], Exception)
+
+
+def test_failing_service_is_retried_then_reported(stub_server):
+    stub_server.down = True
+    with pytest.raises(Exception, match="Image download failed"):
+        wallpaper_utils.download_image(stub_server.url("down"), "down.jpg")
+    # download_attempts is 2 in the test settings
+    assert stub_server.requests == 2
+    stats = wallpaper_utils.get_retry_policy().stats()
+    assert (stats["retries"], stats["failures"]) == (1, 1)
+    assert not os.path.exists(wallpaper_utils.get_resource_path("down.jpg.part", user_data=True))
+
+
+def test_refresh_applies_an_image_of_the_screen_size(stub_server, sink):
+    engine = wallpaper_utils.WallpaperEngine()
+    prompt = engine.refresh({"multi_monitor": "off", "selected_category": "Random"})
+    assert prompt
+    with Image.open(os.path.join(sink.sink_dir, "wallpaper.bmp")) as img:
+        assert img.size == (320, 180)
+    assert engine.metrics()["counters"]["refresh.ok"] == 1
+
+
+def test_monitor_parts_are_removed_when_one_monitor_fails(stub_server, sink, monkeypatch):
+    sink.monitors = FileSinkBackend(sink.sink_dir, ["320x180+0+0", "320x180+320+0"]).monitors
+    render = wallpaper_utils.postprocess_image
+
+    def fail_second(src_path, out_path, *args, **kwargs):
+        if out_path.endswith("part1.bmp"):
+            os.remove(src_path)
+            raise Exception("broken image")
+        render(src_path, out_path, *args, **kwargs)
+
+    monkeypatch.setattr(wallpaper_utils, "postprocess_image", fail_second)
+    with pytest.raises(Exception, match="broken image"):
+        wallpaper_utils.generate_wallpaper({"multi_monitor": "per_monitor"}, wallpaper_utils.load_prompts())
+    assert not [name for name in os.listdir(wallpaper_utils.get_appdata_dir()) if ".part" in name]
+
+
+def test_cancelled_download_gives_up_its_slot(stub_server):
+    stub_server.latency = 1.0
+    wallpaper_utils.update_settings({"max_concurrent_downloads": 1})
+    superseded = threading.Event()
+    errors = []
+
+    def download_superseded():
+        try:
+            wallpaper_utils.download_image(stub_server.url("superseded"), "superseded.jpg", cancel_event=superseded)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=download_superseded)
+    thread.start()
+    threading.Event().wait(0.2)
+    start = time.perf_counter()
+    superseded.set()
+    thread.join()
+    assert time.perf_counter() - start < 0.5
+    assert "cancelled" in str(errors[0])
+    # The current request doesn't wait behind the cancelled one
+    wallpaper_utils.download_image(stub_server.url("current"), "current.jpg")
+    assert time.perf_counter() - start < 1.8
+
+
+def test_prompt_names_the_aspect_ratio_of_the_screen(appdata):
+    settings = {"generation_scale": 0.5}
+    request_size = wallpaper_utils.generation_size(settings, 1920, 1080)
+    assert request_size == (960, 536)
+    url = wallpaper_utils.url_builder("forest", *request_size, seed=1, screen_size=(1920, 1080))
+    assert generation_params(url)["prompt"].endswith("aspect ratio 16:9")
+    assert wallpaper_utils.aspect_ratio(1366, 768) == "16:9"
+    assert wallpaper_utils.aspect_ratio(3440, 1440) == "21:9"
+    assert wallpaper_utils.aspect_ratio(1000, 700) == "10:7"
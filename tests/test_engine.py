@@ -0,0 +1,155 @@
+import os
+import threading
+
+import pytest
+
+import wallpaper_prefetch
+import wallpaper_utils
+from wallpaper_prefetch import Speculator
+
+
+def test_stopped_engine_can_be_restarted(appdata):
+    wallpaper_utils.update_settings({"auto_refresh_enabled": True, "next_update_time": "2999-01-01 00:00:00"})
+    engine = wallpaper_utils.WallpaperEngine().start()
+    first = engine.scheduler
+    assert engine.running
+    engine.stop()
+    assert not engine.running
+    assert engine.scheduler is not first
+    # Prefetching stops with the auto-refresh
+    assert not engine.prefetch_queue._enabled
+    engine.start()
+    assert engine.running and engine.prefetch_queue._enabled
+    threading.Event().wait(0.1)
+    assert engine.scheduler._started is not None
+    engine.stop()
+
+
+def test_fallback_changes_the_wallpaper_once_per_interval(stub_server, sink, monkeypatch):
+    engine = wallpaper_utils.WallpaperEngine()
+    settings = {"multi_monitor": "off", "interval_minutes": 30}
+    # Two wallpapers in the cache to fall back to
+    engine._scheduled_refresh(settings)
+    engine._scheduled_refresh(settings)
+    applied = sink.applied
+    stub_server.down = True
+    # The interval has passed since the last change: one fallback wallpaper
+    monkeypatch.setattr(engine, "_last_change", engine._last_change - 30 * 60)
+    with pytest.raises(Exception):
+        engine._scheduled_refresh(settings)
+    assert sink.applied == applied + 1
+    # Backoff retries minutes later leave it alone
+    for _ in range(3):
+        with pytest.raises(Exception):
+            engine._scheduled_refresh(settings)
+    assert sink.applied == applied + 1
+
+
+def test_only_manual_refreshes_take_speculations(stub_server, sink, monkeypatch):
+    monkeypatch.setenv("AI_WALLPAPER_SYSTEM_STATE", "fake")
+    wallpaper_utils.update_settings({"multi_monitor": "off", "progressive_preview": False})
+    engine = wallpaper_utils.WallpaperEngine()
+    assert engine.speculate({"selected_category": "Random"})
+    speculation = engine.speculator._current
+    speculation.done.wait(10)
+    engine._scheduled_refresh(engine.store.get())
+    assert engine.speculator.stats()["hits"] == 0
+    engine.generate_now()
+    stats = engine.speculator.stats()
+    assert (stats["hits"], stats["hit_rate"]) == (1, 1.0)
+    assert wallpaper_utils.get_metrics().last("refresh")["source"] == "speculative"
+
+
+def test_speculative_images_of_ended_processes_are_removed(appdata):
+    directory = wallpaper_utils.get_resource_path(wallpaper_utils.SPECULATIVE_DIR, user_data=True)
+    running = wallpaper_utils.WallpaperEngine().speculator
+    ended = os.path.join(directory, "ended")
+    os.makedirs(ended)
+    for name in (wallpaper_prefetch.OWNER_LOCK_FILE, "leftover"):
+        with open(os.path.join(ended, name), "wb") as f:
+            f.write(b"BM")
+    with open(os.path.join(running.directory, "in-flight"), "wb") as f:
+        f.write(b"BM")
+    engine = wallpaper_utils.WallpaperEngine()
+    assert sorted(os.listdir(directory)) == sorted(os.path.basename(s.directory)
+                                                   for s in (running, engine.speculator))
+    assert "in-flight" in os.listdir(running.directory)
+
+
+def test_cancel_after_preview_restores_the_previous_wallpaper(stub_server, sink):
+    # Noisy images, so the preview and the full image differ; the full one takes a second
+    stub_server.noise = True
+    stub_server.latency_per_mpx = 20
+    wallpaper_utils.update_settings({"multi_monitor": "off", "progressive_preview_px": 128})
+    engine = wallpaper_utils.WallpaperEngine()
+    engine.refresh(engine.store.get())
+    previous = wallpaper_utils.get_history_store().entries(1)[0]["path"]
+    applied = sink.applied
+    cancel_event = threading.Event()
+
+    def cancel_after_preview():
+        while sink.applied == applied:
+            threading.Event().wait(0.01)
+        cancel_event.set()
+
+    threading.Thread(target=cancel_after_preview, daemon=True).start()
+    with pytest.raises(Exception, match="cancelled"):
+        engine.refresh(engine.store.get(), cancel_event=cancel_event, preview=True)
+    assert sink.applied == applied + 2
+    with open(previous, "rb") as f, open(os.path.join(sink.sink_dir, "wallpaper.bmp"), "rb") as shown:
+        assert f.read() == shown.read()
+    # Only the first full image was cached, not the preview
+    assert len(wallpaper_utils.get_image_cache().recent(50)) == 1
+
+
+def _blocking_speculator(tmp_path):
+    release = threading.Event()
+
+    def produce(out_path, settings, cancel_event, progress):
+        # Ignores cancel_event, like a request still waiting for the service
+        release.wait(5)
+        raise Exception("cancelled")
+
+    return Speculator(str(tmp_path / "speculative"), produce), release
+
+
+def test_cancelled_take_leaves_a_newer_speculation_alone(tmp_path):
+    speculator, release = _blocking_speculator(tmp_path)
+    try:
+        speculator.start({"selected_category": "Space"})
+        cancel_event = threading.Event()
+        taken = []
+        thread = threading.Thread(target=lambda: taken.append(
+            speculator.take({"selected_category": "Space"}, str(tmp_path / "out.bmp"), cancel_event)))
+        thread.start()
+        threading.Event().wait(0.1)
+        speculator.start({"selected_category": "Ocean"})
+        newer = speculator._current
+        cancel_event.set()
+        thread.join()
+        assert taken == [None]
+        assert speculator._current is newer and not newer.cancel_event.is_set()
+    finally:
+        release.set()
+
+
+def test_manual_refresh_cancels_a_speculation_for_other_choices(tmp_path):
+    speculator, release = _blocking_speculator(tmp_path)
+    try:
+        speculator.start({"selected_category": "Space"})
+        speculation = speculator._current
+        assert speculator.take({"selected_category": "Ocean"}, str(tmp_path / "out.bmp")) is None
+        assert speculation.cancel_event.is_set() and speculator._current is None
+        assert speculator.stats()["wasted"] == 1
+    finally:
+        release.set()
+
+
+def test_stop_keeps_the_images_queued_for_the_playlist_slot(appdata):
+    wallpaper_utils.update_settings({"auto_refresh_enabled": True, "next_update_time": "2999-01-01 00:00:00",
+                                     "prefetch_depth": 0,
+                                     "playlists": [{"start": "00:00", "end": "24:00", "style": "neon"}]})
+    engine = wallpaper_utils.WallpaperEngine().start()
+    engine.stop()
+    assert not engine.prefetch_queue._enabled
+    assert engine.prefetch_queue._targets[0]["selected_style"] == "neon"
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from wallpaper_playlists import effective_settings, next_boundary, parse_rules
+
+# 2024-05-06 is a Monday
+MONDAY = datetime(2024, 5, 6)
+
+SETTINGS = {
+    "selected_category": "Random",
+    "playlists": [
+        {"start": "09:00", "end": "17:00", "days": ["mon", "tue", "wed", "thu", "fri"], "category": "Work"},
+        {"start": "22:00", "end": "06:00", "category": "Night", "style": "dreamy"},
+    ],
+}
+
+
+def at(day, hour, minute=0):
+    return MONDAY.replace(day=MONDAY.day + day, hour=hour, minute=minute)
+
+
+def test_rule_applies_inside_its_window_only():
+    assert effective_settings(SETTINGS, at(0, 9))["selected_category"] == "Work"
+    assert effective_settings(SETTINGS, at(0, 16, 59))["selected_category"] == "Work"
+    assert effective_settings(SETTINGS, at(0, 17))["selected_category"] == "Random"
+    # Saturday
+    assert effective_settings(SETTINGS, at(5, 10))["selected_category"] == "Random"
+
+
+def test_overnight_rule_runs_past_midnight():
+    late = effective_settings(SETTINGS, at(0, 23))
+    assert (late["selected_category"], late["selected_style"]) == ("Night", "dreamy")
+    assert effective_settings(SETTINGS, at(1, 5, 59))["selected_category"] == "Night"
+    assert effective_settings(SETTINGS, at(1, 6))["selected_category"] == "Random"
+
+
+def test_next_boundary_is_the_next_change():
+    assert next_boundary(SETTINGS, at(0, 8)) == at(0, 9)
+    assert next_boundary(SETTINGS, at(0, 9)) == at(0, 17)
+    assert next_boundary(SETTINGS, at(0, 18)) == at(0, 22)
+    # Friday evening: the weekend has no daytime rule
+    assert next_boundary(SETTINGS, at(4, 7)) == at(4, 9)
+    assert next_boundary(SETTINGS, at(5, 7)) == at(5, 22)
+
+
+def test_no_rules_means_no_boundary():
+    assert next_boundary({}, MONDAY) is None
+    assert effective_settings({"selected_category": "Space"}, MONDAY) == {"selected_category": "Space"}
+
+
+def test_invalid_rules_are_skipped():
+    rules = parse_rules({"playlists": [{"start": "25:00", "end": "26:00"}, {"end": "10:00"},
+                                       {"start": "08:00", "end": "10:00", "category": "Ok"}]})
+    assert [rule.overrides for rule in rules] == [{"selected_category": "Ok"}]
@@ -0,0 +1,73 @@
+import os
+import random
+
+from wallpaper_prompts import PromptCatalog, PromptSampler
+
+# The size of every bundled category
+CATEGORY_SIZE = 60
+
+
+def _catalog():
+    return PromptCatalog.from_dict({"Space": [f"space {i}" for i in range(CATEGORY_SIZE)],
+                                    "Ocean": [f"ocean {i}" for i in range(CATEGORY_SIZE)]})
+
+
+def _draw_bags(sampler, catalog, bags, rng):
+    return [[sampler.draw(catalog, "Space", rng) for _ in range(CATEGORY_SIZE)] for _ in range(bags)]
+
+
+def test_bags_have_no_repeats_and_differ(tmp_path):
+    catalog = _catalog()
+    sampler = PromptSampler(str(tmp_path / "rotation.json"), window=50)
+    bags = _draw_bags(sampler, catalog, 5, random.Random(1))
+    for bag in bags:
+        assert sorted(bag) == sorted(catalog.prompts("Space"))
+    # Held-back prompts are shuffled too, so no part of the rotation repeats bag after bag
+    for previous, bag in zip(bags[1:], bags[2:]):
+        assert bag[10:] != previous[10:]
+        assert bag[-CATEGORY_SIZE // 2:] != previous[-CATEGORY_SIZE // 2:]
+
+
+def test_no_repeat_within_the_window_across_bags(tmp_path):
+    catalog = _catalog()
+    for window in (10, 25, 50, 100):
+        sampler = PromptSampler(str(tmp_path / f"rotation{window}.json"), window=window)
+        draws = sum(_draw_bags(sampler, catalog, 6, random.Random(window)), [])
+        # Holding back at most half a bag honours the window up to half the category size
+        span = min(window, CATEGORY_SIZE // 2)
+        for start in range(len(draws) - span + 1):
+            assert len(set(draws[start:start + span])) == span
+
+
+def test_rotation_survives_restart(tmp_path):
+    catalog = _catalog()
+    path = str(tmp_path / "rotation.json")
+    sampler = PromptSampler(path, save_delay=3600)
+    rng = random.Random(2)
+    drawn = [sampler.draw(catalog, "Space", rng) for _ in range(25)]
+    # Saves are batched, not written on every draw
+    assert not os.path.exists(path)
+    sampler.flush()
+    restarted = PromptSampler(path)
+    assert [restarted.draw(catalog, "Space") for _ in range(10)] == \
+        [sampler.draw(catalog, "Space") for _ in range(10)]
+    assert not set(drawn) & set(restarted.draw(catalog, "Space") for _ in range(25))
+
+
+def test_changed_catalog_resets_rotation(tmp_path):
+    path = str(tmp_path / "rotation.json")
+    sampler = PromptSampler(path)
+    sampler.draw(_catalog(), "Space")
+    sampler.flush()
+    other = PromptCatalog.from_dict({"Space": ["only one"]})
+    assert PromptSampler(path).draw(other, "Space") == "only one"
+
+
+def test_catalog_drops_duplicates_and_honours_weights():
+    catalog = PromptCatalog.from_dict({"A": ["Misty forest", "misty forest ", "Dunes"], "B": ["Dunes", "Reef"],
+                                       "C": []})
+    assert catalog.prompts("A") == ["Misty forest", "Dunes"]
+    assert catalog.prompts("B") == ["Reef"]
+    catalog.set_weights({"A": 0})
+    rng = random.Random(3)
+    assert {catalog.random_category(rng) for _ in range(50)} == {"B"}
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+import requests
+
+from wallpaper_retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+
+
+def test_breaker_lets_one_trial_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def test_policy_retries_retryable_errors():
+    policy = RetryPolicy(attempts=3, base_delay=0)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise requests.ConnectionError("refused")
+        return "ok"
+
+    assert policy.call(flaky) == "ok"
+    stats = policy.stats()
+    assert (stats["calls"], stats["retries"], stats["failures"]) == (1, 2, 0)
+    assert stats["breaker_state"] == "closed"
+
+
+def test_policy_does_not_retry_other_errors():
+    policy = RetryPolicy(attempts=3, base_delay=0)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad content")
+
+    with pytest.raises(ValueError):
+        policy.call(broken)
+    assert len(calls) == 1
+    assert policy.breaker.failures == 0
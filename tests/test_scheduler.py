@@ -0,0 +1,177 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+import wallpaper_scheduler
+from wallpaper_prefetch import PrefetchQueue
+from wallpaper_scheduler import TIME_FORMAT, RefreshScheduler
+from wallpaper_settings import SettingsStore
+from wallpaper_system import FakeStateProvider, throttle_reason
+
+
+def _store(tmp_path, due_in_minutes, **settings):
+    store = SettingsStore(str(tmp_path / "settings.json"))
+    next_time = (datetime.now() + timedelta(minutes=due_in_minutes)).strftime(TIME_FORMAT)
+    store.save(dict(settings, auto_refresh_enabled=True, interval_minutes=30, next_update_time=next_time))
+    return store
+
+
+def _wait_for(condition, seconds=5):
+    deadline = datetime.now() + timedelta(seconds=seconds)
+    while not condition():
+        assert datetime.now() < deadline, "timed out"
+        threading.Event().wait(0.01)
+
+
+def test_missed_deadlines_give_one_refresh(tmp_path):
+    # Three intervals overdue, as after a suspend
+    store = _store(tmp_path, -90)
+    refreshed = []
+    scheduler = RefreshScheduler(store, refreshed.append).start()
+    try:
+        _wait_for(lambda: scheduler.refreshes == 1)
+        threading.Event().wait(0.1)
+        assert len(refreshed) == 1
+        next_time = datetime.strptime(store.get()["next_update_time"], TIME_FORMAT)
+        assert timedelta(minutes=29) < next_time - datetime.now() <= timedelta(minutes=30)
+    finally:
+        scheduler.stop()
+
+
+def test_sleeps_until_the_deadline(tmp_path):
+    store = _store(tmp_path, 30)
+    scheduler = RefreshScheduler(store, lambda settings: None).start()
+    try:
+        threading.Event().wait(0.2)
+        stats = scheduler.stats()
+        assert (stats["wakeups"], stats["refreshes"]) == (0, 0)
+        # A settings change wakes it once, to re-read the deadline
+        store.update({"interval_minutes": 60})
+        _wait_for(lambda: scheduler.wakeups == 1)
+    finally:
+        scheduler.stop()
+
+
+def test_failed_refresh_is_retried_with_backoff(tmp_path):
+    store = _store(tmp_path, -1)
+    missed = store.get()["next_update_time"]
+
+    def fail(settings):
+        raise Exception("service down")
+
+    scheduler = RefreshScheduler(store, fail).start()
+    try:
+        _wait_for(lambda: store.get()["next_update_time"] != missed)
+        assert scheduler.failures == 1
+        next_time = datetime.strptime(store.get()["next_update_time"], TIME_FORMAT)
+        retry = timedelta(minutes=wallpaper_scheduler.FAILURE_RETRY_MINUTES)
+        assert retry - timedelta(seconds=5) < next_time - datetime.now() <= retry
+    finally:
+        scheduler.stop()
+
+
+def _throttled_store(tmp_path, provider, due_in_minutes):
+    store = _store(tmp_path, due_in_minutes, pause_when_idle_minutes=10)
+    return store, lambda settings: throttle_reason(provider.state(), settings)
+
+
+def test_refresh_waits_while_throttled_then_runs_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(wallpaper_scheduler, "THROTTLE_POLL_SECONDS", 0.02)
+    monkeypatch.setattr(wallpaper_scheduler, "MAX_SLEEP_SECONDS", 0.05)
+    provider = FakeStateProvider(locked=True)
+    # Several intervals pass while the screen is locked
+    store, throttle = _throttled_store(tmp_path, provider, -90)
+    refreshed = []
+    scheduler = RefreshScheduler(store, refreshed.append, throttle=throttle).start()
+    try:
+        _wait_for(lambda: scheduler.throttled == "screen locked")
+        provider.set(locked=False, idle_seconds=900)
+        _wait_for(lambda: scheduler.throttled == "user idle")
+        threading.Event().wait(0.1)
+        assert refreshed == []
+        assert scheduler.deferrals == 2
+        provider.set(idle_seconds=0)
+        _wait_for(lambda: scheduler.refreshes == 1)
+        threading.Event().wait(0.1)
+        assert len(refreshed) == 1
+        assert scheduler.stats()["throttled"] is None
+    finally:
+        scheduler.stop()
+
+
+def test_throttle_checks_back_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(wallpaper_scheduler, "THROTTLE_POLL_SECONDS", 0.02)
+    monkeypatch.setattr(wallpaper_scheduler, "MAX_SLEEP_SECONDS", 0.32)
+    provider = FakeStateProvider(on_battery=True)
+    store, throttle = _throttled_store(tmp_path, provider, -1)
+    scheduler = RefreshScheduler(store, lambda settings: None, throttle=throttle).start()
+    try:
+        threading.Event().wait(1.5)
+        # Waits of 0.02, 0.04 ... 0.32, 0.32 s instead of 75 polls at the first one
+        assert 5 <= scheduler.wakeups <= 9
+        assert scheduler.refreshes == 0
+    finally:
+        scheduler.stop()
+
+
+def test_throttle_is_only_checked_when_a_refresh_is_due(tmp_path):
+    provider = FakeStateProvider(on_battery=True)
+    store, throttle = _throttled_store(tmp_path, provider, 30)
+    scheduler = RefreshScheduler(store, lambda settings: None, throttle=throttle).start()
+    try:
+        threading.Event().wait(0.2)
+        assert (scheduler.throttled, scheduler.deferrals, scheduler.wakeups) == (None, 0, 0)
+    finally:
+        scheduler.stop()
+
+
+def test_prefetch_waits_while_throttled(tmp_path):
+    provider = FakeStateProvider(on_battery=True)
+    produced = []
+
+    def produce(out_path, settings):
+        Image.new("RGB", (8, 8)).save(out_path, "BMP")
+        produced.append(out_path)
+        return "prompt", {}
+
+    queue = PrefetchQueue(str(tmp_path / "prefetch"), produce,
+                          throttle=lambda settings: throttle_reason(provider.state(), settings))
+    try:
+        queue.configure({"prefetch_depth": 2})
+        _wait_for(lambda: queue.throttled == "on battery")
+        threading.Event().wait(0.1)
+        assert produced == []
+        provider.set(on_battery=False)
+        queue.resume()
+        _wait_for(lambda: len(queue) == 2)
+        assert queue.throttled is None
+    finally:
+        queue.stop()
+
+
+def test_one_process_at_a_time_uses_the_prefetch_directory(tmp_path):
+    def produce(out_path, settings):
+        Image.new("RGB", (8, 8)).save(out_path, "BMP")
+        return "prompt", {}
+
+    directory = str(tmp_path / "prefetch")
+    settings = {"prefetch_depth": 2}
+    tray = PrefetchQueue(directory, produce)
+    # Stands in for the engine of a GUI started next to the tray
+    gui = PrefetchQueue(directory, produce)
+    try:
+        tray.configure(settings)
+        _wait_for(lambda: len(tray) == 2)
+        files = sorted(os.listdir(directory))
+        gui.configure(settings)
+        assert gui.pop(str(tmp_path / "wallpaper.bmp")) is None
+        assert sorted(os.listdir(directory)) == files and len(gui) == 0
+        # Once the tray lets go, the other queue takes over its images
+        tray.configure(settings, enabled=False)
+        gui.configure(settings)
+        assert len(gui) == 2
+    finally:
+        tray.stop()
+        gui.stop()
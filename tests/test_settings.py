@@ -0,0 +1,33 @@
+import json
+
+from wallpaper_settings import SettingsStore
+
+
+def test_update_merges_with_changes_from_another_process(tmp_path):
+    path = str(tmp_path / "settings.json")
+    tray, gui = SettingsStore(path), SettingsStore(path)
+    tray.update({"next_update_time": "2024-05-06 09:00:00"})
+    gui.get()
+    tray.update({"next_update_time": "2024-05-06 09:30:00"})
+    # The GUI's copy is stale; its write must not lose the tray's field
+    gui.update({"selected_style": "neon"})
+    with open(path) as f:
+        assert json.load(f) == {"next_update_time": "2024-05-06 09:30:00", "selected_style": "neon"}
+
+
+def test_get_returns_copies(tmp_path):
+    store = SettingsStore(str(tmp_path / "settings.json"))
+    store.save({"playlists": [{"start": "09:00"}]})
+    store.get()["playlists"].append("changed")
+    assert store.get() == {"playlists": [{"start": "09:00"}]}
+
+
+def test_subscribers_see_changes_only(tmp_path):
+    store = SettingsStore(str(tmp_path / "settings.json"))
+    seen = []
+    store.subscribe(seen.append)
+    store.update({"interval_minutes": 5})
+    store.update({"interval_minutes": 5})
+    store.save({"interval_minutes": 10})
+    assert seen == [{"interval_minutes": 5}, {"interval_minutes": 10}]
+    store.unsubscribe(seen.append)
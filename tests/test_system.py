@@ -0,0 +1,30 @@
+import json
+
+from wallpaper_system import UNKNOWN, FakeStateProvider, throttle_reason
+
+SETTINGS = {"pause_when_idle_minutes": 10}
+
+
+def test_unknown_state_never_throttles():
+    assert throttle_reason(UNKNOWN, SETTINGS) is None
+
+
+def test_throttle_reasons():
+    provider = FakeStateProvider(idle_seconds=0)
+    assert throttle_reason(provider.state(), SETTINGS) is None
+    provider.set(idle_seconds=600)
+    assert throttle_reason(provider.state(), SETTINGS) == "user idle"
+    provider.set(idle_seconds=0, on_battery=True)
+    assert throttle_reason(provider.state(), SETTINGS) == "on battery"
+    assert throttle_reason(provider.state(), dict(SETTINGS, pause_on_battery=False)) is None
+    provider.set(on_battery=False, metered=True, locked=True)
+    assert throttle_reason(provider.state(), SETTINGS) == "screen locked"
+
+
+def test_fake_provider_reads_state_file(tmp_path):
+    path = tmp_path / "state.json"
+    provider = FakeStateProvider(str(path), on_battery=True)
+    # No file yet: the state set in code
+    assert provider.state().on_battery
+    path.write_text(json.dumps({"metered": True}))
+    assert provider.state() == UNKNOWN._replace(metered=True)
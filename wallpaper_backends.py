@@ -0,0 +1,221 @@
+# wallpaper_backends.py
+
+import os
+import re
+import shutil
+import ctypes
+import subprocess
+from collections import namedtuple
+
+Monitor = namedtuple("Monitor", ["x", "y", "width", "height", "primary"])
+
+
+class WallpaperBackend:
+    """
+    Platform hooks used by the generation pipeline: screen geometry and
+    applying an image as the desktop wallpaper.
+    """
+
+    name = "base"
+    # True if set_wallpapers() can give every monitor its own image
+    supports_per_monitor = False
+
+    def list_monitors(self):
+        """Monitors as Monitor tuples, primary first."""
+        raise NotImplementedError
+
+    def get_screen_resolution(self):
+        primary = self.list_monitors()[0]
+        return primary.width, primary.height
+
+    def set_wallpaper(self, image_path):
+        raise NotImplementedError
+
+    def set_spanning_wallpaper(self, image_path):
+        """Applies one image stretched over the bounding box of all monitors."""
+        self.set_wallpaper(image_path)
+
+    def set_wallpapers(self, image_paths):
+        """Applies one image per monitor, in list_monitors() order."""
+        raise NotImplementedError(f"The {self.name} backend has no per-monitor wallpapers")
+
+
+class WindowsBackend(WallpaperBackend):
+    name = "windows"
+
+    def list_monitors(self):
+        user32 = ctypes.windll.user32
+        user32.SetProcessDPIAware()
+        monitors = []
+
+        class RECT(ctypes.Structure):
+            _fields_ = [("left", ctypes.c_long), ("top", ctypes.c_long),
+                        ("right", ctypes.c_long), ("bottom", ctypes.c_long)]
+
+        callback_type = ctypes.WINFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p,
+                                           ctypes.POINTER(RECT), ctypes.c_void_p)
+
+        def callback(monitor, dc, rect, data):
+            r = rect.contents
+            # The primary monitor is the one containing the origin
+            monitors.append(Monitor(r.left, r.top, r.right - r.left, r.bottom - r.top,
+                                    r.left == 0 and r.top == 0))
+            return 1
+
+        user32.EnumDisplayMonitors(None, None, callback_type(callback), 0)
+        if not monitors:
+            monitors = [Monitor(0, 0, user32.GetSystemMetrics(0), user32.GetSystemMetrics(1), True)]
+        return sorted(monitors, key=lambda m: not m.primary)
+
+    def get_screen_resolution(self):
+        user32 = ctypes.windll.user32
+        user32.SetProcessDPIAware()
+        return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+
+    def _set_style(self, style, only_if=None):
+        import winreg
+
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Control Panel\Desktop", 0,
+                            winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE) as key:
+            if only_if is not None:
+                try:
+                    if winreg.QueryValueEx(key, "WallpaperStyle")[0] != only_if:
+                        return
+                except OSError:
+                    return
+            winreg.SetValueEx(key, "WallpaperStyle", 0, winreg.REG_SZ, style)
+            winreg.SetValueEx(key, "TileWallpaper", 0, winreg.REG_SZ, "0")
+
+    def set_wallpaper(self, image_path):
+        # Undo a previous spanning wallpaper ("22") by going back to fill ("10")
+        self._set_style("10", only_if="22")
+        self._apply(image_path)
+
+    def set_spanning_wallpaper(self, image_path):
+        self._set_style("22")
+        self._apply(image_path)
+
+    def _apply(self, image_path):
+        image_path = os.path.abspath(image_path)
+        result = ctypes.windll.user32.SystemParametersInfoW(20, 0, image_path, 3)
+        if not result:
+            raise Exception("Failed to set wallpaper")
+
+
+def _xrandr_monitors():
+    output = subprocess.run(["xrandr", "--current"], capture_output=True, text=True, check=True).stdout
+    monitors = []
+    for match in re.finditer(r" connected (primary )?(\d+)x(\d+)\+(\d+)\+(\d+)", output):
+        primary, width, height, x, y = match.groups()
+        monitors.append(Monitor(int(x), int(y), int(width), int(height), bool(primary)))
+    if not monitors:
+        raise Exception("xrandr reported no active monitors")
+    if not any(m.primary for m in monitors):
+        monitors[0] = monitors[0]._replace(primary=True)
+    return sorted(monitors, key=lambda m: not m.primary)
+
+
+class FehBackend(WallpaperBackend):
+    """Plain X11 sessions: geometry from xrandr, wallpaper set with feh."""
+
+    name = "feh"
+    supports_per_monitor = True
+
+    def list_monitors(self):
+        return _xrandr_monitors()
+
+    def set_wallpaper(self, image_path):
+        subprocess.run(["feh", "--no-fehbg", "--bg-fill", os.path.abspath(image_path)], check=True)
+
+    def set_spanning_wallpaper(self, image_path):
+        subprocess.run(["feh", "--no-fehbg", "--no-xinerama", "--bg-fill", os.path.abspath(image_path)], check=True)
+
+    def set_wallpapers(self, image_paths):
+        # feh assigns images to Xinerama screens in order
+        subprocess.run(["feh", "--no-fehbg", "--bg-fill"] + [os.path.abspath(p) for p in image_paths], check=True)
+
+
+class GnomeBackend(WallpaperBackend):
+    """GNOME sessions (X11 or Wayland) via gsettings."""
+
+    name = "gnome"
+
+    def list_monitors(self):
+        try:
+            return _xrandr_monitors()
+        except Exception:
+            return [Monitor(0, 0, 1920, 1080, True)]
+
+    def set_wallpaper(self, image_path, options="zoom"):
+        schema = "org.gnome.desktop.background"
+        subprocess.run(["gsettings", "set", schema, "picture-options", options], check=True)
+        uri = "file://" + os.path.abspath(image_path)
+        for key in ("picture-uri", "picture-uri-dark"):
+            # picture-uri-dark only exists on GNOME 42+
+            subprocess.run(["gsettings", "set", schema, key, uri], check=key == "picture-uri")
+
+    def set_spanning_wallpaper(self, image_path):
+        self.set_wallpaper(image_path, options="spanned")
+
+
+class FileSinkBackend(WallpaperBackend):
+    """
+    Headless backend for benchmarks and CI: "applying" a wallpaper copies it
+    into sink_dir. Monitors come from the sink_monitors setting, a list of
+    "WIDTHxHEIGHT+X+Y" strings with the primary first.
+    """
+
+    name = "file"
+    supports_per_monitor = True
+
+    def __init__(self, sink_dir, monitors=("1920x1080+0+0",)):
+        self.sink_dir = sink_dir
+        self.monitors = []
+        for i, spec in enumerate(monitors):
+            width, height, x, y = (int(v) for v in re.match(r"(\d+)x(\d+)\+(-?\d+)\+(-?\d+)", spec).groups())
+            self.monitors.append(Monitor(x, y, width, height, i == 0))
+        self.applied = 0
+        os.makedirs(sink_dir, exist_ok=True)
+
+    def list_monitors(self):
+        return list(self.monitors)
+
+    def set_wallpaper(self, image_path):
+        shutil.copyfile(image_path, os.path.join(self.sink_dir, "wallpaper" + os.path.splitext(image_path)[1]))
+        self.applied += 1
+
+    def set_spanning_wallpaper(self, image_path):
+        shutil.copyfile(image_path, os.path.join(self.sink_dir, "spanning" + os.path.splitext(image_path)[1]))
+        self.applied += 1
+
+    def set_wallpapers(self, image_paths):
+        for i, image_path in enumerate(image_paths):
+            shutil.copyfile(image_path, os.path.join(self.sink_dir, f"monitor_{i}" + os.path.splitext(image_path)[1]))
+        self.applied += 1
+
+
+def get_backend(settings, sink_dir):
+    """
+    Picks the backend named by the AI_WALLPAPER_BACKEND environment variable
+    or the wallpaper_backend setting, else detects one for this platform.
+    """
+    name = os.environ.get("AI_WALLPAPER_BACKEND") or settings.get("wallpaper_backend", "auto")
+    if name == "auto":
+        if os.name == "nt":
+            name = "windows"
+        elif "GNOME" in os.environ.get("XDG_CURRENT_DESKTOP", "").upper() and shutil.which("gsettings"):
+            name = "gnome"
+        elif os.environ.get("DISPLAY") and shutil.which("feh") and shutil.which("xrandr"):
+            name = "feh"
+        else:
+            name = "file"
+    if name == "windows":
+        return WindowsBackend()
+    if name == "gnome":
+        return GnomeBackend()
+    if name == "feh":
+        return FehBackend()
+    if name == "file":
+        return FileSinkBackend(settings.get("sink_dir") or sink_dir,
+                               settings.get("sink_monitors", ["1920x1080+0+0"]))
+    raise Exception(f"Unknown wallpaper backend '{name}'")
@@ -0,0 +1,186 @@
+# wallpaper_cache.py
+
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+import threading
+import urllib.parse
+from datetime import datetime
+
+INDEX_FILE = "index.json"
+
+
+def generation_params(url):
+    """
+    Extracts the parameters that determine the generated image from a
+    url_builder URL: prompt, width, height, seed and model.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    prompt = urllib.parse.unquote(parsed.path.split("/prompt/", 1)[-1])
+    query = urllib.parse.parse_qs(parsed.query)
+    params = {"prompt": prompt}
+    for name in ("width", "height", "seed", "model"):
+        params[name] = query.get(name, [""])[0]
+    return params
+
+
+def generation_key(prompt, width, height, seed, model):
+    """
+    Canonical identity of a generation: the same key always means the same
+    image, so it addresses the cache and dedupes identical requests.
+    """
+    canonical = "\n".join(str(v) for v in (prompt, width, height, seed, model))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cache_key(url):
+    """Content address for the image a URL would generate."""
+    return generation_key(**generation_params(url))
+
+
+SEED_POLICIES = ("random", "fixed", "time_slot", "prompt_hash")
+
+
+def _hash_seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+
+
+def choose_seed(policy, prompt, fixed_seed=0, slot_minutes=30, when=None):
+    """
+    Seed in the generator's full unsigned 32-bit range.
+
+    random:      a new seed every time.
+    fixed:       always fixed_seed, so a prompt always gives the same image.
+    time_slot:   one seed per slot_minutes-long slot of wall-clock time, so
+                 the wallpaper for any slot (e.g. tomorrow 09:00, passed as
+                 `when`) can be generated ahead of time.
+    prompt_hash: derived from the prompt, so repeated prompts are cache hits.
+    """
+    if policy == "fixed":
+        return int(fixed_seed) & 0xFFFFFFFF
+    if policy == "time_slot":
+        # Slots follow local wall-clock time, so daily slots start at midnight
+        wall_clock = (when or datetime.now()).replace(tzinfo=None) - datetime(1970, 1, 1)
+        slot = int(wall_clock.total_seconds()) // (max(1, int(slot_minutes)) * 60)
+        return _hash_seed(f"slot:{slot}")
+    if policy == "prompt_hash":
+        return _hash_seed(f"prompt:{prompt}")
+    return random.getrandbits(32)
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache of generated wallpapers.
+
+    Images are stored under their cache_key in `directory` and tracked in
+    index.json. When the total size exceeds max_bytes, the least recently
+    used images are evicted. Hit/miss/eviction counters are kept in the
+    index so the budget can be tuned across runs.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # --- Persistence ---
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), "r") as f:
+                data = json.load(f)
+            self._stats.update(data.get("stats", {}))
+            for key, entry in data.get("entries", {}).items():
+                if os.path.isfile(os.path.join(self.directory, entry["file"])):
+                    self._entries[key] = entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading image cache index: {e}")
+
+    def _save_index(self):
+        try:
+            tmp_path = self._index_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"stats": self._stats, "entries": self._entries}, f, indent=4)
+            os.replace(tmp_path, self._index_path())
+        except Exception as e:
+            print(f"Error saving image cache index: {e}")
+
+    # --- Public API ---
+    def get(self, key, dest_path):
+        """Copies the cached image for key to dest_path. Returns True on a hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                try:
+                    # Copy then rename, so dest_path is never left half-written
+                    shutil.copyfile(os.path.join(self.directory, entry["file"]), dest_path + ".part")
+                    os.replace(dest_path + ".part", dest_path)
+                    entry["last_used"] = time.time()
+                    self._stats["hits"] += 1
+                    self._save_index()
+                    return True
+                except OSError as e:
+                    print(f"Cached image unusable: {e}")
+                    del self._entries[key]
+            self._stats["misses"] += 1
+            self._save_index()
+            return False
+
+    def put(self, key, src_path, prompt=""):
+        """Stores a copy of src_path under key and evicts down to the byte budget."""
+        name = key + os.path.splitext(src_path)[1]
+        cached_path = os.path.join(self.directory, name)
+        with self._lock:
+            if os.path.exists(cached_path):
+                os.remove(cached_path)
+            try:
+                # A hard link costs no copy; src_path is only ever replaced, never rewritten
+                os.link(src_path, cached_path)
+            except OSError:
+                shutil.copyfile(src_path, cached_path)
+            now = time.time()
+            self._entries[key] = {
+                "file": name,
+                "prompt": prompt,
+                "size": os.path.getsize(src_path),
+                "created": now,
+                "last_used": now,
+            }
+            self._evict()
+            self._save_index()
+
+    def recent(self, limit=20):
+        """Most recently used entries as (key, entry) pairs, newest first."""
+        with self._lock:
+            items = sorted(self._entries.items(), key=lambda kv: kv[1]["last_used"], reverse=True)
+            return [(key, dict(entry)) for key, entry in items[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats,
+                        entries=len(self._entries),
+                        bytes=sum(e["size"] for e in self._entries.values()))
+
+    def _evict(self):
+        total = sum(e["size"] for e in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._entries[key]
+            self._stats["evictions"] += 1
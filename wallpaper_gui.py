@@ -1,8 +1,4 @@
-import os
-import sys
-import json
-import time
-import random
+import queue
 import threading
 from datetime import datetime
 
@@ -10,38 +6,17 @@ import tkinter as tk
 from tkinter import ttk
 
 
-from PIL import Image
-
-
 from wallpaper_utils import (
-    get_screen_resolution, url_builder, download_image, set_wallpaper,
-    load_settings, save_settings, update_next_refresh_file
+    STYLES, DESCRIPTORS, IPC_FILE, WallpaperEngine, get_history_store, get_metrics, get_resource_path,
+    load_settings, update_settings
 )
+from wallpaper_ipc import IpcClient
+from wallpaper_metrics import describe_refresh
 
-# --- Resource path logic for data files ---
-def get_appdata_dir():
-    # Use %APPDATA%/AI Wallpaper App for user data
-    if os.name == 'nt':
-        base = os.environ.get('APPDATA', os.path.expanduser('~'))
-    else:
-        base = os.path.expanduser('~')
-    appdata_dir = os.path.join(base, 'AI Wallpaper App')
-    if not os.path.exists(appdata_dir):
-        os.makedirs(appdata_dir, exist_ok=True)
-    return appdata_dir
-
-def get_resource_path(filename, user_data=False):
-    """
-    If user_data=True, returns path in user-writable appdata dir.
-    Otherwise, returns path to resource in install dir (for static files like prompts.json).
-    """
-    if user_data:
-        return os.path.join(get_appdata_dir(), filename)
-    if hasattr(sys, '_MEIPASS'):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(base_path, filename)
+# How long the prompt and choices must stay unchanged before generating speculatively
+SPECULATE_DELAY_MS = 1000
+# How often a GUI running its own auto-refresh checks whether the tray has started
+HANDOVER_CHECK_MS = 30000
 
 class WallpaperApp:
     def __init__(self, root):
@@ -49,6 +24,24 @@ class WallpaperApp:
         self.root.title("AI Wallpaper Generator")
         self.auto_refresh_enabled = False
 
+        # BACKGROUND GENERATION STATE
+        # Only one generation runs at a time; its cancel event identifies it
+        self.cancel_event = None
+        self.results = queue.Queue()
+        self.poll_id = None
+        # Results of other background calls, as (callback, result) for the Tk thread
+        self.tasks = queue.Queue()
+        self.pending_tasks = 0
+        self.tasks_poll_id = None
+        # Pending debounced speculative generation, as a Tk after() id
+        self.speculate_id = None
+
+        # The tray process owns the generation engine; the GUI is a client of it
+        # and only runs an engine of its own when the tray isn't running
+        self.service = IpcClient(get_resource_path(IPC_FILE, user_data=True))
+        self.engine = None
+        self.engine_lock = threading.Lock()
+
         # SET WINDOW SIZE
         self.root.geometry("600x580")
         self.root.minsize(500, 500)
@@ -59,17 +52,8 @@ class WallpaperApp:
         self.font_family = "Segoe UI Variable Text"
 
         # STYLES AND DESCRIPTORS
-        self.styles = ["Random", "neon", "synthwave", "dreamy", "fantasy", "cyberpunk", "lowpoly", 
-        "oil painting", "sketch", "vaporwave", "retrofuturism", "dark fantasy", "anime-style", 
-        "pixel art", "photorealistic", "watercolor", "line art", "glitchcore", "minimalist", 
-        "steampunk", "gothic", "concept art", "dreamcore", "hyperrealism", "mosaic"
-    ]
-        self.descriptors = ["Random", "dusk", "sunset", "fog", "crystals", "city", "galaxy", "alien landscape", 
-        "northern lights", "celestial", "rainy streets", "underwater world", "volcanic eruption", 
-        "frozen tundra", "overgrown ruins", "infinite void", "parallel universe", "bioluminescence", 
-        "mystic forest", "lunar surface", "haunted valley", "utopia", "dystopia", "time-lapse sky", 
-        "electric storm", "floating islands", "neon jungle", "mirror dimension", "sacred temple"
-        ]
+        self.styles = STYLES
+        self.descriptors = DESCRIPTORS
 
         self.selected_style = tk.StringVar()
         self.selected_descriptor = tk.StringVar()
@@ -77,11 +61,9 @@ class WallpaperApp:
         self.interval_var = tk.IntVar(value=30)
         self.selected_category = tk.StringVar()
         self.prompt_entry = ttk.Entry(root, width=50)
-        self.prompts_data = self.load_prompts()
-
-        self.category_list = ["Random"] + sorted(list(self.prompts_data.keys()))
-        if self.category_list:
-            self.selected_category.set(self.category_list[0])
+        # Filled in once the tray answers
+        self.category_list = ["Random"]
+        self.selected_category.set(self.category_list[0])
 
         self.load_previous_settings()
         self.setup_gui()
@@ -89,10 +71,12 @@ class WallpaperApp:
         self.root.after(500, self.check_show_window_flag)
         self.root.protocol("WM_DELETE_WINDOW", self.hide_window)
         # self.root.withdraw()  # Only withdraw if running from tray, not on direct launch
+        self.root.after(HANDOVER_CHECK_MS, self.check_handover)
+        self.in_background(self.load_categories, self.show_categories)
         self.check_and_refresh_on_launch()
         if self.auto_refresh_enabled:
             self.status_var.set("Auto-refresh resumed.")
-            threading.Thread(target=self.auto_refresh_loop, daemon=True).start()
+            self.in_background(self.ensure_auto_refresh)
 
     def check_show_window_flag(self):
         if self.show_window_flag:
@@ -100,13 +84,62 @@ class WallpaperApp:
             self.show_window_flag = False
         self.root.after(500, self.check_show_window_flag)
 
-    def load_prompts(self):
+    def in_background(self, func, on_done=None):
+        """
+        Runs func on a worker thread, so IPC calls and the settings file lock
+        never stall the Tk event loop. on_done, if given, is then called on
+        the Tk thread with func's result, or the exception it raised.
+        Call from the Tk thread.
+        """
+        def worker():
+            try:
+                result = func()
+            except Exception as e:
+                result = e
+            if on_done is not None:
+                self.tasks.put((on_done, result))
+
+        if on_done is not None:
+            # Polled only while a callback is outstanding, so an idle window never wakes
+            self.pending_tasks += 1
+            if self.tasks_poll_id is None:
+                self.tasks_poll_id = self.root.after(100, self.poll_tasks)
+        threading.Thread(target=worker, daemon=True).start()
+
+    def poll_tasks(self):
+        while True:
+            try:
+                on_done, result = self.tasks.get_nowait()
+            except queue.Empty:
+                break
+            self.pending_tasks -= 1
+            on_done(result)
+        if self.pending_tasks:
+            self.tasks_poll_id = self.root.after(100, self.poll_tasks)
+        else:
+            self.tasks_poll_id = None
+
+    def get_engine(self):
+        """Local engine, used only while the tray process isn't running."""
+        # Called from worker threads
+        with self.engine_lock:
+            if self.engine is None:
+                self.engine = WallpaperEngine()
+            return self.engine
+
+    def load_categories(self):
         try:
-            with open(get_resource_path("prompts.json"), "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            self.status_var.set(f"Failed to load prompts.json: {e}")
-            return {}
+            return self.service.request("categories", timeout=2)["categories"]
+        except ConnectionError:
+            # Only without a tray: a second engine would compete for its queue
+            return self.get_engine().categories()
+
+    def show_categories(self, categories):
+        if isinstance(categories, Exception):
+            print(f"Could not load categories: {categories}")
+            return
+        self.category_list = ["Random"] + categories
+        self.category_dropdown.configure(values=self.category_list)
 
     def load_previous_settings(self):
         settings = self.load_settings()
@@ -116,47 +149,49 @@ class WallpaperApp:
         self.interval_var.set(settings.get("interval_minutes", 30))
         self.auto_refresh_enabled = settings.get("auto_refresh_enabled", False)
 
-    def save_current_settings(self):
-        settings = self.load_settings()
-        settings.update({
+    def current_settings(self):
+        """The choices made in the window, as settings. Reads Tk variables, so Tk thread only."""
+        return {
             "selected_style": self.selected_style.get(),
             "selected_descriptor": self.selected_descriptor.get(),
             "selected_category": self.selected_category.get(),
             "interval_minutes": self.interval_var.get(),
             "auto_refresh_enabled": self.auto_refresh_enabled
-        })
-        self.save_settings(settings)
+        }
 
-    def load_settings(self):
-        try:
-            settings_path = get_resource_path("settings.json", user_data=True)
-            if os.path.exists(settings_path):
-                with open(settings_path, "r") as f:
-                    return json.load(f)
-        except Exception as e:
-            self.status_var.set(f"Error loading settings: {e}")
-        return {}
+    def save_current_settings(self, changes):
+        # Merge under the settings lock so fields written by the tray process survive.
+        # Takes the cross-process file lock: call from a worker thread.
+        update_settings(changes)
 
-    def save_settings(self, data):
-        try:
-            settings_path = get_resource_path("settings.json", user_data=True)
-            with open(settings_path, "w") as f:
-                json.dump(data, f, indent=4)
-        except Exception as e:
-            self.status_var.set(f"Error saving settings: {e}")
+    def load_settings(self):
+        return load_settings()
 
     def check_and_refresh_on_launch(self):
-        try:
-            settings = load_settings()
-            next_time_str = settings.get("next_update_time")
-            if next_time_str:
-                next_time = datetime.strptime(next_time_str, "%Y-%m-%d %H:%M:%S")
-                if datetime.now() >= next_time:
-                    self.run(force_time=next_time)
-                    return
-            self.status_var.set(f"Ready. Next update: {next_time_str}")
-        except Exception as e:
-            self.status_var.set(f"Ready (Check failed): {e}")
+        self.in_background(self.launch_check, self.finish_launch_check)
+
+    def launch_check(self):
+        """Returns (time of an overdue refresh to run now or None, status message)."""
+        settings = load_settings()
+        next_time_str = settings.get("next_update_time")
+        if self.service.is_running():
+            # The tray's scheduler catches up on an overdue refresh by itself
+            return None, self.with_last_refresh(f"Ready. Next update: {next_time_str}")
+        if next_time_str:
+            next_time = datetime.strptime(next_time_str, "%Y-%m-%d %H:%M:%S")
+            if datetime.now() >= next_time:
+                return next_time, None
+        return None, self.with_last_refresh(f"Ready. Next update: {next_time_str}")
+
+    def finish_launch_check(self, result):
+        if isinstance(result, Exception):
+            self.status_var.set(f"Ready (Check failed): {result}")
+            return
+        force_time, message = result
+        if force_time is not None:
+            self.run(force_time=force_time)
+        else:
+            self.status_var.set(message)
 
     def setup_gui(self):
         style = ttk.Style()
@@ -187,79 +222,275 @@ class WallpaperApp:
         ttk.Entry(frame, textvariable=self.interval_var, font=(self.font_family, 11), width=10).pack(pady=(0, 10))
 
         ttk.Button(frame, text="Generate Wallpaper", command=self.run).pack(pady=5)
+        self.cancel_button = ttk.Button(frame, text="Cancel", command=self.cancel_generation, state="disabled")
+        self.cancel_button.pack(pady=5)
         ttk.Button(frame, text="Toggle Auto-Refresh", command=self.toggle_auto_refresh).pack(pady=5)
+        ttk.Button(frame, text="History", command=self.open_history).pack(pady=5)
+
+        self.progress = ttk.Progressbar(frame, mode="indeterminate", length=250)
+        self.progress.pack(pady=(10, 0))
 
         self.status_label = ttk.Label(frame, textvariable=self.status_var, font=(self.font_family, 10))
         self.status_label.pack(pady=15)
 
-    def build_prompt(self):
-        user_prompt = self.prompt_entry.get().strip()
-
-        style = self.selected_style.get()
-        if style == "Random":
-            style = random.choice(self.styles[1:])
-
-        desc = self.selected_descriptor.get()
-        if desc == "Random":
-            desc = random.choice(self.descriptors[1:])
+        # Start generating in the background once the choices stop changing
+        self.prompt_entry.bind("<KeyRelease>", self.schedule_speculation)
+        for var in (self.selected_category, self.selected_style, self.selected_descriptor):
+            var.trace_add("write", self.schedule_speculation)
+
+    def schedule_speculation(self, *args):
+        """Debounces edits: speculates once the inputs have been unchanged for SPECULATE_DELAY_MS."""
+        if self.speculate_id is not None:
+            self.root.after_cancel(self.speculate_id)
+        self.speculate_id = self.root.after(SPECULATE_DELAY_MS, self.speculate)
+
+    def speculate(self):
+        self.speculate_id = None
+        if self.cancel_event is not None:
+            return  # A real generation is running
+        selections = {
+            "last_prompt": self.prompt_entry.get().strip(),
+            "selected_category": self.selected_category.get(),
+            "selected_style": self.selected_style.get(),
+            "selected_descriptor": self.selected_descriptor.get(),
+        }
+        threading.Thread(target=self.speculate_worker, args=(selections,), daemon=True).start()
 
-        if user_prompt:
-            return f"{user_prompt}, {desc}, {style} art"
-        else:
+    def speculate_worker(self, selections):
+        try:
             try:
-                category = self.selected_category.get()
-                if category == "Random":
-                    valid_categories = list(self.prompts_data.keys())
-                    if valid_categories:
-                        category = random.choice(valid_categories)
-                    else:
-                        return f"surreal nature, {desc}, {style} art"
-                prompts = self.prompts_data.get(category, [])
-                if prompts:
-                    return random.choice(prompts)
-                else:
-                    return f"unknown dreamscape, {desc}, {style} art"
-            except Exception as e:
-                self.status_var.set(f"Prompt error: {e}")
-                return f"surreal nature, {desc}, {style} art"
+                self.service.request("speculate", timeout=5, selections=selections)
+            except ConnectionError:
+                self.get_engine().speculate(selections)
+        except Exception as e:
+            print(f"Speculative generation not started: {e}")
 
     def run(self, force_time=None):
+        """
+        Starts generating a wallpaper on a worker thread so the Tk event loop
+        never waits on the network. Overlapping requests are ignored.
+        """
+        if self.cancel_event is not None:
+            self.status_var.set("Already generating, please wait...")
+            return
         try:
-            self.save_current_settings()
-            prompt = self.build_prompt()
-            width, height = get_screen_resolution()
-            url = url_builder(prompt, width, height)
-            image_path = download_image(url)
-            set_wallpaper(image_path)
-            self.status_var.set("Wallpaper updated successfully.")
-            update_next_refresh_file(self.interval_var.get(), base_time=force_time or datetime.now())
+            changes = self.current_settings()
+            user_prompt = self.prompt_entry.get().strip()
         except Exception as e:
             self.status_var.set(str(e))
+            return
+        self.cancel_event = threading.Event()
+        threading.Thread(
+            target=self.generate_worker, args=(changes, user_prompt, force_time, self.cancel_event), daemon=True
+        ).start()
+        self.status_var.set("Generating wallpaper...")
+        self.progress.start(15)
+        self.cancel_button.state(["!disabled"])
+        if self.poll_id is None:
+            self.poll_id = self.root.after(100, self.poll_results)
+
+    def generate_worker(self, changes, user_prompt, force_time, cancel_event):
+        # Runs off the Tk thread: only talk to the GUI through self.results
+        last_reported = [0]
+
+        def report_progress(done, total):
+            if done - last_reported[0] >= 256 * 1024 or done == total:
+                last_reported[0] = done
+                self.results.put((cancel_event, "progress", (done, total)))
+
+        try:
+            # The engine generates from the saved settings
+            self.save_current_settings(changes)
+            try:
+                self.service.request("generate", on_progress=report_progress, user_prompt=user_prompt)
+            except ConnectionError:
+                self.get_engine().generate_now(user_prompt, force_time, progress=report_progress)
+            self.results.put((cancel_event, "done", self.with_last_refresh("Wallpaper updated successfully.")))
+        except Exception as e:
+            self.results.put((cancel_event, "done", str(e)))
+
+    def poll_results(self):
+        while True:
+            try:
+                job, kind, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job is not self.cancel_event:
+                continue  # Left over from a cancelled generation
+            if kind == "progress":
+                done, total = value
+                text = f"Downloading... {done / (1024 * 1024):.1f} MB"
+                if total:
+                    text += f" of {total / (1024 * 1024):.1f} MB"
+                self.status_var.set(text)
+            else:
+                self.finish_generation(value)
+        if self.cancel_event is not None:
+            self.poll_id = self.root.after(100, self.poll_results)
+        else:
+            self.poll_id = None
+
+    def cancel_generation(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            threading.Thread(target=self.cancel_worker, daemon=True).start()
+            self.finish_generation("Generation cancelled.")
+
+    def cancel_worker(self):
+        try:
+            self.service.request("cancel", timeout=2)
+        except Exception:
+            if self.engine is not None:
+                self.engine.cancel()
+
+    def finish_generation(self, message):
+        self.cancel_event = None
+        self.progress.stop()
+        self.cancel_button.state(["disabled"])
+        self.status_var.set(message)
+
+    def with_last_refresh(self, message):
+        """message followed by the timing of the last refresh, from the metrics log."""
+        try:
+            summary = describe_refresh(get_metrics().last("refresh"))
+        except Exception:
+            summary = ""
+        return f"{message}\n{summary}" if summary else message
 
     def toggle_auto_refresh(self):
-        self.auto_refresh_enabled = not self.auto_refresh_enabled
+        try:
+            changes = dict(self.current_settings(), auto_refresh_enabled=not self.auto_refresh_enabled)
+        except Exception as e:
+            self.status_var.set(str(e))
+            return
+        self.auto_refresh_enabled = changes["auto_refresh_enabled"]
+
+        def worker():
+            # The scheduler picks the change up from settings.json
+            self.save_current_settings(changes)
+            if changes["auto_refresh_enabled"]:
+                self.ensure_auto_refresh()
+
+        self.in_background(worker)
         if self.auto_refresh_enabled:
             self.status_var.set("Auto-refresh started.")
-            threading.Thread(target=self.auto_refresh_loop, daemon=True).start()
         else:
             self.status_var.set("Auto-refresh stopped.")
-        self.save_current_settings()
 
-    def auto_refresh_loop(self):
-        while self.auto_refresh_enabled:
-            self.run()
-            interval_sec = self.interval_var.get() * 60
-            for _ in range(interval_sec):
-                if not self.auto_refresh_enabled:
-                    return
-                time.sleep(1)
+    def ensure_auto_refresh(self):
+        # Worker thread only: pings the tray
+        if not self.service.is_running():
+            self.get_engine().start()
+
+    def check_handover(self):
+        # A tray started after this window takes over the auto-refresh, so
+        # there is never more than one scheduler generating per interval
+        if self.engine is not None and self.engine.running:
+            self.in_background(self.hand_over, self.finish_handover)
+        self.root.after(HANDOVER_CHECK_MS, self.check_handover)
+
+    def hand_over(self):
+        """Stops the local engine's auto-refresh if the tray is running. Returns whether it did."""
+        if not self.service.is_running():
+            return False
+        self.engine.stop()
+        return True
+
+    def finish_handover(self, handed_over):
+        if handed_over is True:
+            self.status_var.set("Auto-refresh handed over to the tray.")
+
+    def open_history(self):
+        HistoryGallery(self)
+
+    def apply_history_worker(self, entry_id, results):
+        try:
+            try:
+                prompt = self.service.request("apply_history", timeout=30, id=entry_id)["prompt"]
+            except ConnectionError:
+                prompt = self.get_engine().apply_history(entry_id)
+            results.put(f"Applied: {prompt}")
+        except Exception as e:
+            results.put(str(e))
 
     def hide_window(self):
         self.root.withdraw()
 
 
 
+class HistoryGallery:
+    """
+    Scrollable grid of earlier wallpapers. Shows the pre-rendered PNG
+    thumbnails from the history store, a page at a time, and re-applies the
+    full image on click without any network access.
+    """
+
+    COLUMNS = 3
+    PAGE_SIZE = 24
+
+    def __init__(self, app):
+        self.app = app
+        self.history = get_history_store()
+        self.images = []  # PhotoImages must stay referenced or Tk drops them
+        self.loaded = 0
+        self.results = queue.Queue()
+
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Wallpaper History")
+        self.window.geometry("1060x620")
+        self.status_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.status_var, font=(app.font_family, 10)).pack(side="bottom", fill="x")
+        self.canvas = tk.Canvas(self.window, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self.window, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.grid = ttk.Frame(self.canvas, padding=10)
+        self.canvas.create_window((0, 0), window=self.grid, anchor="nw")
+        self.grid.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        self.window.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(-e.delta // 120, "units"))
+        self.more_button = ttk.Button(self.grid, text="Load more", command=self.load_page)
+        self.load_page()
+
+    def load_page(self):
+        entries = self.history.entries(limit=self.PAGE_SIZE, offset=self.loaded)
+        for entry in entries:
+            row, column = divmod(self.loaded, self.COLUMNS)
+            cell = ttk.Frame(self.grid, padding=5)
+            cell.grid(row=row, column=column, sticky="n")
+            image = None
+            if entry["thumbnail"]:
+                try:
+                    image = tk.PhotoImage(file=entry["thumbnail"])
+                    self.images.append(image)
+                except tk.TclError:
+                    pass
+            ttk.Button(cell, image=image, text="" if image else entry["prompt"][:40],
+                       command=lambda entry_id=entry["id"]: self.apply(entry_id)).pack()
+            ttk.Label(cell, text=entry["created"], font=(self.app.font_family, 9), padding=2).pack()
+            self.loaded += 1
+        self.more_button.grid_forget()
+        if len(entries) == self.PAGE_SIZE:
+            self.more_button.grid(row=self.loaded // self.COLUMNS + 1, column=0, columnspan=self.COLUMNS, pady=10)
+        if not self.loaded:
+            self.status_var.set("No wallpapers yet.")
+
+    def apply(self, entry_id):
+        self.status_var.set("Applying...")
+        threading.Thread(target=self.app.apply_history_worker, args=(entry_id, self.results), daemon=True).start()
+        self.window.after(100, self.poll_results)
+
+    def poll_results(self):
+        try:
+            self.status_var.set(self.results.get_nowait())
+        except queue.Empty:
+            self.window.after(100, self.poll_results)
+
+
 if __name__ == "__main__":
+    import multiprocessing
+    # Post-processing workers re-launch this executable when frozen
+    multiprocessing.freeze_support()
     import tkinter as tk
     app = tk.Tk()
     WallpaperApp(app)
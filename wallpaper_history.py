@@ -0,0 +1,147 @@
+# wallpaper_history.py
+
+import os
+import json
+import shutil
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+DB_FILE = "history.db"
+IMAGES_DIR = "images"
+THUMBS_DIR = "thumbs"
+# PNG so the GUI can show thumbnails with plain tk.PhotoImage
+THUMB_SIZE = (320, 180)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallpapers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    last_applied REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    seed INTEGER,
+    width INTEGER,
+    height INTEGER,
+    source TEXT,
+    path TEXT NOT NULL,
+    thumbnail TEXT,
+    bytes INTEGER NOT NULL,
+    details TEXT
+)
+"""
+
+
+def make_thumbnail(src_path, dest_path, size=THUMB_SIZE):
+    """Writes a PNG thumbnail of src_path that fits in size."""
+    from PIL import Image
+
+    with Image.open(src_path) as img:
+        # JPEG sources decode straight at 1/2, 1/4 or 1/8 scale
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        # reducing_gap box-reduces by an integer factor before the final resample
+        img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        img.save(dest_path + ".part", "PNG")
+    os.replace(dest_path + ".part", dest_path)
+
+
+class HistoryStore:
+    """
+    SQLite record of every applied wallpaper, with a kept copy of the image
+    and a pre-rendered thumbnail, so earlier wallpapers can be browsed and
+    re-applied without the network.
+
+    Images are hard-linked from the applied file where possible (the
+    pipeline always replaces that file rather than rewriting it, so the link
+    keeps the old contents). The oldest entries are removed beyond
+    max_entries or max_bytes.
+    """
+
+    def __init__(self, directory, max_entries=200, max_bytes=1000 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(directory, DB_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, IMAGES_DIR), exist_ok=True)
+        os.makedirs(os.path.join(directory, THUMBS_DIR), exist_ok=True)
+        with self._connect() as db:
+            # WAL lets the GUI read while the tray process writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _to_dict(row):
+        entry = dict(row)
+        entry["details"] = json.loads(entry["details"] or "{}")
+        return entry
+
+    def record(self, image_path, prompt, seed=None, width=None, height=None, source="generated", details=None):
+        """Keeps a copy of image_path as a new history entry. Returns its id."""
+        with self._lock, self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO wallpapers (created, last_applied, prompt, seed, width, height, source, path, bytes, details)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, '', 0, ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), time.time(), prompt, seed, width, height, source,
+                 json.dumps(details or {}))
+            )
+            entry_id = cursor.lastrowid
+            name = f"{entry_id}{os.path.splitext(image_path)[1]}"
+            path = os.path.join(self.directory, IMAGES_DIR, name)
+            try:
+                os.link(image_path, path)
+            except OSError:
+                shutil.copyfile(image_path, path)
+            thumbnail = os.path.join(self.directory, THUMBS_DIR, f"{entry_id}.png")
+            try:
+                make_thumbnail(path, thumbnail)
+            except Exception as e:
+                print(f"Thumbnail failed: {e}")
+                thumbnail = None
+            db.execute("UPDATE wallpapers SET path = ?, thumbnail = ?, bytes = ? WHERE id = ?",
+                       (path, thumbnail, os.path.getsize(path), entry_id))
+            self._evict(db)
+        return entry_id
+
+    def entries(self, limit=50, offset=0):
+        """History entries as dicts, most recently applied first."""
+        with self._connect() as db:
+            rows = db.execute("SELECT * FROM wallpapers ORDER BY last_applied DESC, id DESC LIMIT ? OFFSET ?",
+                              (limit, offset)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, entry_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM wallpapers WHERE id = ?", (entry_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def touch(self, entry_id):
+        """Marks an entry as just re-applied."""
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE wallpapers SET last_applied = ? WHERE id = ?", (time.time(), entry_id))
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM wallpapers").fetchone()[0]
+
+    def _evict(self, db):
+        rows = db.execute("SELECT id, path, thumbnail, bytes FROM wallpapers ORDER BY last_applied DESC, id DESC").fetchall()
+        total = 0
+        for i, row in enumerate(rows):
+            total += row["bytes"]
+            # Always keep the newest entry, even if it alone is over budget
+            if i == 0 or (i < self.max_entries and total <= self.max_bytes):
+                continue
+            for path in (row["path"], row["thumbnail"]):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            db.execute("DELETE FROM wallpapers WHERE id = ?", (row["id"],))
@@ -0,0 +1,130 @@
+# wallpaper_ipc.py
+
+import os
+import json
+import socket
+import secrets
+import threading
+import socketserver
+
+
+class IpcServer:
+    """
+    Local channel through which the GUI drives the tray process's engine.
+
+    Listens on 127.0.0.1 on a free port. The port and a random token are
+    published in port_file; requests without the token are rejected. Each
+    connection carries one JSON request line and gets JSON lines back:
+    optional {"progress": [done, total]} updates, then the final reply.
+    """
+
+    def __init__(self, engine, port_file):
+        self.engine = engine
+        self.port_file = port_file
+        self.token = secrets.token_hex(16)
+        self._server = None
+
+    def start(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def send(message):
+                    self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+                try:
+                    request = json.loads(self.rfile.readline().decode("utf-8"))
+                    if request.get("token") != server.token:
+                        send({"ok": False, "error": "Invalid token"})
+                        return
+                    send(server.handle(request, lambda done, total: send({"progress": [done, total]})))
+                except Exception as e:
+                    try:
+                        send({"ok": False, "error": str(e)})
+                    except OSError:
+                        pass
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        tmp_path = self.port_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"port": self._server.server_address[1], "token": self.token, "pid": os.getpid()}, f)
+        os.replace(tmp_path, self.port_file)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            try:
+                os.remove(self.port_file)
+            except OSError:
+                pass
+
+    def handle(self, request, progress):
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command == "categories":
+            return {"ok": True, "categories": self.engine.categories()}
+        if command == "generate":
+            prompt = self.engine.generate_now(request.get("user_prompt", ""), progress=progress)
+            return {"ok": True, "prompt": prompt}
+        if command == "apply_history":
+            prompt = self.engine.apply_history(int(request["id"]))
+            return {"ok": True, "prompt": prompt}
+        if command == "speculate":
+            return {"ok": True, "started": self.engine.speculate(request.get("selections", {}))}
+        if command == "metrics":
+            return {"ok": True, "metrics": self.engine.metrics()}
+        if command == "cancel":
+            self.engine.cancel()
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown command '{command}'"}
+
+
+class IpcClient:
+    """Talks to the IpcServer of a running tray process."""
+
+    def __init__(self, port_file):
+        self.port_file = port_file
+
+    def request(self, command, on_progress=None, timeout=None, **params):
+        """
+        Sends one command and returns the reply dict.
+        Raises ConnectionError if the tray process isn't reachable and
+        Exception with the server's message if the command failed.
+        """
+        try:
+            with open(self.port_file, "r") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            raise ConnectionError("Wallpaper service is not running")
+        try:
+            sock = socket.create_connection(("127.0.0.1", info["port"]), timeout=2)
+        except OSError:
+            raise ConnectionError("Wallpaper service is not running")
+        with sock:
+            sock.settimeout(timeout)
+            request = dict(params, command=command, token=info.get("token"))
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("r", encoding="utf-8") as reader:
+                for line in reader:
+                    message = json.loads(line)
+                    if "progress" in message:
+                        if on_progress is not None:
+                            on_progress(*message["progress"])
+                        continue
+                    if not message.get("ok"):
+                        raise Exception(message.get("error", "Request failed"))
+                    return message
+        raise ConnectionError("Wallpaper service closed the connection")
+
+    def is_running(self):
+        try:
+            self.request("ping", timeout=2)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,228 @@
+# wallpaper_metrics.py
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+# Upper bounds of the duration histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000)
+
+
+class Span:
+    """One timed stage. Attributes set on it (bytes, status code...) end up in the log."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.status = "ok"
+        self.error = None
+        self.start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin):
+        return dict(self.attrs, name=self.name, start_ms=round((self.start - origin) * 1000, 1),
+                    duration_ms=self.duration_ms, status=self.status,
+                    **({"error": self.error} if self.error else {}))
+
+
+class Histogram:
+    def __init__(self, bounds=HISTOGRAM_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the last one)."""
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= q * self.count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return None
+
+    def to_dict(self):
+        return {"count": self.count, "sum_ms": round(self.total, 1), "max_ms": round(self.max, 1),
+                "p50_ms": self.quantile(0.5), "p95_ms": self.quantile(0.95),
+                "buckets": dict(zip([str(b) for b in self.bounds] + ["inf"], self.buckets))}
+
+
+class Metrics:
+    """
+    Spans, counters and duration histograms for the generation pipeline.
+
+    span() times a stage; stages run inside a trace() (one refresh, one
+    prefetch...) are collected into it, and each finished trace is appended
+    as a JSON line to log_path, which is rotated at max_bytes keeping
+    `backups` old files. Every span also feeds the "<name>_ms" histogram,
+    and every trace the "<name>.ok" or "<name>.error" counter.
+
+    The current trace is per thread; wrap() carries it into worker threads.
+    """
+
+    def __init__(self, log_path=None, max_bytes=1024 * 1024, backups=3):
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.counters = {}
+        self.histograms = {}
+        self._last = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value_ms):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value_ms)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.status, span.error = "error", str(e)
+            raise
+        finally:
+            span.duration_ms = round((time.perf_counter() - span.start) * 1000, 1)
+            self.observe(f"{name}_ms", span.duration_ms)
+            trace = getattr(self._local, "trace", None)
+            if trace is not None:
+                with self._lock:
+                    trace.append(span)
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        root = Span(name, attrs)
+        previous = getattr(self._local, "trace", None)
+        self._local.trace = spans = []
+        try:
+            yield root
+        except BaseException as e:
+            root.status, root.error = "error", str(e)
+            raise
+        finally:
+            self._local.trace = previous
+            root.duration_ms = round((time.perf_counter() - root.start) * 1000, 1)
+            self.observe(f"{name}_ms", root.duration_ms)
+            self.count(f"{name}.{root.status}")
+            record = dict(root.to_dict(root.start), time=datetime.now().isoformat(timespec="seconds"))
+            del record["start_ms"]
+            with self._lock:
+                record["spans"] = [span.to_dict(root.start) for span in sorted(spans, key=lambda s: s.start)]
+                self._last[name] = record
+            self._write(record)
+
+    def wrap(self, func):
+        """func, made to record its spans into the calling thread's current trace."""
+        trace = getattr(self._local, "trace", None)
+
+        def wrapper(*args, **kwargs):
+            previous = getattr(self._local, "trace", None)
+            self._local.trace = trace
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.trace = previous
+
+        return wrapper
+
+    def _write(self, record):
+        if not self.log_path:
+            return
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            try:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Could not write metrics log: {e}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.log_path}.{i}"):
+                os.replace(f"{self.log_path}.{i}", f"{self.log_path}.{i + 1}")
+        if self.backups:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        else:
+            os.remove(self.log_path)
+
+    def last(self, name):
+        """
+        The most recent finished trace called name, as logged. Read back from
+        the log, so it includes traces of other processes (the tray's refreshes
+        when asked from the GUI).
+        """
+        if self.log_path:
+            try:
+                with open(self.log_path, "rb") as f:
+                    f.seek(max(0, os.path.getsize(self.log_path) - 64 * 1024))
+                    lines = f.read().splitlines()
+                for line in reversed(lines):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Partial first line of the tail
+                    if record.get("name") == name:
+                        return record
+            except OSError:
+                pass
+        with self._lock:
+            return self._last.get(name)
+
+    def snapshot(self):
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+                    "last": dict(self._last)}
+
+
+def describe_refresh(record):
+    """Status-line text for a refresh trace, e.g. "Last refresh: 12.3 s (TTFB 11.1 s)"."""
+    if record is None:
+        return ""
+    if record.get("status") != "ok":
+        error = str(record.get("error") or "unknown error")
+        # Download errors carry the whole URL; the status line only has room for the gist
+        return f"Last refresh failed: {error.split(' for url:')[0][:120]}"
+    spans = record.get("spans", [])
+    text = f"Last refresh: {record['duration_ms'] / 1000:.1f} s"
+    ttfbs = [span["ttfb_ms"] for span in spans
+             if span.get("name") == "fetch" and span.get("status") == "ok" and "ttfb_ms" in span]
+    previews = [span["start_ms"] + span["duration_ms"] for span in spans
+                if span.get("name") == "preview" and span.get("applied")]
+    if ttfbs:
+        # The slowest fetch is the full-size image when a preview was fetched too
+        text += f" (TTFB {max(ttfbs) / 1000:.1f} s"
+        text += f", preview after {previews[0] / 1000:.1f} s)" if previews else ")"
+    elif record.get("source") == "prefetch":
+        text += " (prefetched)"
+    elif record.get("source") == "speculative":
+        text += " (generated while you were choosing)"
+    elif any(span.get("cache") == "hit" for span in spans):
+        text += " (cached)"
+    return text
@@ -0,0 +1,103 @@
+# wallpaper_playlists.py
+
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# Which settings a playlist rule may override, by rule key
+RULE_FIELDS = {
+    "category": "selected_category",
+    "style": "selected_style",
+    "descriptor": "selected_descriptor",
+}
+
+# start and end are minutes after midnight; days holds weekday numbers (Monday is 0)
+Rule = namedtuple("Rule", ["start", "end", "days", "overrides"])
+
+# The scheduler asks on every wake-up; parse (and warn) once per distinct setting
+_parsed = (None, [])
+
+
+def _parse_time(text):
+    hours, minutes = str(text).split(":")
+    value = int(hours) * 60 + int(minutes)
+    if not 0 <= value <= 24 * 60:
+        raise ValueError(f"time out of range: {text}")
+    return value
+
+
+def parse_rules(settings):
+    """
+    Rules from the playlists setting, a list such as
+
+        [{"start": "17:00", "end": "20:00", "category": "Sunset & Sky"},
+         {"start": "09:00", "end": "17:00", "days": ["mon", "tue", "wed", "thu", "fri"],
+          "category": "Minimalist", "style": "minimalist"}]
+
+    A rule is active from start until end (past midnight if end is earlier)
+    on the given days, every day by default. While active, its category,
+    style and descriptor replace the selected ones; the first matching rule
+    wins. Invalid rules are skipped.
+    """
+    global _parsed
+    raw_rules = settings.get("playlists") or []
+    key = json.dumps(raw_rules, sort_keys=True)
+    if _parsed[0] == key:
+        return _parsed[1]
+    rules = []
+    for raw in raw_rules:
+        try:
+            days = frozenset(DAYS.index(day[:3].lower()) for day in raw.get("days", DAYS))
+            overrides = {field: raw[key] for key, field in RULE_FIELDS.items() if raw.get(key)}
+            rules.append(Rule(_parse_time(raw["start"]), _parse_time(raw["end"]), days, overrides))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring invalid playlist rule {raw!r}: {e}")
+    _parsed = (key, rules)
+    return rules
+
+
+def _is_active(rule, when):
+    minute = when.hour * 60 + when.minute
+    weekday = when.weekday()
+    if rule.start == rule.end:
+        return weekday in rule.days
+    if rule.start < rule.end:
+        return weekday in rule.days and rule.start <= minute < rule.end
+    # Runs past midnight: the part after midnight belongs to the previous day's rule
+    return ((weekday in rule.days and minute >= rule.start)
+            or ((weekday - 1) % 7 in rule.days and minute < rule.end))
+
+
+def active_overrides(rules, when):
+    for rule in rules:
+        if _is_active(rule, when):
+            return rule.overrides
+    return {}
+
+
+def effective_settings(settings, when=None):
+    """settings with the playlist rule active at `when` (default now) applied."""
+    overrides = active_overrides(parse_rules(settings), when or datetime.now())
+    return dict(settings, **overrides) if overrides else settings
+
+
+def next_boundary(settings, after):
+    """
+    The first time after `after` at which the active playlist overrides
+    change, or None if they never do (no rules) within the next week.
+    """
+    rules = parse_rules(settings)
+    if not rules:
+        return None
+    midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = sorted({midnight + timedelta(days=day, minutes=minute)
+                         for day in range(8)
+                         for rule in rules
+                         for minute in (rule.start, rule.end)})
+    for candidate in candidates:
+        if candidate > after and (active_overrides(rules, candidate)
+                                  != active_overrides(rules, candidate - timedelta(minutes=1))):
+            return candidate
+    return None
@@ -0,0 +1,218 @@
+# wallpaper_postprocess.py
+
+import io
+import os
+import time
+import threading
+
+# File extension for each output format the OS can apply directly
+FORMAT_EXTENSIONS = {"bmp": ".bmp", "png": ".png", "jpeg": ".jpg"}
+
+
+def _smart_crop_box(img, width, height, candidates=7):
+    """
+    Crop box with the target aspect ratio. Along the axis that has to be
+    cropped, the window with the most detail (highest entropy on a small
+    grayscale preview) wins, so subjects aren't cut off blindly at the centre.
+    """
+    src_w, src_h = img.size
+    target_ratio = width / height
+    if abs(src_w / src_h - target_ratio) < 0.01:
+        return 0, 0, src_w, src_h
+    if src_w / src_h > target_ratio:
+        crop_w, crop_h = round(src_h * target_ratio), src_h
+    else:
+        crop_w, crop_h = src_w, round(src_w / target_ratio)
+
+    # reduce() box-averages by an integer factor, far cheaper than a full resample
+    preview = img.reduce(max(1, src_w // 96)).convert("L")
+    scale = preview.width / src_w
+    best_box, best_entropy = None, -1.0
+    for i in range(candidates):
+        left = (src_w - crop_w) * i // (candidates - 1)
+        top = (src_h - crop_h) * i // (candidates - 1)
+        box = (left, top, left + crop_w, top + crop_h)
+        entropy = preview.crop(tuple(round(v * scale) for v in box)).entropy()
+        # Prefer the centre on ties
+        entropy -= abs(i - (candidates - 1) / 2) * 1e-3
+        if entropy > best_entropy:
+            best_box, best_entropy = box, entropy
+    return best_box
+
+
+def _edge_aware_sharpen(img, amount=0.8, radius=1.5, strip_rows=256):
+    """
+    Unsharp mask weighted by local gradient strength, so edges blurred by
+    upscaling get crisper while flat areas (skies, gradients) don't pick up
+    noise. Vectorised with NumPy and run in row strips to bound memory.
+    """
+    import numpy as np
+    from PIL import Image, ImageFilter
+
+    src = np.asarray(img)
+    blurred = np.asarray(img.filter(ImageFilter.GaussianBlur(radius)))
+    out = np.empty_like(src)
+    luma_weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    height = src.shape[0]
+    for top in range(0, height, strip_rows):
+        bottom = min(top + strip_rows, height)
+        # One row of overlap on each side keeps the gradient seamless across strips
+        lo, hi = max(top - 1, 0), min(bottom + 1, height)
+        strip = src[lo:hi].astype(np.float32)
+        luma = strip @ luma_weights
+        grad_y, grad_x = np.gradient(luma)
+        edges = np.hypot(grad_x, grad_y)[top - lo:top - lo + bottom - top]
+        weight = np.clip(edges / 32.0, 0.0, 1.0)[..., None]
+        rows = strip[top - lo:top - lo + bottom - top]
+        detail = rows - blurred[top:bottom]
+        out[top:bottom] = np.clip(rows + amount * weight * detail, 0, 255).astype(np.uint8)
+    return Image.fromarray(out)
+
+
+def _sharpen(img, mode):
+    from PIL import ImageFilter
+
+    if mode == "edge":
+        try:
+            return _edge_aware_sharpen(img)
+        except ImportError:
+            pass  # NumPy is optional; fall back to a plain unsharp mask
+    return img.filter(ImageFilter.UnsharpMask(radius=1.2, percent=60, threshold=2))
+
+
+def fit_to_screen(src_path, dest_path, width, height, sharpen=False, output_format="bmp", resample="lanczos"):
+    """
+    Crops and resizes src_path to exactly width x height and saves it to
+    dest_path in output_format, so the OS can show it without rescaling.
+    sharpen is False, True (unsharp mask) or "edge" (edge-aware, for upscales).
+    Returns a dict of stage timings in milliseconds.
+    Top-level so it can run in a worker process.
+    """
+    from PIL import Image, ImageCms
+
+    timings = {}
+    start = time.perf_counter()
+    img = Image.open(src_path)
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    img.draft("RGB", (width, height))
+    img.load()
+    timings["decode_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    icc_profile = img.info.get("icc_profile")
+    if icc_profile:
+        try:
+            src_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+            img = ImageCms.profileToProfile(img, src_profile, ImageCms.createProfile("sRGB"), outputMode="RGB")
+        except ImageCms.PyCMSError:
+            pass
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    timings["color_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    box = _smart_crop_box(img, width, height)
+    filter_ = Image.Resampling.LANCZOS if resample == "lanczos" else Image.Resampling.BICUBIC
+    img = img.resize((width, height), filter_, box=box)
+    timings["resize_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if sharpen:
+        img = _sharpen(img, sharpen)
+    timings["sharpen_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    tmp_path = dest_path + ".part"
+    save_args = {"quality": 95} if output_format == "jpeg" else {}
+    if output_format == "png":
+        # Favour encode speed over file size; the file only lives on local disk
+        save_args["compress_level"] = 1
+    img.save(tmp_path, output_format.upper(), **save_args)
+    os.replace(tmp_path, dest_path)
+    timings["encode_ms"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def _bounding_box(monitors):
+    left = min(m.x for m in monitors)
+    top = min(m.y for m in monitors)
+    right = max(m.x + m.width for m in monitors)
+    bottom = max(m.y + m.height for m in monitors)
+    return left, top, right, bottom
+
+
+def compose_spanning(part_paths, monitors, dest_path, output_format="bmp"):
+    """
+    Pastes one already-fitted image per monitor into a canvas covering the
+    bounding box of all monitors, so it can be applied as a spanning wallpaper.
+    """
+    from PIL import Image
+
+    left, top, right, bottom = _bounding_box(monitors)
+    canvas = Image.new("RGB", (right - left, bottom - top))
+    for path, monitor in zip(part_paths, monitors):
+        with Image.open(path) as part:
+            canvas.paste(part, (monitor.x - left, monitor.y - top))
+    tmp_path = dest_path + ".part"
+    canvas.save(tmp_path, output_format.upper())
+    os.replace(tmp_path, dest_path)
+
+
+def split_spanning(src_path, monitors, dest_prefix, output_format="bmp"):
+    """
+    Cuts a compose_spanning image back into one file per monitor.
+    Returns the paths, or None if the image doesn't match the monitor layout.
+    """
+    from PIL import Image
+
+    left, top, right, bottom = _bounding_box(monitors)
+    paths = []
+    with Image.open(src_path) as img:
+        if img.size != (right - left, bottom - top):
+            return None
+        for i, m in enumerate(monitors):
+            path = f"{dest_prefix}{i}{FORMAT_EXTENSIONS.get(output_format, '.bmp')}"
+            box = (m.x - left, m.y - top, m.x - left + m.width, m.y - top + m.height)
+            img.crop(box).save(path + ".part", output_format.upper())
+            os.replace(path + ".part", path)
+            paths.append(path)
+    return paths
+
+
+class PostProcessor:
+    """
+    Runs fit_to_screen in a worker process so decoding and resizing a 4K
+    image doesn't compete with the tray or GUI threads for the GIL.
+    Falls back to running in-process if no worker can be started, and
+    runs in-process on purpose with max_workers=0.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def process(self, *args, **kwargs):
+        from concurrent.futures.process import BrokenProcessPool
+
+        if self.max_workers == 0:
+            return fit_to_screen(*args, **kwargs)
+        try:
+            return self._get_pool().submit(fit_to_screen, *args, **kwargs).result()
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            print(f"Post-processing worker unavailable, running in-process: {e}")
+            self.shutdown()
+            return fit_to_screen(*args, **kwargs)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
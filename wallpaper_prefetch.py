@@ -0,0 +1,476 @@
+# wallpaper_prefetch.py
+
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+
+from wallpaper_settings import FileLock
+
+INDEX_FILE = "queue.json"
+LOCK_FILE = "queue.lock"
+OWNER_LOCK_FILE = "owner.lock"
+
+
+def settings_signature(settings):
+    """
+    The subset of settings that decides what a wallpaper looks like.
+    Queued images generated under a different signature are stale.
+    """
+    return [
+        settings.get("last_prompt", "").strip(),
+        settings.get("selected_category", "Random"),
+        settings.get("selected_style", "Random"),
+        settings.get("selected_descriptor", "Random"),
+        settings.get("postprocess_enabled", True),
+        settings.get("postprocess_format", "bmp"),
+        settings.get("postprocess_sharpen", False),
+        settings.get("multi_monitor", "per_monitor"),
+        settings.get("generation_scale", 1.0),
+        settings.get("upscale_sharpen", "edge"),
+        settings.get("seed_policy", "random"),
+        settings.get("seed_value", 0),
+    ]
+
+
+def validate_image(path):
+    """Raises if the file at path is not a complete, decodable image."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.verify()
+
+
+class PrefetchQueue:
+    """
+    Bounded queue of wallpapers that are already downloaded and validated.
+
+    Worker threads keep up to `depth` images on disk ahead of schedule so a
+    refresh tick only has to pop one and apply it. The queue is indexed in
+    queue.json inside `directory`, so it survives restarts of the tray process.
+
+    Only one process uses the directory at a time: a queue takes a lock on
+    it while enabled (or popping) and loads the index then, so the engine of
+    a GUI started next to the tray neither deletes the tray's downloads nor
+    overwrites its index. A queue that can't get the lock stays idle and
+    tries again on the next configure().
+
+    :param directory: Folder holding the queued images and the index file.
+    :param produce: Function (out_path, settings) -> (prompt, info) that
+                    generates and downloads one wallpaper to out_path, raising
+                    on failure. info is a JSON-serialisable dict kept with it.
+    :param throttle: Optional function (settings) -> str or None, checked
+                     before every download: while it gives a reason (user
+                     away, on battery...), nothing is prefetched. It is only
+                     re-checked on resume() or configure(), so a long
+                     throttle costs no wake-ups; the engine resumes the queue
+                     when its scheduler sees the throttle lift.
+    """
+
+    def __init__(self, directory, produce, depth=2, workers=1, max_bytes=200 * 1024 * 1024, throttle=None):
+        self.directory = directory
+        self.produce = produce
+        self.throttle = throttle
+        # Why prefetching is currently held back, if it is
+        self.throttled = None
+        self.depth = depth
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._entries = []
+        # Settings to keep images queued for: the current ones, then the next playlist slot's
+        self._targets = []
+        self._enabled = False
+        self._in_flight = []  # Signatures of the images being generated
+        self._failures = 0
+        self._threads = []
+        self._stopped = False
+        self._dir_lock = FileLock(os.path.join(directory, LOCK_FILE))
+        self._owner = False
+        os.makedirs(directory, exist_ok=True)
+
+    # --- Persistence ---
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        entries = []
+        try:
+            with open(self._index_path(), "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading prefetch queue: {e}")
+        self._entries = []
+        known = set()
+        for entry in entries:
+            path = os.path.join(self.directory, entry.get("file", ""))
+            if entry.get("file") and os.path.isfile(path):
+                entry["size"] = os.path.getsize(path)
+                self._entries.append(entry)
+                known.add(entry["file"])
+        # Drop half-written downloads left over from a previous run
+        for name in os.listdir(self.directory):
+            if name not in (INDEX_FILE, LOCK_FILE) and name not in known:
+                self._remove_file(name)
+
+    def _claim(self):
+        # Called with self._cond held. Returns whether this process owns the directory.
+        if not self._owner and self._dir_lock.acquire(blocking=False):
+            self._owner = True
+            self._load_index()
+        return self._owner
+
+    def _release(self):
+        # Called with self._cond held; waits for running downloads to be indexed first
+        if self._owner and not self._in_flight:
+            self._entries = []
+            self._dir_lock.release()
+            self._owner = False
+
+    def _save_index(self):
+        try:
+            tmp_path = self._index_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f, indent=4)
+            os.replace(tmp_path, self._index_path())
+        except Exception as e:
+            print(f"Error saving prefetch queue: {e}")
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    # --- Public API ---
+    def configure(self, settings, enabled=True, upcoming=None):
+        """
+        Updates the settings used for new images and the queue limits.
+        If upcoming settings are given (the next playlist slot), images for
+        them are queued as well, once the current ones are, so the switch to
+        the next slot is instant. Entries for any other settings are discarded.
+        """
+        targets = [dict(settings)]
+        if upcoming is not None and settings_signature(upcoming) != settings_signature(settings):
+            targets.append(dict(upcoming))
+        signatures = [settings_signature(t) for t in targets]
+        with self._cond:
+            self.depth = max(0, int(settings.get("prefetch_depth", self.depth)))
+            self.workers = max(1, int(settings.get("prefetch_workers", self.workers)))
+            self.max_bytes = int(settings.get("prefetch_max_mb", self.max_bytes / (1024 * 1024)) * 1024 * 1024)
+            self._targets = targets
+            if enabled and not self._claim():
+                print("Prefetch paused: the queue is in use by another process")
+                enabled = False
+            self._enabled = enabled
+            stale = [e for e in self._entries if e.get("signature") not in signatures]
+            if stale:
+                for entry in stale:
+                    self._remove_file(entry["file"])
+                self._entries = [e for e in self._entries if e.get("signature") in signatures]
+                self._save_index()
+            if not enabled:
+                self._release()
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def pop(self, dest_path, settings=None):
+        """
+        Moves the oldest image queued for settings (default: the current
+        settings passed to configure) to dest_path.
+        Returns (dest_path, prompt, info), or None if there is none.
+        """
+        with self._cond:
+            if settings is None and not self._targets:
+                return None
+            if not self._claim():
+                return None
+            try:
+                signature = settings_signature(settings if settings is not None else self._targets[0])
+                while True:
+                    entry = next((e for e in self._entries if e.get("signature") == signature), None)
+                    if entry is None:
+                        return None
+                    self._entries.remove(entry)
+                    self._save_index()
+                    self._cond.notify_all()
+                    try:
+                        os.replace(os.path.join(self.directory, entry["file"]), dest_path)
+                        return dest_path, entry.get("prompt", ""), entry.get("info", {})
+                    except OSError as e:
+                        print(f"Prefetched image unusable: {e}")
+            finally:
+                if not self._enabled:
+                    self._release()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._enabled = False
+            self._release()
+            self._cond.notify_all()
+
+    def resume(self):
+        """Re-checks the throttle now, e.g. once the scheduler saw it lift."""
+        with self._cond:
+            self._cond.notify_all()
+
+    # --- Workers ---
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next_target(self):
+        """Settings of the first target that is short of images, or None."""
+        if not self._enabled:
+            return None
+        if sum(e.get("size", 0) for e in self._entries) >= self.max_bytes:
+            return None
+        for target in self._targets:
+            signature = settings_signature(target)
+            queued = sum(1 for e in self._entries if e.get("signature") == signature)
+            if queued + self._in_flight.count(signature) < self.depth:
+                return target
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._next_target() is None:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                settings = self._next_target()
+                signature = settings_signature(settings)
+                self._in_flight.append(signature)
+            # Outside the lock: reading the system state may run a helper program
+            reason = self.throttle(settings) if self.throttle is not None else None
+            if reason is not None:
+                with self._cond:
+                    self._in_flight.remove(signature)
+                    if reason != self.throttled:
+                        print(f"Prefetch deferred: {reason}")
+                    self.throttled = reason
+                    self._cond.wait()
+                continue
+            self.throttled = None
+            # No extension: the file is renamed to the wallpaper file when popped
+            name = uuid.uuid4().hex
+            path = os.path.join(self.directory, name)
+            entry = None
+            try:
+                prompt, info = self.produce(path, settings)
+                validate_image(path)
+                entry = {
+                    "file": name,
+                    "prompt": prompt,
+                    "info": info,
+                    "signature": signature,
+                    "size": os.path.getsize(path),
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+            except Exception as e:
+                print(f"Prefetch error: {e}")
+                self._remove_file(name)
+            with self._cond:
+                self._in_flight.remove(signature)
+                if entry is None:
+                    # Back off so a dead service isn't hammered by the refill loop
+                    self._failures += 1
+                    self._cond.wait(5 * 2 ** min(self._failures, 6))
+                elif signature not in [settings_signature(t) for t in self._targets]:
+                    self._remove_file(name)
+                else:
+                    self._failures = 0
+                    self._entries.append(entry)
+                    self._save_index()
+                if not self._enabled:
+                    self._release()
+
+
+class _Speculation:
+    def __init__(self, settings, path):
+        self.settings = settings
+        self.signature = settings_signature(settings)
+        self.path = path
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.result = None  # (prompt, info) once generated
+        self.bytes = 0  # Downloaded so far
+        self.listener = None  # Progress callback of a refresh waiting for this
+
+
+class Speculator:
+    """
+    Generates one wallpaper ahead of a click, for settings the user is still
+    editing in the GUI. start() begins a generation and cancels the previous
+    one if its settings differ; take() hands the image to a refresh with the
+    same settings, waiting for it if it is still downloading.
+
+    A speculation is a hit if a refresh takes it, and wasted if it is
+    cancelled or replaced first; stats() counts both, with the bytes each
+    downloaded, to tell whether speculating pays off.
+
+    Each process speculates in its own subfolder of `directory`, locked for
+    as long as the process runs; subfolders whose lock is free were left by
+    a process that has ended and are removed on startup.
+
+    :param directory: Folder for the speculative images.
+    :param produce: Function (out_path, settings, cancel_event, progress) ->
+                    (prompt, info) that generates one wallpaper to out_path.
+    """
+
+    def __init__(self, directory, produce):
+        self.produce = produce
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.used_bytes = 0
+        self.wasted_bytes = 0
+        self._current = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_orphans(directory)
+        self.directory = os.path.join(directory, uuid.uuid4().hex)
+        os.makedirs(self.directory)
+        self._owner_lock = FileLock(os.path.join(self.directory, OWNER_LOCK_FILE))
+        self._owner_lock.acquire()
+
+    @staticmethod
+    def _remove_orphans(directory):
+        # Speculations don't outlive their process; another running engine's folder stays locked
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not os.path.isdir(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not os.path.exists(os.path.join(path, OWNER_LOCK_FILE)):
+                continue  # Still being set up
+            owner_lock = FileLock(os.path.join(path, OWNER_LOCK_FILE))
+            if owner_lock.acquire(blocking=False):
+                owner_lock.release()
+                shutil.rmtree(path, ignore_errors=True)
+
+    def start(self, settings):
+        """Speculatively generates a wallpaper for settings, unless that is already under way."""
+        with self._lock:
+            current = self._current
+            if current is not None and current.signature == settings_signature(settings):
+                if not current.done.is_set() or current.result is not None:
+                    return False
+            self._discard()
+            self._current = speculation = _Speculation(dict(settings), os.path.join(self.directory, uuid.uuid4().hex))
+            self.started += 1
+        threading.Thread(target=self._run, args=(speculation,), daemon=True).start()
+        return True
+
+    def _run(self, speculation):
+        def progress(done, total):
+            speculation.bytes = max(speculation.bytes, done)
+            listener = speculation.listener
+            if listener is not None:
+                listener(done, total)
+
+        try:
+            result = self.produce(speculation.path, speculation.settings, speculation.cancel_event, progress)
+            validate_image(speculation.path)
+            speculation.result = result
+        except Exception as e:
+            if not speculation.cancel_event.is_set():
+                print(f"Speculative generation failed: {e}")
+            try:
+                os.remove(speculation.path)
+            except OSError:
+                pass
+        finally:
+            speculation.done.set()
+
+    def _discard(self):
+        # Called with the lock held
+        speculation, self._current = self._current, None
+        if speculation is None:
+            return
+        speculation.cancel_event.set()
+        self.wasted += 1
+        self.wasted_bytes += speculation.bytes
+        if speculation.done.is_set():
+            try:
+                os.remove(speculation.path)
+            except OSError:
+                pass
+        else:
+            # Removes the partial image once the cancelled generation stops
+            threading.Thread(target=self._cleanup, args=(speculation,), daemon=True).start()
+
+    @staticmethod
+    def _cleanup(speculation):
+        speculation.done.wait()
+        try:
+            os.remove(speculation.path)
+        except OSError:
+            pass
+
+    def discard(self):
+        with self._lock:
+            self._discard()
+
+    def take(self, settings, dest_path, cancel_event=None, progress=None):
+        """
+        Moves the speculative image for settings to dest_path, waiting for
+        it if needed. Returns (dest_path, prompt, info), or None if there is
+        no speculation for these settings or it failed. A speculation for
+        other settings is cancelled: the refresh asking has made it useless.
+        """
+        with self._lock:
+            speculation = self._current
+            if speculation is None:
+                return None
+            if speculation.signature != settings_signature(settings):
+                self._discard()
+                return None
+            speculation.listener = progress
+        while not speculation.done.wait(0.25):
+            if cancel_event is not None and cancel_event.is_set():
+                with self._lock:
+                    # Not a newer speculation started while we waited
+                    if self._current is speculation:
+                        self._discard()
+                return None
+        with self._lock:
+            if self._current is not speculation:
+                return None  # Replaced while we waited
+            self._current = None
+            if speculation.result is None:
+                self.wasted += 1
+                self.wasted_bytes += speculation.bytes
+                return None
+            self.hits += 1
+            self.used_bytes += speculation.bytes
+        os.replace(speculation.path, dest_path)
+        prompt, info = speculation.result
+        return dest_path, prompt, info
+
+    def stats(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "hit_rate": round(self.hits / self.started, 3) if self.started else None,
+                "used_bytes": self.used_bytes,
+                "wasted_bytes": self.wasted_bytes,
+            }
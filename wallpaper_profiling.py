@@ -0,0 +1,234 @@
+# wallpaper_profiling.py
+
+import os
+import sys
+import time
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime
+
+# Reports of each kind kept in the profiles dir; older ones are deleted
+KEEP_REPORTS = 50
+
+
+def profiling_enabled(settings):
+    """True if the AI_WALLPAPER_PROFILE environment variable or the profiling_enabled setting is set."""
+    env = os.environ.get("AI_WALLPAPER_PROFILE", "")
+    if env:
+        return env not in ("0", "false", "no")
+    return bool(settings.get("profiling_enabled", False))
+
+
+def _report_path(directory, kind, extension="txt"):
+    os.makedirs(directory, exist_ok=True)
+    names = sorted(name for name in os.listdir(directory) if name.startswith(kind + "-"))
+    for name in names[:max(0, len(names) - KEEP_REPORTS + 1)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return os.path.join(directory, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+
+def dump_thread_stacks(directory):
+    """Writes the current stack of every thread to threads-<time>.txt. Returns the path."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    path = _report_path(directory, "threads")
+    with open(path, "w", encoding="utf-8") as f:
+        for ident, frame in sys._current_frames().items():
+            f.write(f"Thread {names.get(ident, '?')} ({ident}):\n")
+            f.write("".join(traceback.format_stack(frame)))
+            f.write("\n")
+    return path
+
+
+class MemoryTracker:
+    """
+    tracemalloc snapshots every interval_minutes, each written to
+    memory-<time>.txt as the top allocation sites by growth since the
+    previous snapshot and since tracking started. tracemalloc slows
+    allocations down noticeably, so this only runs when profiling is on.
+    """
+
+    def __init__(self, directory, interval_minutes=30, top=25, frames=5):
+        self.directory = directory
+        self.interval = interval_minutes * 60
+        self.top = top
+        self.frames = frames
+        self._baseline = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._baseline = self._previous = self._take()
+        threading.Thread(target=self._run, name="memory-tracker", daemon=True).start()
+        return self
+
+    def stop(self):
+        import tracemalloc
+
+        self._stopped.set()
+        tracemalloc.stop()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"Memory snapshot failed: {e}")
+
+    @staticmethod
+    def _take():
+        import tracemalloc
+
+        # Leave out the bookkeeping of tracemalloc and the import system
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+
+    def snapshot(self):
+        """Takes a snapshot now and writes its report. Returns the report path."""
+        import tracemalloc
+
+        with self._lock:
+            snapshot = self._take()
+            current, peak = tracemalloc.get_traced_memory()
+            path = _report_path(self.directory, "memory")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"Traced memory: {current / 2 ** 20:.1f} MiB (peak {peak / 2 ** 20:.1f} MiB)\n")
+                for title, reference in (("since the previous snapshot", self._previous),
+                                         ("since tracking started", self._baseline)):
+                    f.write(f"\nTop {self.top} allocation sites by growth {title}:\n")
+                    for stat in snapshot.compare_to(reference, "lineno")[:self.top]:
+                        f.write(f"{stat}\n")
+                f.write(f"\nTop {self.top} allocation sites by size, with tracebacks:\n")
+                for stat in snapshot.statistics("traceback")[:self.top]:
+                    f.write(f"\n{stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+                    f.write("\n".join(stat.traceback.format()) + "\n")
+            self._previous = snapshot
+        return path
+
+
+class SamplingProfiler:
+    """
+    Statistical CPU profiler: samples the stack of every other thread every
+    interval seconds for a given time, then writes cpu-<time>.txt (functions
+    by samples, on top of the stack and anywhere on it) and cpu-<time>.folded
+    (one "thread;outer;...;inner count" line per stack, the input format of
+    flame graph tools). No tracing hooks, so the app runs at normal speed.
+    """
+
+    def __init__(self, directory, interval=0.005, top=40):
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        self._running = threading.Lock()
+
+    def start(self, seconds=30):
+        """Profiles for `seconds` in the background. Returns False if a run is already in progress."""
+        if not self._running.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._run, args=(seconds,), name="cpu-profiler", daemon=True).start()
+        return True
+
+    def _run(self, seconds):
+        try:
+            self.write(*self.sample(seconds))
+        except Exception as e:
+            print(f"CPU profile failed: {e}")
+        finally:
+            self._running.release()
+
+    def sample(self, seconds):
+        """Samples for `seconds`; returns (Counter of stack tuples, number of samples)."""
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[tuple(reversed(stack))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+    def write(self, stacks, samples):
+        """Writes the reports for a sample() result. Returns the path of the text report."""
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack[1:]):
+                total[function] += count
+        path = _report_path(self.directory, "cpu")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{samples} samples every {self.interval * 1000:g} ms. Every thread is counted in each\n"
+                    "sample, so percentages can add up to more than 100%, and idle threads\n"
+                    "waiting on locks or sockets show up too.\n")
+            for title, counter in (("on top of the stack", own), ("anywhere on the stack", total)):
+                f.write(f"\nTop {self.top} functions by samples {title}:\n")
+                for function, count in counter.most_common(self.top):
+                    f.write(f"{count:>8} {100 * count / max(samples, 1):6.1f}%  {function}\n")
+        with open(os.path.splitext(path)[0] + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+        return path
+
+
+class Profiler:
+    """
+    The opt-in profiling hooks of the tray process, writing into directory:
+    periodic memory snapshots from start(), and CPU profiles, thread-stack
+    dumps and extra memory snapshots on demand (the tray menu).
+    """
+
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.cpu_seconds = settings.get("profile_cpu_seconds", 30)
+        self.memory = MemoryTracker(directory, interval_minutes=settings.get("profile_memory_interval_minutes", 30),
+                                    top=settings.get("profile_memory_top", 25))
+        self.cpu = SamplingProfiler(directory, interval=settings.get("profile_cpu_interval_ms", 5) / 1000)
+        self._faulthandler_file = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.memory.start()
+        self._register_stack_signal()
+        print(f"Profiling on, reports go to {self.directory}")
+        return self
+
+    def _register_stack_signal(self):
+        # `kill -USR1 <pid>` dumps every thread's stack, even if the process is stuck holding the GIL
+        import faulthandler
+        import signal
+
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        self._faulthandler_file = open(os.path.join(self.directory, "faulthandler.txt"), "a")
+        faulthandler.register(signal.SIGUSR1, file=self._faulthandler_file, all_threads=True)
+
+    def profile_cpu(self):
+        if not self.cpu.start(self.cpu_seconds):
+            print("A CPU profile is already running")
+
+    def dump_stacks(self):
+        return dump_thread_stacks(self.directory)
+
+    def memory_snapshot(self):
+        return self.memory.snapshot()
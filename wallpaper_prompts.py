@@ -0,0 +1,312 @@
+# wallpaper_prompts.py
+
+import os
+import sys
+import json
+import atexit
+import mmap
+import random
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+
+CACHE_MAGIC = b"AIWPCAT2"
+# magic, prompts.json mtime_ns and size, category count, prompt count, length of the name block
+_HEADER = struct.Struct("<8sqqIII")
+# Layout of the persisted sampler state; state in any other layout is discarded
+SAMPLER_STATE_VERSION = 2
+
+
+class PromptCatalog:
+    """
+    All prompts in one UTF-8 buffer, grouped by category, with an array of
+    byte offsets per prompt and of first-prompt indices per category. Drawing
+    a prompt is O(1) and decodes only that prompt, and the same layout is
+    written to a binary cache that later starts map instead of parsing JSON.
+
+    :param categories: Category names, in the order their prompts are stored.
+    :param starts: array('I') of len(categories) + 1 prompt indices; category
+                   i owns prompts starts[i] to starts[i + 1] - 1.
+    :param offsets: array('I') (or memoryview) of len(prompts) + 1 byte offsets into text.
+    :param text: bytes (or a slice of a mmap) holding every prompt back to back.
+    """
+
+    def __init__(self, categories, starts, offsets, text):
+        self.categories = tuple(sys.intern(name) for name in categories)
+        self._index = {name: i for i, name in enumerate(self.categories)}
+        self._starts = starts
+        self._offsets = offsets
+        self._text = text
+        # Identifies this catalog's contents in persisted sampler state
+        self.fingerprint = f"{len(self)}:{len(text)}:{len(self.categories)}"
+        self.set_weights(None)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a catalog from the prompts.json layout: {category: [prompt, ...]}.
+        Duplicates (ignoring case) are dropped, keeping the first.
+        """
+        categories, starts, offsets = [], array("I", [0]), array("I", [0])
+        chunks, size, seen = [], 0, set()
+        for category, prompts in data.items():
+            if not isinstance(prompts, list):
+                continue
+            categories.append(category)
+            for prompt in prompts:
+                prompt = str(prompt).strip()
+                key = prompt.lower()
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                encoded = prompt.encode("utf-8")
+                chunks.append(encoded)
+                size += len(encoded)
+                offsets.append(size)
+            starts.append(len(offsets) - 1)
+        return cls(categories, starts, offsets, b"".join(chunks))
+
+    @classmethod
+    def load(cls, json_path, cache_path=None):
+        """
+        Loads json_path through the binary cache at cache_path, which is
+        rebuilt whenever json_path's modification time or size changes.
+        """
+        stat = os.stat(json_path)
+        if cache_path:
+            try:
+                return cls.read_cache(cache_path, stat.st_mtime_ns, stat.st_size)
+            except (OSError, ValueError, struct.error):
+                pass  # Missing, stale or corrupt: rebuild below
+        with open(json_path, "r", encoding="utf-8") as f:
+            catalog = cls.from_dict(json.load(f))
+        if cache_path:
+            try:
+                catalog.write_cache(cache_path, stat.st_mtime_ns, stat.st_size)
+            except OSError as e:
+                # e.g. another process still maps the old cache on Windows
+                print(f"Could not write prompt cache: {e}")
+        return catalog
+
+    def write_cache(self, path, source_mtime_ns, source_size):
+        names = "\n".join(self.categories).encode("utf-8")
+        names += b"\0" * (-len(names) % 4)  # Keep the arrays 4-byte aligned
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(CACHE_MAGIC, source_mtime_ns, source_size,
+                                 len(self.categories), len(self), len(names)))
+            f.write(names)
+            f.write(array("I", self._starts).tobytes())
+            f.write(array("I", self._offsets).tobytes())
+            f.write(self._text)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read_cache(cls, path, source_mtime_ns, source_size):
+        """Maps a cache written by write_cache; raises ValueError if it is stale."""
+        if sys.byteorder != "little" or array("I").itemsize != 4:
+            raise ValueError("cache layout needs little-endian 32-bit arrays")
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, mtime_ns, size, n_categories, n_prompts, names_len = _HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or mtime_ns != source_mtime_ns or size != source_size:
+            data.close()
+            raise ValueError("stale prompt cache")
+        view = memoryview(data)
+        pos = _HEADER.size
+        names = bytes(view[pos:pos + names_len]).rstrip(b"\0").decode("utf-8")
+        pos += names_len
+        starts = view[pos:pos + 4 * (n_categories + 1)].cast("I")
+        pos += 4 * (n_categories + 1)
+        offsets = view[pos:pos + 4 * (n_prompts + 1)].cast("I")
+        pos += 4 * (n_prompts + 1)
+        text = view[pos:]
+        if len(text) != offsets[-1]:
+            raise ValueError("truncated prompt cache")
+        return cls(names.split("\n") if n_categories else [], starts, offsets, text)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __contains__(self, category):
+        return category in self._index
+
+    def category_range(self, category):
+        """range of the prompt indices belonging to category (empty if unknown)."""
+        i = self._index.get(category)
+        if i is None:
+            return range(0)
+        return range(self._starts[i], self._starts[i + 1])
+
+    def prompt(self, index):
+        offsets = self._offsets
+        return str(self._text[offsets[index]:offsets[index + 1]], "utf-8")
+
+    def prompts(self, category):
+        return [self.prompt(i) for i in self.category_range(category)]
+
+    def set_weights(self, weights):
+        """
+        Relative weight of each category when drawing from "Random"; missing
+        categories weigh 1 and empty ones are never drawn.
+        """
+        weights = dict(weights or {})
+        self.weights = weights
+        self._weighted, self._cumulative = [], []
+        total = 0.0
+        for name in self.categories:
+            weight = float(weights.get(name, 1.0))
+            indices = self.category_range(name)
+            if weight > 0 and indices:
+                total += weight
+                self._weighted.append((name, indices))
+                self._cumulative.append(total)
+
+    def category_of(self, index):
+        """Name of the category prompt index belongs to."""
+        return self.categories[bisect_right(self._starts, index) - 1]
+
+    def random_category(self, rng=random):
+        """A category drawn by weight, or None if the catalog is empty."""
+        if not self._cumulative:
+            return None
+        return self._draw_category(rng)[0]
+
+    def _draw_category(self, rng):
+        i = bisect_right(self._cumulative, rng.random() * self._cumulative[-1])
+        return self._weighted[min(i, len(self._weighted) - 1)]
+
+    def random_prompt(self, category="Random", rng=random):
+        """A random prompt from category (or a weighted-random one), None if there is none."""
+        if category == "Random":
+            if not self._cumulative:
+                return None
+            indices = self._draw_category(rng)[1]
+        else:
+            indices = self.category_range(category)
+            if not indices:
+                return None
+        return self.prompt(indices[int(rng.random() * len(indices))])
+
+
+class PromptSampler:
+    """
+    Draws prompts without repeats. Every category has a shuffle bag, a
+    permutation of its prompts drawn in order, so no prompt comes up twice
+    until the whole category has been shown. When a bag is refilled, the
+    prompts drawn within the last `window` draws are placed at random
+    positions far enough into the new bag that they don't repeat within
+    the window across the boundary either. At most half of a bag is held
+    back like this, so the rotation stays random when the window is close
+    to the category size; the window is then honoured for half the bag.
+
+    A bag is stored as (seed, position, tail) and rebuilt from them on
+    restart. The state is written to state_path at most every save_delay
+    seconds and at exit, so restarting the app doesn't restart the rotation.
+    """
+
+    def __init__(self, state_path, window=50, save_delay=5.0):
+        self.state_path = state_path
+        self.window = window
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # category -> [seed, position, [[recent prompt, earliest position], ...]]
+        self._bags = {}
+        self._recent = []  # Most recently drawn prompt indices, newest last
+        self._permutations = {}  # category -> shuffled prompt indices, rebuilt from the seed
+        self._save_timer = None
+        self._load()
+        atexit.register(self.flush)
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("version") != SAMPLER_STATE_VERSION:
+                return
+            self._fingerprint = state["fingerprint"]
+            self._bags = {name: list(bag) for name, bag in state["bags"].items()}
+            self._recent = list(state["recent"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self):
+        state = {"version": SAMPLER_STATE_VERSION, "fingerprint": self._fingerprint, "bags": self._bags,
+                 "recent": self._recent}
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Could not save prompt rotation: {e}")
+
+    def _schedule_save(self):
+        # Called with the lock held: one write for all draws in the next save_delay seconds
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Writes the rotation state now if draws since the last write haven't been saved."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+                self._save()
+
+    def _tail(self, indices):
+        """
+        [index, earliest position] of the prompts of a category drawn in the
+        last `window` draws, newest first and at most half the category. A
+        prompt drawn n draws ago may come up from position window - n of the
+        next bag on, so it doesn't repeat within the window.
+        """
+        tail, seen = [], set()
+        for age, index in enumerate(reversed(self._recent[-self.window:] if self.window else []), 1):
+            if len(tail) >= len(indices) // 2:
+                break
+            if index in indices and index not in seen:
+                seen.add(index)
+                tail.append([index, self.window - age])
+        return tail
+
+    @staticmethod
+    def _permutation(catalog, category, seed, tail):
+        rng = random.Random(seed)
+        held_back = {index for index, _ in tail}
+        order = [i for i in catalog.category_range(category) if i not in held_back]
+        rng.shuffle(order)
+        # Least constrained first: inserting later prompts only moves earlier ones further back
+        for index, earliest in sorted(tail, key=lambda item: item[1]):
+            order.insert(rng.randint(min(earliest, len(order)), len(order)), index)
+        return order
+
+    def draw(self, catalog, category="Random", rng=random):
+        """Next prompt of category (or of a weighted-random one), None if there is none."""
+        if category == "Random":
+            category = catalog.random_category(rng)
+        if not catalog.category_range(category):
+            return None
+        with self._lock:
+            if self._fingerprint != catalog.fingerprint:
+                # The catalog changed; stored indices no longer mean the same prompts
+                self._fingerprint = catalog.fingerprint
+                self._bags, self._recent, self._permutations = {}, [], {}
+            bag = self._bags.get(category)
+            order = self._permutations.get(category)
+            indices = catalog.category_range(category)
+            if bag is None or bag[1] >= len(indices):
+                bag = self._bags[category] = [rng.getrandbits(32), 0, self._tail(indices)]
+                order = None
+            if order is None:
+                order = self._permutations[category] = self._permutation(catalog, category, bag[0], bag[2])
+            index = order[bag[1]]
+            bag[1] += 1
+            self._recent.append(index)
+            del self._recent[:-max(self.window, 1)]
+            self._schedule_save()
+        return catalog.prompt(index)
@@ -0,0 +1,178 @@
+# wallpaper_retry.py
+
+import time
+import random
+import threading
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the service while the circuit breaker is open."""
+
+
+class IncompleteDownload(Exception):
+    """The connection closed before Content-Length bytes arrived."""
+
+
+def is_retryable(error):
+    """
+    True for failures worth retrying: timeouts, dropped or refused connections,
+    truncated bodies, 429 and 5xx responses. Other 4xx responses, bad content
+    and cancellation fail straight away.
+    """
+    import requests
+
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError, IncompleteDownload))
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service. After failure_threshold consecutive
+    failures the breaker opens and every call is rejected for reset_seconds;
+    then one trial call is let through (half-open), which closes the breaker
+    on success or re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=300):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def retry_after(self):
+        """Seconds until the next call is allowed through, 0 if it is now."""
+        with self._lock:
+            if self._state() != "open":
+                return 0.0
+            return self.reset_seconds - (time.monotonic() - self._opened_at)
+
+    def before_call(self):
+        """Raises CircuitOpenError if the service shouldn't be called now."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(f"service unavailable, not retrying for {max(remaining, 0):.0f} s")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """Ends a half-open trial call that neither succeeded nor failed, e.g. was cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (self._opened_at is None and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+            self._trial_running = False
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: retry n waits a random time between
+    0 and min(max_delay, base_delay * 2**n), so clients that failed together
+    don't retry together.
+
+    :param attempts: Total tries per call, including the first.
+    :param connect_timeout: Seconds to establish a connection.
+    :param read_timeout: Seconds without receiving a byte, including the wait
+                         for the first one while the image is generated.
+    """
+
+    def __init__(self, attempts=3, base_delay=2.0, max_delay=30.0, connect_timeout=10.0, read_timeout=120.0,
+                 breaker=None):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            attempts=int(settings.get("download_attempts", 3)),
+            base_delay=float(settings.get("download_backoff_seconds", 2)),
+            connect_timeout=float(settings.get("download_connect_timeout", 10)),
+            read_timeout=float(settings.get("download_read_timeout", 120)),
+            breaker=CircuitBreaker(int(settings.get("breaker_failure_threshold", 5)),
+                                   float(settings.get("breaker_reset_seconds", 300))),
+        )
+
+    def backoff(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "retries": self.retries, "failures": self.failures,
+                    "breaker_state": self.breaker.state, "breaker_opened": self.breaker.opened,
+                    "breaker_rejected": self.breaker.rejected}
+
+    def call(self, func, cancel_event=None):
+        """
+        Runs func() until it succeeds, fails with a non-retryable error or runs
+        out of attempts. Backoff waits end early if cancel_event is set.
+        """
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.attempts):
+            self.breaker.before_call()
+            try:
+                result = func()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable:
+                    # Only service-side failures count towards opening the breaker
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release()
+                if not retryable or attempt == self.attempts - 1:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                delay = self.backoff(attempt)
+                print(f"Download attempt {attempt + 1} failed ({e}), retrying in {delay:.1f} s")
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise Exception("cancelled")
+                else:
+                    time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
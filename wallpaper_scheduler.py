@@ -0,0 +1,180 @@
+# wallpaper_scheduler.py
+
+import time
+import threading
+from datetime import datetime, timedelta
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Upper bound for one sleep, so the wall clock is re-checked after a
+# suspend/resume even if the timer didn't count the time spent asleep
+MAX_SLEEP_SECONDS = 15 * 60
+
+# After a failed refresh, retry after this many minutes, doubling with every
+# further failure, instead of waiting a whole interval
+FAILURE_RETRY_MINUTES = 2
+
+# While a due refresh is held back (idle, locked, on battery...), re-check
+# after this long, doubling the wait each time up to MAX_SLEEP_SECONDS: a
+# throttle such as running on battery can last for hours
+THROTTLE_POLL_SECONDS = 30
+
+
+def schedule_fields(settings):
+    return (
+        bool(settings.get("auto_refresh_enabled", False)),
+        settings.get("interval_minutes", 30),
+        settings.get("next_update_time"),
+        settings.get("playlists"),
+    )
+
+
+class RefreshScheduler:
+    """
+    Deadline-based refresh timer driven by next_update_time in settings.
+
+    Sleeps until the deadline in a single wait and is only woken early by a
+    relevant settings change or stop(). If one or more deadlines were missed
+    (e.g. the machine was suspended), a single refresh runs on wake-up and the
+    next deadline is counted from then. A failed refresh is retried sooner
+    than a full interval, with exponential backoff. With playlists, a refresh
+    also runs whenever the active playlist slot changes.
+
+    A due refresh is held back while throttle says so (user away, on
+    battery...); however many deadlines pass meanwhile, one refresh runs
+    when the throttle lifts.
+
+    :param store: SettingsStore to read the schedule from and write it back to.
+    :param refresh: Function (settings) -> None that applies a new wallpaper.
+    :param boundary: Optional function (settings, after) -> datetime or None
+                     giving the next playlist slot change after `after`; a
+                     refresh also runs at each of those.
+    :param throttle: Optional function (settings) -> str or None giving the
+                     reason a due refresh should wait, or None if it may run.
+    """
+
+    def __init__(self, store, refresh, boundary=None, throttle=None):
+        self.store = store
+        self.refresh = refresh
+        self.boundary = boundary
+        self.throttle = throttle
+        # Why the due refresh is currently held back, if it is
+        self.throttled = None
+        self._throttle_wait = None
+        # Slot changes up to this time have been handled
+        self._slot_checked = datetime.now()
+        self.wakeups = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.deferrals = 0
+        self._cond = threading.Condition()
+        self._fields = None
+        self._stopped = False
+        self._started = None
+
+    def wakeups_per_hour(self):
+        if self._started is None:
+            return 0.0
+        hours = max(time.monotonic() - self._started, 1) / 3600
+        return self.wakeups / hours
+
+    def stats(self):
+        return {
+            "wakeups": self.wakeups,
+            "wakeups_per_hour": round(self.wakeups_per_hour(), 2),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "deferrals": self.deferrals,
+            "throttled": self.throttled,
+        }
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _on_settings_changed(self, settings):
+        fields = schedule_fields(settings)
+        with self._cond:
+            if fields != self._fields:
+                self._fields = fields
+                self._cond.notify_all()
+
+    def next_deadline(self, settings):
+        """Wall-clock time of the next refresh, or None while disabled."""
+        enabled, _, next_time_str, _ = schedule_fields(settings)
+        if not enabled:
+            return None
+        try:
+            deadline = datetime.strptime(next_time_str, TIME_FORMAT)
+        except (TypeError, ValueError):
+            return datetime.now()
+        if self.boundary is not None:
+            slot_change = self.boundary(settings, self._slot_checked)
+            if slot_change is not None and slot_change < deadline:
+                return slot_change
+        return deadline
+
+    def run(self):
+        self._started = time.monotonic()
+        self.store.subscribe(self._on_settings_changed)
+        try:
+            while True:
+                settings = self.store.get()
+                with self._cond:
+                    if self._stopped:
+                        return
+                    self._fields = schedule_fields(settings)
+                deadline = self.next_deadline(settings)
+                reason = None
+                if deadline is None:
+                    # Playlist slots that pass while disabled don't need catching up
+                    self._slot_checked = datetime.now()
+                elif datetime.now() >= deadline:
+                    reason = self.throttle(settings) if self.throttle is not None else None
+                    if reason is None:
+                        self.throttled = None
+                        self._throttle_wait = None
+                        self._run_refresh(settings)
+                        continue
+                    if reason != self.throttled:
+                        print(f"Auto-refresh deferred: {reason}")
+                        self.deferrals += 1
+                self.throttled = reason
+                timeout = None
+                if reason is not None:
+                    timeout = THROTTLE_POLL_SECONDS
+                    if self._throttle_wait is not None:
+                        timeout = min(self._throttle_wait * 2, MAX_SLEEP_SECONDS)
+                    self._throttle_wait = timeout
+                elif deadline is not None:
+                    timeout = min((deadline - datetime.now()).total_seconds(), MAX_SLEEP_SECONDS)
+                with self._cond:
+                    if not self._stopped and self._fields == schedule_fields(settings):
+                        self._cond.wait(timeout)
+                    self.wakeups += 1
+        finally:
+            self.store.unsubscribe(self._on_settings_changed)
+
+    def _run_refresh(self, settings):
+        interval = settings.get("interval_minutes", 30)
+        delay = interval
+        self._slot_checked = datetime.now()
+        try:
+            self.refresh(settings)
+            self.refreshes += 1
+            self.failures = 0
+        except Exception as e:
+            self.failures += 1
+            delay = min(interval, FAILURE_RETRY_MINUTES * 2 ** min(self.failures - 1, 8))
+            print(f"Auto-refresh error: {e} (retrying in {delay} min)")
+        # Count from now rather than the missed deadline, so catching up after
+        # a suspend produces one refresh instead of a burst
+        next_time = (datetime.now() + timedelta(minutes=delay)).strftime(TIME_FORMAT)
+        with self._cond:
+            self._fields = schedule_fields(dict(settings, next_update_time=next_time))
+        self.store.update({"next_update_time": next_time})
@@ -0,0 +1,209 @@
+# wallpaper_settings.py
+
+import os
+import sys
+import copy
+import json
+import time
+import ctypes
+import threading
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """Exclusive lock shared between the tray and GUI processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Takes the lock; without blocking, returns False at once if another process holds it."""
+        self._file = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                self._file.seek(0)
+                # LK_LOCK retries for ~10 s before giving up
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            if blocking:
+                raise
+            return False
+        return True
+
+    def release(self):
+        try:
+            if os.name == "nt":
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SettingsStore:
+    """
+    In-memory copy of settings.json.
+
+    get() only re-parses the file when its mtime or size changed. Writes
+    hold a cross-process lock, merge into the latest on-disk state and
+    replace the file atomically, so the tray and GUI processes don't lose
+    each other's updates. Subscribers are called with the new settings
+    whenever a change is seen, whether it was made here or by the other
+    process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + ".lock")
+        self._data = {}
+        self._stamp = None
+        self._subscribers = []
+        self._watcher = None
+
+    # --- Reading ---
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        """Returns True if the in-memory settings changed."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        data = {}
+        if stamp is not None:
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"Error loading settings: {e}")
+                return False
+        self._stamp = stamp
+        if data == self._data:
+            return False
+        self._data = data
+        return True
+
+    def get(self):
+        """Returns a copy of the current settings."""
+        with self._lock:
+            changed = self._reload_if_changed()
+            data = copy.deepcopy(self._data)
+        if changed:
+            self._notify(data)
+        return data
+
+    # --- Writing ---
+    def _write(self, data):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+        self._data = data
+        self._stamp = self._file_stamp()
+
+    def update(self, changes):
+        """Merges changes into the latest settings on disk and saves them."""
+        with self._lock, self._file_lock:
+            self._reload_if_changed()
+            data = dict(self._data)
+            data.update(changes)
+            changed = data != self._data
+            if changed:
+                self._write(data)
+            data = copy.deepcopy(data)
+        if changed:
+            self._notify(data)
+        return data
+
+    def save(self, data):
+        """Replaces all settings with data."""
+        with self._lock, self._file_lock:
+            self._reload_if_changed()
+            changed = data != self._data
+            if changed:
+                self._write(copy.deepcopy(data))
+        if changed:
+            self._notify(copy.deepcopy(data))
+
+    # --- Change notification ---
+    def subscribe(self, callback):
+        """
+        Registers callback(settings) for every change and starts watching the
+        file for changes made by other processes.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _notify(self, data):
+        for callback in list(self._subscribers):
+            try:
+                callback(copy.deepcopy(data))
+            except Exception as e:
+                print(f"Settings subscriber error: {e}")
+
+    def _watch(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        for _ in _directory_changes(directory):
+            self.get()
+
+
+def _directory_changes(directory, poll_seconds=5):
+    """
+    Yields whenever something in directory may have changed. Blocks on the
+    OS change notification where available, otherwise polls.
+    """
+    if os.name == "nt":
+        kernel32 = ctypes.windll.kernel32
+        kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        # FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE
+        handle = kernel32.FindFirstChangeNotificationW(directory, False, 0x1 | 0x8 | 0x10)
+        if handle and handle != ctypes.c_void_p(-1).value:
+            handle = ctypes.c_void_p(handle)
+            while kernel32.WaitForSingleObject(handle, 0xFFFFFFFF) == 0:
+                yield
+                kernel32.FindNextChangeNotification(handle)
+    elif sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init()
+            # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if fd >= 0 and libc.inotify_add_watch(fd, directory.encode(), 0x8 | 0x80 | 0x100 | 0x200) >= 0:
+                while os.read(fd, 4096):
+                    yield
+        except (AttributeError, OSError):
+            pass
+    # Fallback: no notification API available
+    while True:
+        time.sleep(poll_seconds)
+        yield
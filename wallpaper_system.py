@@ -0,0 +1,205 @@
+# wallpaper_system.py
+
+import os
+import json
+import shutil
+import ctypes
+import subprocess
+from collections import namedtuple
+
+# None means the provider couldn't tell, which never throttles
+SystemState = namedtuple("SystemState", ["idle_seconds", "locked", "on_battery", "metered"])
+UNKNOWN = SystemState(None, None, None, None)
+
+
+class SystemStateProvider:
+    """
+    Reports whether the user is around and whether the machine can afford a
+    download: seconds since the last input, screen lock, battery and
+    metered network. The base provider knows nothing.
+    """
+
+    name = "none"
+
+    def state(self):
+        return UNKNOWN
+
+
+class WindowsStateProvider(SystemStateProvider):
+    """Idle time, lock and AC status from user32/kernel32. Metered networks aren't detected."""
+
+    name = "windows"
+
+    def state(self):
+        return SystemState(self._idle_seconds(), self._locked(), self._on_battery(), None)
+
+    @staticmethod
+    def _idle_seconds():
+        class LASTINPUTINFO(ctypes.Structure):
+            _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+        info = LASTINPUTINFO(ctypes.sizeof(LASTINPUTINFO), 0)
+        if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        # Both tick counts wrap after 49.7 days
+        return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+    @staticmethod
+    def _locked():
+        # The input desktop can't be opened while the lock screen is up
+        user32 = ctypes.windll.user32
+        desktop = user32.OpenInputDesktop(0, False, 0x0100)  # DESKTOP_SWITCHDESKTOP
+        if not desktop:
+            return True
+        user32.CloseDesktop(desktop)
+        return False
+
+    @staticmethod
+    def _on_battery():
+        class SYSTEM_POWER_STATUS(ctypes.Structure):
+            _fields_ = [("ACLineStatus", ctypes.c_ubyte), ("BatteryFlag", ctypes.c_ubyte),
+                        ("BatteryLifePercent", ctypes.c_ubyte), ("SystemStatusFlag", ctypes.c_ubyte),
+                        ("BatteryLifeTime", ctypes.c_ulong), ("BatteryFullLifeTime", ctypes.c_ulong)]
+
+        status = SYSTEM_POWER_STATUS()
+        if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)) or status.ACLineStatus == 255:
+            return None
+        return status.ACLineStatus == 0
+
+
+def _run(args):
+    try:
+        return subprocess.run(args, capture_output=True, text=True, timeout=5, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class LinuxStateProvider(SystemStateProvider):
+    """
+    Idle time from xprintidle (X11) or logind's idle hint, lock state from
+    logind, AC status from /sys/class/power_supply and metered connections
+    from NetworkManager. Whatever isn't available is reported as unknown.
+    """
+
+    name = "linux"
+
+    def __init__(self, power_supply_dir="/sys/class/power_supply"):
+        self.power_supply_dir = power_supply_dir
+        self.session = os.environ.get("XDG_SESSION_ID", "auto")
+
+    def state(self):
+        idle_hint, locked = self._logind()
+        idle_seconds = self._xprintidle()
+        if idle_seconds is None and idle_hint is not None:
+            # logind only says whether the session is idle, not for how long
+            idle_seconds = float("inf") if idle_hint else 0.0
+        return SystemState(idle_seconds, locked, self._on_battery(), self._metered())
+
+    def _logind(self):
+        if not shutil.which("loginctl"):
+            return None, None
+        output = _run(["loginctl", "show-session", self.session, "-p", "IdleHint", "-p", "LockedHint"])
+        if output is None:
+            return None, None
+        values = dict(line.split("=", 1) for line in output.splitlines() if "=" in line)
+        hints = [values.get(key) for key in ("IdleHint", "LockedHint")]
+        return tuple(None if hint is None else hint == "yes" for hint in hints)
+
+    @staticmethod
+    def _xprintidle():
+        if not os.environ.get("DISPLAY") or not shutil.which("xprintidle"):
+            return None
+        output = _run(["xprintidle"])
+        try:
+            return int(output) / 1000
+        except (TypeError, ValueError):
+            return None
+
+    def _on_battery(self):
+        try:
+            supplies = os.listdir(self.power_supply_dir)
+        except OSError:
+            return None
+        for name in supplies:
+            path = os.path.join(self.power_supply_dir, name)
+            try:
+                with open(os.path.join(path, "type")) as f:
+                    if f.read().strip() != "Mains":
+                        continue
+                with open(os.path.join(path, "online")) as f:
+                    return f.read().strip() == "0"
+            except OSError:
+                continue
+        # Desktops usually have no mains supply entry at all
+        return None
+
+    @staticmethod
+    def _metered():
+        if not shutil.which("busctl"):
+            return None
+        output = _run(["busctl", "get-property", "org.freedesktop.NetworkManager", "/org/freedesktop/NetworkManager",
+                       "org.freedesktop.NetworkManager", "Metered"])
+        try:
+            # NMMetered: 1 yes, 3 guessed yes
+            return int(output.split()[1]) in (1, 3)
+        except (AttributeError, IndexError, ValueError):
+            return None
+
+
+class FakeStateProvider(SystemStateProvider):
+    """
+    State set by hand, for tests and benchmarks. With path, the state is
+    re-read from that JSON file ({"idle_seconds": 900, "locked": true, ...})
+    on every call, so it can be changed from outside the process.
+    """
+
+    name = "fake"
+
+    def __init__(self, path=None, **state):
+        self.path = path
+        self._state = UNKNOWN._replace(**state)
+
+    def set(self, **changes):
+        self._state = self._state._replace(**changes)
+
+    def state(self):
+        if self.path:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return UNKNOWN._replace(**json.load(f))
+            except (OSError, ValueError, TypeError):
+                pass
+        return self._state
+
+
+def get_state_provider(settings, fake_path):
+    """
+    Picks the provider named by the AI_WALLPAPER_SYSTEM_STATE environment
+    variable or the system_state_provider setting, else one for this platform.
+    """
+    name = os.environ.get("AI_WALLPAPER_SYSTEM_STATE") or settings.get("system_state_provider", "auto")
+    if name == "auto":
+        name = "windows" if os.name == "nt" else "linux" if os.path.isdir("/sys") else "none"
+    if name == "windows":
+        return WindowsStateProvider()
+    if name == "linux":
+        return LinuxStateProvider()
+    if name == "fake":
+        return FakeStateProvider(fake_path)
+    if name == "none":
+        return SystemStateProvider()
+    raise Exception(f"Unknown system state provider '{name}'")
+
+
+def throttle_reason(state, settings):
+    """Why auto-refresh should wait right now, or None if it may run."""
+    idle_minutes = settings.get("pause_when_idle_minutes", 10)
+    if settings.get("pause_when_locked", True) and state.locked:
+        return "screen locked"
+    if idle_minutes and state.idle_seconds is not None and state.idle_seconds >= idle_minutes * 60:
+        return "user idle"
+    if settings.get("pause_on_battery", True) and state.on_battery:
+        return "on battery"
+    if settings.get("pause_on_metered", True) and state.metered:
+        return "metered connection"
+    return None
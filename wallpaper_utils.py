@@ -1,16 +1,30 @@
+# Keep module-level imports light: the tray icon should appear before the
+# network stack and image libraries are loaded (see benchmarks/bench_startup.py)
 import subprocess
-from PIL import Image
-import pystray
 import threading
 import sys
 import os
+import math
+import time
 import random
 import urllib.parse
-import ctypes
-import requests
-import json
 from datetime import datetime, timedelta
 
+from wallpaper_backends import get_backend
+from wallpaper_cache import ImageCache, cache_key, choose_seed, generation_params
+from wallpaper_history import HistoryStore
+from wallpaper_ipc import IpcServer
+from wallpaper_metrics import Metrics
+from wallpaper_postprocess import FORMAT_EXTENSIONS, PostProcessor, compose_spanning, split_spanning
+from wallpaper_playlists import effective_settings, next_boundary
+from wallpaper_prefetch import PrefetchQueue, Speculator
+from wallpaper_profiling import Profiler, profiling_enabled
+from wallpaper_prompts import PromptCatalog, PromptSampler
+from wallpaper_retry import IncompleteDownload, RetryPolicy
+from wallpaper_scheduler import RefreshScheduler
+from wallpaper_settings import SettingsStore
+from wallpaper_system import get_state_provider, throttle_reason
+
 # --- Resource path logic for data files ---
 def get_appdata_dir():
     # Use %APPDATA%/AI Wallpaper App for user data
@@ -37,12 +51,26 @@ def get_resource_path(filename, user_data=False):
     return os.path.join(base_path, filename)
 
 SETTINGS_FILE = "settings.json"
+PREFETCH_DIR = "prefetch"
+SPECULATIVE_DIR = "speculative"
+CACHE_DIR = "cache"
+IPC_FILE = "ipc.json"
+SINK_DIR = "sink"
+HISTORY_DIR = "history"
+PROMPTS_FILE = "prompts.json"
+PROMPT_CACHE_FILE = "prompts.cache"
+SAMPLER_FILE = "prompt_rotation.json"
+FAKE_STATE_FILE = "fake_system_state.json"
+METRICS_LOG = "metrics.jsonl"
+PROFILE_DIR = "profiles"
 
-def start_tray_icon(on_show, on_exit):
+def start_tray_icon(on_show, on_exit, extra_items=()):
     """
     Starts the system tray icon.
     :param on_show: Function to call when 'Show' is clicked.
     :param on_exit: Function to call when 'Exit' is clicked.
+    :param extra_items: (label, function) pairs added to the menu above 'Exit';
+                        the functions take no arguments.
     """
     def _on_exit(icon, item):
         on_exit()
@@ -52,10 +80,15 @@ def start_tray_icon(on_show, on_exit):
     def _on_show(icon, item):
         on_show()
 
+    import pystray
+    from PIL import Image
+
     # image = Image.new("RGB", (64, 64), (40, 40, 40))
     image = Image.open(get_resource_path("icon.ico"))
     menu = pystray.Menu(
         pystray.MenuItem("Show", _on_show),
+        # pystray calls actions that take no arguments without any
+        *[pystray.MenuItem(label, func) for label, func in extra_items],
         pystray.MenuItem("Exit", _on_exit)
     )
     tray_icon = pystray.Icon("AI Wallpaper", image, "Wallpaper AI", menu)
@@ -63,107 +96,412 @@ def start_tray_icon(on_show, on_exit):
     return tray_icon
 
 
-# wallpaper_utils.py
 
-import os
-import random
-import urllib.parse
-import ctypes
-import requests
-import json
-from datetime import datetime, timedelta
-from time import sleep
+_backend = None
 
-# --- Resource path logic for data files ---
-def get_appdata_dir():
-    # Use %APPDATA%/AI Wallpaper App for user data
-    if os.name == 'nt':
-        base = os.environ.get('APPDATA', os.path.expanduser('~'))
-    else:
-        base = os.path.expanduser('~')
-    appdata_dir = os.path.join(base, 'AI Wallpaper App')
-    if not os.path.exists(appdata_dir):
-        os.makedirs(appdata_dir, exist_ok=True)
-    return appdata_dir
+def get_wallpaper_backend():
+    """The platform backend (Windows, GNOME, feh or a headless file sink)."""
+    global _backend
+    if _backend is None:
+        _backend = get_backend(load_settings(), get_resource_path(SINK_DIR, user_data=True))
+    return _backend
 
-def get_resource_path(filename, user_data=False):
-    """
-    If user_data=True, returns path in user-writable appdata dir.
-    Otherwise, returns path to resource in install dir (for static files like icon.ico).
-    """
-    if user_data:
-        return os.path.join(get_appdata_dir(), filename)
-    if hasattr(sys, '_MEIPASS'):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(base_path, filename)
+def get_screen_resolution():
+    return get_wallpaper_backend().get_screen_resolution()
 
-SETTINGS_FILE = "settings.json"
+_state_provider = None
 
-def get_screen_resolution():
-    user32 = ctypes.windll.user32
-    user32.SetProcessDPIAware()
-    return user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+def get_system_state_provider():
+    """Idle, lock, battery and metered-network state of this machine."""
+    global _state_provider
+    if _state_provider is None:
+        _state_provider = get_state_provider(load_settings(), get_resource_path(FAKE_STATE_FILE, user_data=True))
+    return _state_provider
+
+def refresh_throttle_reason(settings):
+    """Why auto-refresh should wait right now (user away, on battery...), or None."""
+    try:
+        return throttle_reason(get_system_state_provider().state(), settings)
+    except Exception as e:
+        print(f"Could not read system state: {e}")
+        return None
+
+_metrics = None
+
+def get_metrics():
+    """Pipeline spans and counters, logged to metrics.jsonl in the appdata dir."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(get_resource_path(METRICS_LOG, user_data=True),
+                           max_bytes=int(load_settings().get("metrics_log_max_kb", 1024)) * 1024)
+    return _metrics
 
 def url_encode(text):
     return urllib.parse.quote(text)
 
-def url_builder(prompt, width, height):
-    base_prompt = f"{prompt}, style realistic, aspect ratio 16:9"
+MODEL = "flux"
+IMAGE_SERVICE_URL = "https://image.pollinations.ai"
+
+def image_service_url():
+    """
+    Base URL of the image service: the AI_WALLPAPER_IMAGE_SERVICE environment
+    variable or the image_service_url setting, e.g. a local stand-in such as
+    benchmarks/stub_server.py.
+    """
+    url = os.environ.get("AI_WALLPAPER_IMAGE_SERVICE") or load_settings().get("image_service_url") or IMAGE_SERVICE_URL
+    return url.rstrip("/")
+
+# Named in the prompt instead of an odd exact ratio, e.g. 683:384 for 1366x768
+COMMON_ASPECT_RATIOS = [(16, 9), (16, 10), (4, 3), (3, 2), (5, 4), (21, 9), (32, 9), (1, 1),
+                        (9, 16), (10, 16), (3, 4)]
+
+def aspect_ratio(width, height):
+    """width:height as text: a common ratio within 3%, else the exact reduced one."""
+    for ratio_width, ratio_height in COMMON_ASPECT_RATIOS:
+        if abs(width * ratio_height / (height * ratio_width) - 1) <= 0.03:
+            return f"{ratio_width}:{ratio_height}"
+    divisor = math.gcd(width, height)
+    return f"{width // divisor}:{height // divisor}"
+
+def url_builder(prompt, width, height, seed=None, screen_size=None):
+    """
+    :param screen_size: (width, height) of the screen the image is for, whose
+                        aspect ratio the prompt names; the request size is
+                        rounded, and a preview's even more. Defaults to it.
+    """
+    base_prompt = f"{prompt}, style realistic, aspect ratio {aspect_ratio(*(screen_size or (width, height)))}"
+    if seed is None:
+        seed = random.getrandbits(32)
     return (
-        "https://image.pollinations.ai/prompt/"
+        image_service_url() + "/prompt/"
         + url_encode(base_prompt)
         + f"?width={width}&height={height}"
-        + f"&seed={random.randint(10000,99999)}"
-        + "&model=flux&nologo=true&private=false&enhance=false&safe=true"
+        + f"&seed={seed}"
+        + f"&model={MODEL}&nologo=true&private=false&enhance=false&safe=true"
     )
 
-def download_image(url, filename="downloaded_image.jpg"):
+def seed_for(settings, prompt, when=None):
+    """Seed for prompt under the seed_policy setting (see wallpaper_cache.choose_seed)."""
+    return choose_seed(settings.get("seed_policy", "random"), prompt,
+                       fixed_seed=settings.get("seed_value", 0),
+                       slot_minutes=settings.get("seed_slot_minutes") or settings.get("interval_minutes", 30),
+                       when=when)
+
+_image_cache = None
+_http_session = None
+_download_slots = None
+_download_chunk_size = 256 * 1024
+_retry_policy = None
+# Generation key -> Event set when the download in progress for it finishes
+_in_flight = {}
+_http_lock = threading.Lock()
+
+def get_http_session():
+    """
+    Shared keep-alive session, so consecutive and concurrent downloads reuse
+    pooled connections instead of paying a new TCP + TLS handshake each time.
+    """
+    global _http_session, _download_slots, _download_chunk_size, _retry_policy
+    with _http_lock:
+        if _http_session is None:
+            # Loaded on first generation rather than at startup
+            import requests
+            settings = load_settings()
+            max_in_flight = max(1, int(settings.get("max_concurrent_downloads", 4)))
+            _download_chunk_size = max(1, int(settings.get("download_chunk_kb", 256))) * 1024
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max_in_flight)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _download_slots = threading.BoundedSemaphore(max_in_flight)
+            _retry_policy = RetryPolicy.from_settings(settings)
+            _http_session = session
+    return _http_session
+
+def get_retry_policy():
+    """Timeouts, retries and the circuit breaker shared by all downloads."""
+    get_http_session()
+    return _retry_policy
+
+def _acquire_slot(cancel_event):
+    """Waits for one of the download slots; a cancelled request leaves the queue at once."""
+    while not _download_slots.acquire(timeout=0.25):
+        if cancel_event is not None and cancel_event.is_set():
+            raise Exception("cancelled")
+
+def _get(session, url, cancel_event):
+    """
+    session.get(url, stream=True), which returns once the headers are in.
+    With a cancel_event it gives up as soon as that is set rather than when
+    the image is generated, and the abandoned response is closed on arrival.
+    """
+    if cancel_event is None:
+        return session.get(url, stream=True, timeout=_retry_policy.timeout)
+    outcome = {}
+    arrived = threading.Event()
+    lock = threading.Lock()
+
+    def _send():
+        try:
+            outcome["response"] = session.get(url, stream=True, timeout=_retry_policy.timeout)
+        except Exception as e:
+            outcome["error"] = e
+        with lock:
+            if outcome.get("abandoned") and "response" in outcome:
+                outcome["response"].close()
+            arrived.set()
+
+    threading.Thread(target=_send, daemon=True).start()
+    while not arrived.wait(0.25):
+        if cancel_event.is_set():
+            with lock:
+                if not arrived.is_set():
+                    outcome["abandoned"] = True
+                    raise Exception("cancelled")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["response"]
+
+def _fetch(session, url, tmp_path, cancel_event=None, progress=None):
+    """One download attempt of url into tmp_path."""
+    with get_metrics().span("fetch") as span:
+        queued = time.perf_counter()
+        # Cap the number of requests in flight across all callers
+        _acquire_slot(cancel_event)
+        try:
+            start = time.perf_counter()
+            # The wait for the headers is the generation time
+            with _get(session, url, cancel_event) as response:
+                first_byte = time.perf_counter()
+                span.set(queued_ms=round((start - queued) * 1000, 1), ttfb_ms=round((first_byte - start) * 1000, 1),
+                         status_code=response.status_code)
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith("image/"):
+                    raise Exception(f"unexpected content type '{content_type}'")
+                total = int(response.headers.get("Content-Length", 0)) or None
+                done = 0
+                write_seconds = 0.0
+                try:
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(_download_chunk_size):
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise Exception("cancelled")
+                            written = time.perf_counter()
+                            f.write(chunk)
+                            write_seconds += time.perf_counter() - written
+                            done += len(chunk)
+                            if progress is not None:
+                                progress(done, total)
+                finally:
+                    span.set(bytes=done, transfer_ms=round((time.perf_counter() - first_byte) * 1000, 1),
+                             write_ms=round(write_seconds * 1000, 1))
+        finally:
+            _download_slots.release()
+        if total is not None and done != total:
+            raise IncompleteDownload(f"incomplete download ({done} of {total} bytes)")
+
+def get_image_cache():
+    global _image_cache
+    if _image_cache is None:
+        max_mb = load_settings().get("cache_max_mb", 500)
+        _image_cache = ImageCache(get_resource_path(CACHE_DIR, user_data=True), max_mb * 1024 * 1024)
+    return _image_cache
+
+def download_image(url, filename="downloaded_image.jpg", cancel_event=None, progress=None, use_cache=True):
+    """
+    :param cancel_event: Optional threading.Event; setting it aborts the transfer.
+    :param progress: Optional callback (bytes_done, bytes_total or None).
+    :param use_cache: False for throwaway images (previews), which must never
+                      be served or re-applied from the cache later.
+    """
     try:
-        # Always save downloaded images to user-writable appdata dir
-        out_path = get_resource_path(filename, user_data=True)
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(out_path, "wb") as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
-        return out_path
+        with get_metrics().span("download") as span:
+            # Always save downloaded images to user-writable appdata dir
+            out_path = get_resource_path(filename, user_data=True)
+            # Identical prompt/size/seed/model combinations are served from disk
+            cache = get_image_cache()
+            key = cache_key(url)
+            session = get_http_session()
+            while True:
+                if use_cache and cache.get(key, out_path):
+                    span.set(cache="hit", bytes=os.path.getsize(out_path))
+                    get_metrics().count("download.cache_hit")
+                    return out_path
+                # Identical requests in flight at the same time share one download
+                with _http_lock:
+                    done_event = _in_flight.get(key)
+                    if done_event is None:
+                        done_event = _in_flight[key] = threading.Event()
+                        break
+                while not done_event.wait(0.5):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise Exception("cancelled")
+            # Stream into a temp file next to the target and rename it into place,
+            # so a failed download never corrupts the current wallpaper
+            tmp_path = out_path + ".part"
+            try:
+                # Timeouts, retries with backoff and the circuit breaker live in the policy
+                _retry_policy.call(lambda: _fetch(session, url, tmp_path, cancel_event, progress), cancel_event)
+                os.replace(tmp_path, out_path)
+                if use_cache:
+                    cache.put(key, out_path, prompt=generation_params(url)["prompt"])
+                span.set(cache="miss", bytes=os.path.getsize(out_path))
+                get_metrics().count("download.bytes", span.attrs["bytes"])
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                with _http_lock:
+                    del _in_flight[key]
+                done_event.set()
+            return out_path
     except Exception as e:
         raise Exception(f"Image download failed: {e}")
 
+def download_images(urls, filenames):
+    """
+    Downloads several images concurrently over the shared session, as
+    benchmarks/bench_downloads.py measures. Returns a list in the same order as urls holding either the saved path
+    or the Exception raised for that download.
+    """
+    def _download(args):
+        try:
+            return download_image(*args)
+        except Exception as e:
+            return e
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not urls:
+        return []
+    get_http_session()
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return list(pool.map(_download, zip(urls, filenames)))
+
+def reapply_cached(key):
+    """Re-applies a previously generated wallpaper from the cache, without network."""
+    settings = load_settings()
+    out_path = get_resource_path(wallpaper_filename(settings), user_data=True)
+    raw_path = os.path.splitext(out_path)[0] + ".download.jpg"
+    if not get_image_cache().get(key, raw_path):
+        raise Exception("Wallpaper is no longer cached")
+    width, height = get_screen_resolution()
+    postprocess_image(raw_path, out_path, settings, width, height)
+    set_wallpaper(out_path)
+    return out_path
+
+_history = None
+
+def get_history_store():
+    global _history
+    if _history is None:
+        settings = load_settings()
+        _history = HistoryStore(get_resource_path(HISTORY_DIR, user_data=True),
+                                max_entries=int(settings.get("history_max_entries", 200)),
+                                max_bytes=int(settings.get("history_max_mb", 1000)) * 1024 * 1024)
+    return _history
+
+def reapply_history(entry_id):
+    """Re-applies a wallpaper from the history. Purely local: no download, no post-processing."""
+    history = get_history_store()
+    entry = history.get(entry_id)
+    if entry is None or not os.path.isfile(entry["path"]):
+        raise Exception("Wallpaper is no longer in the history")
+    apply_wallpaper(entry["path"], load_settings())
+    history.touch(entry_id)
+    return entry["prompt"]
+
+def apply_fallback_wallpaper():
+    """
+    Keeps the desktop changing while the image service is unreachable by
+    re-applying a random recently cached wallpaper other than the newest.
+    The engine calls this at most once per refresh interval.
+    Returns its prompt, or None if nothing could be applied, in which case
+    the last good wallpaper simply stays.
+    """
+    entries = get_image_cache().recent(50)
+    candidates = entries[1:] or entries
+    random.shuffle(candidates)
+    for key, entry in candidates:
+        try:
+            reapply_cached(key)
+            return entry.get("prompt", "")
+        except Exception as e:
+            print(f"Fallback wallpaper failed: {e}")
+    return None
+
 def set_wallpaper(image_path):
-    image_path = os.path.abspath(image_path)
-    result = ctypes.windll.user32.SystemParametersInfoW(20, 0, image_path, 3)
-    if not result:
-        raise Exception("Failed to set wallpaper")
+    get_wallpaper_backend().set_wallpaper(image_path)
+
+def get_monitors(settings):
+    """
+    Monitors to generate for: every connected monitor when the multi_monitor
+    setting is "per_monitor" (the default) or "span", just the primary if "off".
+    """
+    monitors = get_wallpaper_backend().list_monitors()
+    if settings.get("multi_monitor", "per_monitor") == "off":
+        return monitors[:1]
+    return monitors
+
+def apply_wallpaper(image_path, settings):
+    """
+    Sets image_path as the wallpaper. In multi-monitor mode the image is the
+    composite from generate_wallpaper; it is cut back into one image per
+    monitor where the backend supports that, else applied spanning.
+    """
+    backend = get_wallpaper_backend()
+    with get_metrics().span("apply", backend=backend.name):
+        monitors = get_monitors(settings)
+        if len(monitors) < 2:
+            set_wallpaper(image_path)
+            return
+        if settings.get("multi_monitor", "per_monitor") == "per_monitor" and backend.supports_per_monitor:
+            output_format = {ext: fmt for fmt, ext in FORMAT_EXTENSIONS.items()}.get(os.path.splitext(image_path)[1], "jpeg")
+            # Next to the applied wallpaper, also when re-applying from history
+            prefix = os.path.splitext(get_resource_path(wallpaper_filename(settings), user_data=True))[0] + ".monitor"
+            paths = split_spanning(image_path, monitors, prefix, output_format)
+            # None if the monitor layout changed since the image was generated
+            if paths is not None:
+                backend.set_wallpapers(paths)
+                return
+        backend.set_spanning_wallpaper(image_path)
+
+_settings_store = None
+
+def get_settings_store():
+    """The process-wide settings store shared by the tray loop and the GUI."""
+    global _settings_store
+    if _settings_store is None:
+        _settings_store = SettingsStore(get_resource_path(SETTINGS_FILE, user_data=True))
+    return _settings_store
 
 def load_settings():
     try:
-        settings_path = get_resource_path(SETTINGS_FILE, user_data=True)
-        if os.path.exists(settings_path):
-            with open(settings_path, "r") as f:
-                return json.load(f)
+        return get_settings_store().get()
     except Exception as e:
         print(f"Error loading settings: {e}")
     return {}
 
 def save_settings(data):
     try:
-        settings_path = get_resource_path(SETTINGS_FILE, user_data=True)
-        with open(settings_path, "w") as f:
-            json.dump(data, f, indent=4)
+        get_settings_store().save(data)
+    except Exception as e:
+        print(f"Error saving settings: {e}")
+
+def update_settings(changes):
+    """Merges changes into settings.json without overwriting other fields."""
+    try:
+        return get_settings_store().update(changes)
     except Exception as e:
         print(f"Error saving settings: {e}")
+        return load_settings()
 
 def update_next_refresh_file(minutes_ahead, base_time=None):
     try:
         if base_time is None:
             base_time = datetime.now()
         next_time = base_time + timedelta(minutes=minutes_ahead)
-        settings = load_settings()
-        settings["next_update_time"] = next_time.strftime("%Y-%m-%d %H:%M:%S")
-        save_settings(settings)
+        update_settings({"next_update_time": next_time.strftime("%Y-%m-%d %H:%M:%S")})
     except:
         pass
 
@@ -174,31 +512,63 @@ def read_next_refresh_file():
     except:
         return "Not yet scheduled"
 
+_catalog = None
+_catalog_source = None
+_catalog_lock = threading.Lock()
+
 def load_prompts():
-    try:
-        with open(get_resource_path("prompts.json"), "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Failed to load prompts.json: {e}")
-        return {}
+    """
+    The shared PromptCatalog. A prompts.json imported into the appdata dir
+    replaces the bundled one. The catalog is kept for the life of the process
+    and only reloaded, through the binary cache, when the file changes.
+    """
+    global _catalog, _catalog_source
+    json_path = get_resource_path(PROMPTS_FILE, user_data=True)
+    if not os.path.exists(json_path):
+        json_path = get_resource_path(PROMPTS_FILE)
+    with _catalog_lock:
+        try:
+            stat = os.stat(json_path)
+            source = (json_path, stat.st_mtime_ns, stat.st_size)
+            if _catalog is None or source != _catalog_source:
+                _catalog = PromptCatalog.load(json_path, get_resource_path(PROMPT_CACHE_FILE, user_data=True))
+                _catalog_source = source
+        except Exception as e:
+            print(f"Failed to load {PROMPTS_FILE}: {e}")
+            if _catalog is None:
+                _catalog = PromptCatalog.from_dict({})
+        return _catalog
+
+_sampler = None
+
+def get_prompt_sampler(settings):
+    global _sampler
+    with _catalog_lock:
+        if _sampler is None:
+            _sampler = PromptSampler(get_resource_path(SAMPLER_FILE, user_data=True))
+        _sampler.window = max(0, int(settings.get("prompt_repeat_window", 50)))
+        return _sampler
 
-# --- Prompt builder logic (copied from wallpaper_gui.py) ---
-def build_prompt(settings, prompts_data):
+# --- Prompt builder logic, shared by the tray and the GUI ---
+STYLES = [
+    "Random", "neon", "synthwave", "dreamy", "fantasy", "cyberpunk", "lowpoly",
+    "oil painting", "sketch", "vaporwave", "retrofuturism", "dark fantasy", "anime-style",
+    "pixel art", "photorealistic", "watercolor", "line art", "glitchcore", "minimalist",
+    "steampunk", "gothic", "concept art", "dreamcore", "hyperrealism", "mosaic"
+]
+
+DESCRIPTORS = [
+    "Random", "dusk", "sunset", "fog", "crystals", "city", "galaxy", "alien landscape",
+    "northern lights", "celestial", "rainy streets", "underwater world", "volcanic eruption",
+    "frozen tundra", "overgrown ruins", "infinite void", "parallel universe", "bioluminescence",
+    "mystic forest", "lunar surface", "haunted valley", "utopia", "dystopia", "time-lapse sky",
+    "electric storm", "floating islands", "neon jungle", "mirror dimension", "sacred temple"
+]
+
+def build_prompt(settings, catalog):
     user_prompt = settings.get("last_prompt", "").strip()
-    styles = [
-        "Random", "neon", "synthwave", "dreamy", "fantasy", "cyberpunk", "lowpoly", 
-        "oil painting", "sketch", "vaporwave", "retrofuturism", "dark fantasy", "anime-style", 
-        "pixel art", "photorealistic", "watercolor", "line art", "glitchcore", "minimalist", 
-        "steampunk", "gothic", "concept art", "dreamcore", "hyperrealism", "mosaic"
-    ]
-
-    descriptors = [
-        "Random", "dusk", "sunset", "fog", "crystals", "city", "galaxy", "alien landscape", 
-        "northern lights", "celestial", "rainy streets", "underwater world", "volcanic eruption", 
-        "frozen tundra", "overgrown ruins", "infinite void", "parallel universe", "bioluminescence", 
-        "mystic forest", "lunar surface", "haunted valley", "utopia", "dystopia", "time-lapse sky", 
-        "electric storm", "floating islands", "neon jungle", "mirror dimension", "sacred temple"
-        ]
+    styles = STYLES
+    descriptors = DESCRIPTORS
 
     style = settings.get("selected_style", styles[0])
     if style == "Random":
@@ -211,47 +581,464 @@ def build_prompt(settings, prompts_data):
     else:
         try:
             category = settings.get("selected_category", "Random")
-            category_list = ["Random"] + sorted(list(prompts_data.keys()))
-            if category == "Random":
-                valid_categories = list(prompts_data.keys())
-                if valid_categories:
-                    category = random.choice(valid_categories)
-                else:
-                    return f"surreal nature, {desc}, {style} art"
-            prompts = prompts_data.get(category, [])
-            if prompts:
-                return random.choice(prompts)
+            if category == "Random" and not len(catalog):
+                return f"surreal nature, {desc}, {style} art"
+            weights = settings.get("category_weights") or {}
+            if weights != catalog.weights:
+                catalog.set_weights(weights)
+            prompt = get_prompt_sampler(settings).draw(catalog, category)
+            if prompt:
+                return prompt
             else:
                 return f"unknown dreamscape, {desc}, {style} art"
         except Exception as e:
             print(f"Prompt error: {e}")
             return f"surreal nature, {desc}, {style} art"
 
-def auto_refresh_loop():
-    prompts_data = load_prompts()
-    while True:
-        settings = load_settings()
-        interval = settings.get("interval_minutes", 30)
-        auto_refresh = settings.get("auto_refresh_enabled", False)
-        if auto_refresh:
+_post_processor = None
+
+def wallpaper_filename(settings):
+    """Name of the applied wallpaper file, whose extension follows the output format."""
+    if not settings.get("postprocess_enabled", True):
+        return "downloaded_image.jpg"
+    return "downloaded_image" + FORMAT_EXTENSIONS.get(settings.get("postprocess_format", "bmp"), ".bmp")
+
+def generation_size(settings, width, height):
+    """
+    Size to request from the generator. With generation_scale below 1 a
+    smaller image is requested (faster, fewer bytes) and upscaled locally.
+    """
+    scale = settings.get("generation_scale", 1.0) if settings.get("postprocess_enabled", True) else 1.0
+    scale = min(max(float(scale), 0.25), 1.0)
+    # The generator works in multiples of 8 pixels
+    return max(64, int(width * scale) // 8 * 8), max(64, int(height * scale) // 8 * 8)
+
+def postprocess_image(src_path, out_path, settings, width, height, upscaled=False):
+    """
+    Fits a downloaded image to the exact screen size in a worker process and
+    writes it to out_path. Without post-processing the file is just moved.
+    """
+    global _post_processor
+    if not settings.get("postprocess_enabled", True):
+        os.replace(src_path, out_path)
+        return
+    if _post_processor is None:
+        # Workers start on demand, so only multi-monitor generation uses more than one
+        _post_processor = PostProcessor(max_workers=min(4, os.cpu_count() or 1))
+    sharpen = settings.get("postprocess_sharpen", False)
+    if upscaled and not sharpen:
+        sharpen = settings.get("upscale_sharpen", "edge")
+    output_format = settings.get("postprocess_format", "bmp")
+    try:
+        with get_metrics().span("postprocess", format=output_format):
+            _post_processor.process(
+                src_path, out_path, width, height,
+                sharpen=sharpen,
+                output_format=output_format
+            )
+    finally:
+        os.remove(src_path)
+
+def preview_size(settings, width, height):
+    """Size of the quick low-res preview: long side progressive_preview_px, same aspect ratio."""
+    scale = min(1.0, settings.get("progressive_preview_px", 512) / max(width, height))
+    return max(64, int(width * scale) // 8 * 8), max(64, int(height * scale) // 8 * 8)
+
+def _render_preview(url, out_path, settings, width, height, on_preview, full_done):
+    """
+    Downloads the low-res generation at url and hands it, fitted to the screen,
+    to on_preview. The download is abandoned as soon as full_done is set.
+    """
+    base_path, extension = os.path.splitext(out_path)
+    with get_metrics().span("preview") as span:
+        try:
+            raw_path = download_image(url, base_path + ".preview.download.jpg", cancel_event=full_done,
+                                      use_cache=False)
+            if full_done.is_set():
+                os.remove(raw_path)
+                span.set(applied=False)
+                return
+            preview_path = base_path + ".preview" + extension
+            postprocess_image(raw_path, preview_path, settings, width, height, upscaled=True)
+            span.set(applied=on_preview(preview_path))
+        except Exception as e:
+            # The preview is a nicety; the full image decides success
+            span.set(applied=False, error=str(e))
+
+def generate_wallpaper(settings, catalog, filename=None, cancel_event=None, progress=None, info=None,
+                       on_preview=None):
+    """
+    Builds a prompt from settings, downloads a matching wallpaper and fits it
+    to the screen. Returns the prompt; the image is written to filename in the
+    appdata dir (wallpaper_filename(settings) by default).
+    :param info: Optional dict that receives seed, size and stage timings.
+    :param on_preview: Optional function (path) -> bool. A small generation of
+                       the same prompt and seed is requested alongside the full
+                       one, which finishes much sooner; if it arrives first, it
+                       is fitted to the screen and passed to on_preview, which
+                       returns whether it applied it. Single-monitor only.
+    """
+    out_path = get_resource_path(filename or wallpaper_filename(settings), user_data=True)
+    monitors = get_monitors(settings)
+    if len(monitors) > 1:
+        return generate_spanning_wallpaper(settings, catalog, monitors, out_path, cancel_event, progress, info)
+    with get_metrics().span("prompt"):
+        prompt = build_prompt(settings, catalog)
+    width, height = get_screen_resolution()
+    request_width, request_height = generation_size(settings, width, height)
+    seed = seed_for(settings, prompt)
+    url = url_builder(prompt, request_width, request_height, seed, screen_size=(width, height))
+    full_done = threading.Event()
+    if on_preview is not None and preview_size(settings, width, height)[0] < request_width:
+        preview_url = url_builder(prompt, *preview_size(settings, width, height), seed, screen_size=(width, height))
+        threading.Thread(target=get_metrics().wrap(_render_preview), daemon=True,
+                         args=(preview_url, out_path, settings, width, height, on_preview, full_done)).start()
+    start = time.perf_counter()
+    try:
+        raw_path = download_image(url, os.path.splitext(out_path)[0] + ".download.jpg",
+                                  cancel_event=cancel_event, progress=progress)
+    finally:
+        # Also when cancelled or failed: the preview download stops with the full one
+        full_done.set()
+    downloaded = time.perf_counter()
+    postprocess_image(raw_path, out_path, settings, width, height, upscaled=request_width < width)
+    if info is not None:
+        info.update(seed=int(generation_params(url)["seed"]), width=width, height=height,
+                    request_size=[request_width, request_height],
+                    download_ms=round((downloaded - start) * 1000),
+                    postprocess_ms=round((time.perf_counter() - downloaded) * 1000))
+    return prompt
+
+def generate_spanning_wallpaper(settings, catalog, monitors, out_path, cancel_event=None, progress=None, info=None):
+    """
+    One generation per monitor, all downloaded and fitted in parallel so the
+    wall-clock time stays close to that of a single image, then composited
+    into one image covering every monitor. Returns the prompts joined by " | ".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Every monitor needs an exact-size image to composite, even with post-processing off
+    part_settings = dict(settings, postprocess_enabled=True, postprocess_format="bmp")
+    with get_metrics().span("prompt", count=len(monitors)):
+        prompts = [build_prompt(settings, catalog) for _ in monitors]
+    base_path = os.path.splitext(out_path)[0]
+    received = [(0, 0)] * len(monitors)
+    seeds = [None] * len(monitors)
+    progress_lock = threading.Lock()
+
+    def _render(i):
+        monitor = monitors[i]
+
+        def _progress(done, total):
+            with progress_lock:
+                received[i] = (done, total)
+                if progress is not None:
+                    progress(sum(d for d, _ in received), sum(t for _, t in received))
+
+        request_width, request_height = generation_size(settings, monitor.width, monitor.height)
+        url = url_builder(prompts[i], request_width, request_height, seed_for(settings, prompts[i]),
+                          screen_size=(monitor.width, monitor.height))
+        seeds[i] = int(generation_params(url)["seed"])
+        raw_path = download_image(url, f"{base_path}.download{i}.jpg", cancel_event=cancel_event, progress=_progress)
+        part_path = f"{base_path}.part{i}.bmp"
+        postprocess_image(raw_path, part_path, part_settings, monitor.width, monitor.height,
+                          upscaled=request_width < monitor.width)
+        return part_path
+
+    get_http_session()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(monitors)) as pool:
+        # Per-monitor spans go into the caller's trace
+        render = get_metrics().wrap(_render)
+        futures = [pool.submit(render, i) for i in range(len(monitors))]
+    # Every render has finished here, so if one failed, the parts of the others exist and need removing too
+    rendered = time.perf_counter()
+    try:
+        part_paths = [future.result() for future in futures]
+        output_format = settings.get("postprocess_format", "bmp") if settings.get("postprocess_enabled", True) else "jpeg"
+        with get_metrics().span("compose", monitors=len(monitors)):
+            compose_spanning(part_paths, monitors, out_path, output_format)
+    finally:
+        for future in futures:
+            if future.exception() is None:
+                os.remove(future.result())
+    if info is not None:
+        info.update(seeds=seeds, width=max(m.x + m.width for m in monitors) - min(m.x for m in monitors),
+                    height=max(m.y + m.height for m in monitors) - min(m.y for m in monitors),
+                    monitors=len(monitors),
+                    render_ms=round((rendered - start) * 1000),
+                    compose_ms=round((time.perf_counter() - rendered) * 1000))
+    return " | ".join(prompts)
+
+class WallpaperEngine:
+    """
+    The one generation pipeline, prefetch queue and refresh scheduler.
+
+    The tray process owns the engine and serves it to the GUI over IPC, so
+    only one wallpaper is generated per interval no matter how many windows
+    are open. The GUI only creates its own engine when the tray isn't running.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or get_settings_store()
+        self.prefetch_queue = PrefetchQueue(
+            get_resource_path(PREFETCH_DIR, user_data=True),
+            self._produce,
+            throttle=refresh_throttle_reason
+        )
+        self.speculator = Speculator(get_resource_path(SPECULATIVE_DIR, user_data=True), self._speculate_produce)
+        self.scheduler = self._new_scheduler()
+        self.cancel_event = None
+        self._generate_lock = threading.Lock()
+        self._started = False
+        # time.monotonic() of the last wallpaper change made here
+        self._last_change = None
+
+    def _new_scheduler(self):
+        return RefreshScheduler(self.store, self._scheduled_refresh, next_boundary, self._throttle)
+
+    def _throttle(self, settings):
+        reason = refresh_throttle_reason(settings)
+        if reason is None and self.prefetch_queue.throttled is not None:
+            # Back at the machine: refill the queue now rather than at the next poll
+            self.prefetch_queue.resume()
+        return reason
+
+    @property
+    def running(self):
+        """True between start() and stop()."""
+        return self._started
+
+    @property
+    def catalog(self):
+        # Cheap after the first call; picks up an edited prompts.json
+        return load_prompts()
+
+    def categories(self):
+        return sorted(self.catalog.categories)
+
+    def start(self):
+        """Starts prefetching and the scheduled auto-refresh."""
+        if not self._started:
+            self._started = True
+            self._on_settings_changed(self.store.get())
+            self.store.subscribe(self._on_settings_changed)
+            self.scheduler.start()
+        return self
+
+    def stop(self):
+        """
+        Stops prefetching and the scheduled auto-refresh, e.g. when the GUI's
+        engine hands over to a tray process started later. start() resumes.
+        """
+        if self._started:
+            self._started = False
+            self.store.unsubscribe(self._on_settings_changed)
+            self.scheduler.stop()
+            # A stopped scheduler can't be restarted
+            self.scheduler = self._new_scheduler()
+            # With the playlist slot's settings, so the images queued for it stay
+            self._configure_prefetch(self.store.get())
+
+    def _produce(self, out_path, settings):
+        info = {}
+        with get_metrics().trace("prefetch") as trace:
+            prompt = generate_wallpaper(settings, self.catalog, out_path, info=info)
+            trace.set(prompt=prompt)
+        return prompt, info
+
+    def _speculate_produce(self, out_path, settings, cancel_event, progress):
+        info = {}
+        with get_metrics().trace("speculate") as trace:
+            prompt = generate_wallpaper(settings, self.catalog, out_path, cancel_event=cancel_event,
+                                        progress=progress, info=info)
+            trace.set(prompt=prompt)
+        return prompt, info
+
+    def speculate(self, selections):
+        """
+        Starts generating for the prompt, category, style and descriptor the
+        user is still editing, so a click on Generate with the same choices
+        finds the image ready (or already downloading). Returns whether a new
+        speculation was started.
+        """
+        settings = self.store.get()
+        if not settings.get("speculative_generation", True):
+            return False
+        # Speculation is optional spending: not on battery or a metered link
+        if refresh_throttle_reason(dict(settings, pause_when_idle_minutes=0)) is not None:
+            return False
+        allowed = ("last_prompt", "selected_category", "selected_style", "selected_descriptor")
+        settings = dict(settings, **{key: selections[key] for key in allowed if key in selections})
+        return self.speculator.start(dict(settings, last_prompt=settings.get("last_prompt", "").strip()))
+
+    def _on_settings_changed(self, settings):
+        self._configure_prefetch(settings)
+
+    def slot_settings(self, settings, when=None):
+        """settings with the playlist rule active at `when` (default now) applied."""
+        when = when or datetime.now()
+        slot = effective_settings(settings, when)
+        category = slot.get("selected_category", "Random")
+        if category != "Random" and category not in self.catalog:
+            print(f"Playlist category '{category}' is not in {PROMPTS_FILE}, using the selected one")
+            slot = dict(slot, selected_category=settings.get("selected_category", "Random"))
+        return slot
+
+    def _configure_prefetch(self, settings):
+        # Queue images for the current playlist slot and, behind them, the next one
+        now = datetime.now()
+        boundary = next_boundary(settings, now)
+        upcoming = self.slot_settings(settings, boundary) if boundary is not None else None
+        self.prefetch_queue.configure(self.slot_settings(settings, now), upcoming=upcoming,
+                                      enabled=self._started and settings.get("auto_refresh_enabled", False))
+
+    def refresh(self, settings, user_prompt="", cancel_event=None, progress=None, preview=False,
+                speculative=False):
+        """
+        Applies a new wallpaper for settings and returns its prompt. With
+        preview, a low-res version is applied first if one arrives before the
+        full image (see generate_wallpaper); if the full image then fails or is
+        cancelled, the previous wallpaper is put back. With speculative, an image
+        speculated for the same choices is used if there is one; only manual
+        refreshes pass it, so the speculation hit rate counts clicks.
+        """
+        preview_lock = threading.Lock()
+        final = []
+        previewed = []
+
+        def show_preview(path):
+            # Never let a late preview replace the full image
+            with preview_lock:
+                if final or (cancel_event is not None and cancel_event.is_set()):
+                    return False
+                apply_wallpaper(path, settings)
+                previewed.append(path)
+                return True
+
+        with self._generate_lock, get_metrics().trace("refresh") as trace:
+            image_path = get_resource_path(wallpaper_filename(settings), user_data=True)
             try:
-                prompt = build_prompt(settings, prompts_data)
-                width, height = get_screen_resolution()
-                url = url_builder(prompt, width, height)
-                image_path = download_image(url)
-                set_wallpaper(image_path)
-                update_next_refresh_file(interval)
-            except Exception as e:
-                print(f"Auto-refresh error: {e}")
-        # Sleep for interval minutes if enabled, else check every 60s
-        sleep_time = interval * 60 if auto_refresh else 60
-        for _ in range(sleep_time):
-            # Allow for quick exit if process is killed
-            threading.Event().wait(1)
+                # Apply an already-downloaded image if one was speculated or is queued, else generate now
+                popped = None
+                if speculative:
+                    popped = self.speculator.take(dict(settings, last_prompt=user_prompt.strip()), image_path,
+                                                  cancel_event, progress)
+                source = "speculative"
+                if popped is None and not user_prompt:
+                    popped = self.prefetch_queue.pop(image_path, settings)
+                    source = "prefetch"
+                if popped is not None:
+                    _, prompt, info = popped
+                else:
+                    if user_prompt:
+                        settings = dict(settings, last_prompt=user_prompt)
+                    info = {}
+                    try:
+                        prompt = generate_wallpaper(settings, self.catalog, cancel_event=cancel_event,
+                                                    progress=progress, info=info,
+                                                    on_preview=show_preview if preview else None)
+                    finally:
+                        with preview_lock:
+                            final.append(True)
+                    source = "generated"
+                trace.set(source=source, prompt=prompt)
+                if cancel_event is not None and cancel_event.is_set():
+                    raise Exception("Generation cancelled.")
+            except Exception:
+                # A cancelled or failed generation must not leave its preview on screen
+                if previewed:
+                    self._restore_previous(settings)
+                raise
+            apply_wallpaper(image_path, settings)
+            self._last_change = time.monotonic()
+            self._record_history(image_path, prompt, info, source)
+            return prompt
+
+    def _restore_previous(self, settings):
+        """Re-applies the most recently applied wallpaper in the history, e.g. over a preview."""
+        try:
+            entries = get_history_store().entries(1)
+            if entries and os.path.isfile(entries[0]["path"]):
+                apply_wallpaper(entries[0]["path"], settings)
+        except Exception as e:
+            print(f"Could not restore the previous wallpaper: {e}")
+
+    def _record_history(self, image_path, prompt, info, source):
+        try:
+            info = dict(info)
+            with get_metrics().span("history"):
+                get_history_store().record(image_path, prompt, seed=info.pop("seed", None), width=info.pop("width", None),
+                                           height=info.pop("height", None), source=source, details=info)
+        except Exception as e:
+            print(f"Could not add wallpaper to history: {e}")
+
+    def apply_history(self, entry_id):
+        """Re-applies a wallpaper from the history and returns its prompt."""
+        with self._generate_lock, get_metrics().trace("reapply", entry=entry_id):
+            prompt = reapply_history(entry_id)
+            self._last_change = time.monotonic()
+            return prompt
+
+    def _scheduled_refresh(self, settings):
+        # The playlist slot may have just changed: move the prefetch targets on first
+        self._configure_prefetch(settings)
+        try:
+            return self.refresh(self.slot_settings(settings))
+        except Exception as e:
+            # Show something from the cache instead, at most once per interval: the
+            # scheduler retries the service within minutes, and a failed retry
+            # should leave the current wallpaper alone
+            interval = settings.get("interval_minutes", 30) * 60
+            if settings.get("fallback_to_cache", True) and (
+                    self._last_change is None or time.monotonic() - self._last_change >= interval):
+                with self._generate_lock:
+                    prompt = apply_fallback_wallpaper()
+                if prompt is not None:
+                    self._last_change = time.monotonic()
+                    print(f"Refresh failed ({e}), applied cached wallpaper: {prompt}")
+            raise
+
+    def generate_now(self, user_prompt="", force_time=None, progress=None):
+        """
+        Manual refresh, e.g. from the GUI button. Restarts the auto-refresh
+        interval from force_time (or now). cancel() aborts it.
+        """
+        if self.cancel_event is not None:
+            raise Exception("Already generating, please wait...")
+        self.cancel_event = cancel_event = threading.Event()
+        try:
+            settings = self.store.get()
+            prompt = self.refresh(settings, user_prompt, cancel_event, progress,
+                                  preview=settings.get("progressive_preview", True), speculative=True)
+            update_next_refresh_file(settings.get("interval_minutes", 30), base_time=force_time or datetime.now())
+            return prompt
+        finally:
+            self.cancel_event = None
+
+    def metrics(self):
+        """
+        Counters, stage histograms and the last trace of each kind, with the
+        scheduler (wakeups per hour, deferrals), image cache, download retry
+        and speculation stats.
+        """
+        # The retry policy only exists once something was downloaded
+        downloads = _retry_policy.stats() if _retry_policy is not None else None
+        return dict(get_metrics().snapshot(), scheduler=self.scheduler.stats(), cache=get_image_cache().stats(),
+                    downloads=downloads, speculation=self.speculator.stats())
+
+    def cancel(self):
+        cancel_event = self.cancel_event
+        if cancel_event is not None:
+            cancel_event.set()
 
 
 # --- Standalone tray entry point ---
 if __name__ == "__main__":
+    import multiprocessing
+    # Post-processing workers re-launch this executable when frozen
+    multiprocessing.freeze_support()
+
     def launch_gui():
         import os
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -272,12 +1059,39 @@ if __name__ == "__main__":
     def on_show():
         launch_gui()
 
+    # Set once start_engine has run
+    services = {}
+
     def on_exit():
         import os
+        # os._exit skips atexit handlers: unpublish ipc.json and save the prompt rotation first
+        if "ipc" in services:
+            services["ipc"].stop()
+        if "engine" in services:
+            services["engine"].stop()
+        if _sampler is not None:
+            _sampler.flush()
         os._exit(0)
 
-    # Start auto-refresh in background
-    threading.Thread(target=auto_refresh_loop, daemon=True).start()
-    start_tray_icon(on_show, on_exit)
+    def start_engine():
+        # Start auto-refresh in background and let the GUI drive the same engine
+        services["engine"] = WallpaperEngine().start()
+        services["ipc"] = IpcServer(services["engine"], get_resource_path(IPC_FILE, user_data=True)).start()
+
+    def profiling_items():
+        # Opt-in: tracemalloc slows every allocation down
+        settings = load_settings()
+        if not profiling_enabled(settings):
+            return []
+        profiler = Profiler(get_resource_path(PROFILE_DIR, user_data=True), settings).start()
+        return [
+            (f"Profile CPU ({profiler.cpu_seconds} s)", profiler.profile_cpu),
+            ("Dump thread stacks", profiler.dump_stacks),
+            ("Memory snapshot", profiler.memory_snapshot),
+        ]
+
+    # Show the icon first; prompts, settings and the engine load behind it
+    start_tray_icon(on_show, on_exit, profiling_items())
+    threading.Thread(target=start_engine, daemon=True).start()
     # Keep the script running so the tray icon stays alive
     threading.Event().wait()